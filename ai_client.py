@@ -6,18 +6,52 @@ import platform
 import datetime
 import json
 import re
-from openai import OpenAI
-from config import MAX_CONTEXT_TOKENS, MODEL, FAST_MODEL, PRESENCE_PENALTY, SYSTEM_MESSAGE_FILE
+import hashlib
+import threading
+from config import (
+        MAX_CONTEXT_TOKENS,
+        MODEL,
+        FAST_MODEL,
+        PRESENCE_PENALTY,
+        REASONING_MODEL_PREFIXES,
+        SYSTEM_MESSAGE_FILE,
+        SYSTEM_MESSAGE_CACHE_FILE,
+        SYSTEM_INFO_TTL,
+        STREAM,
+        SEARCH_MAX_ROUNDS
+)
 from memory_manager import (
         get_neofetch_output,
         prune_context,
+        build_permanent_context,
         add_to_context,
         estimate_tokens
 )
+from tokenizer import count_tokens
+from stream_parser import AnswerStreamParser
+import response_cache
+import blob_store
+from request_executor import execute
+from web_search import SEARCH_TOOL, run_tool_calls, tool_call_queries
+from metrics import usage_fields, combine_usage, record_usage, query_timer, phase
+from startup_profile import span
 import time
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# The OpenAI client (and the httpx/pydantic stack behind it) is created on
+# first use so local-only subcommands never pay for importing it.
+client = None
+
+def get_client():
+    """Return the shared OpenAI client, creating it on first use."""
+    global client
+    if client is None:
+        with span("OpenAI client"):
+            from openai import OpenAI
+            # OPENAI_WEBSOCKET_BASE_URL points --fast sessions at another
+            # realtime endpoint, e.g. a local stub server.
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"),
+                            websocket_base_url=os.getenv("OPENAI_WEBSOCKET_BASE_URL"))
+    return client
 
 # JSON schema for structured outputs
 RESPONSE_SCHEMA = {
@@ -42,7 +76,7 @@ RESPONSE_SCHEMA = {
     }
 }
 
-def load_system_message():
+def render_system_message():
     """Load and format the system message from SYSTEM_MESSAGE_FILE."""
     operating_system = platform.system()
     version = platform.release()
@@ -62,7 +96,8 @@ def load_system_message():
         template = f.read().strip()
     
     # Get neofetch output
-    neofetch_info = get_neofetch_output()
+    with phase("neofetch"):
+        neofetch_info = get_neofetch_output()
 
     # Format the system message and append neofetch info.
     formatted_message = template.format(
@@ -75,89 +110,346 @@ def load_system_message():
     
     return formatted_message + "\n\n" + neofetch_info
 
-def single_query(user_prompt, reasoning_effort="medium", debug=False, model=None):
+def system_message_fingerprint():
     """
-    Send a query to the AI using the specified reasoning effort.
-    A header is printed at the beginning of each response:
-      [<model_name> - <reasoning_effort>]
-    Streaming is disabled.
+    Hash everything the rendered system message depends on besides the
+    hardware details: the template's mtime, SHELL, EDITOR and the OS release.
     """
-    # Default parameters if not provided.
-    if not reasoning_effort:
-        reasoning_effort = "medium"
-    if not model:
-        model = MODEL
-
-    system_message = load_system_message()
-    pruned_context, chat_blocks, topic_tags, oldest_block = prune_context(user_prompt)
-    
-    def estimate_tokens_local(text):
-        return len(text.split())
-    system_tokens = estimate_tokens_local(system_message)
-    context_tokens = estimate_tokens_local(pruned_context)
-    user_tokens = estimate_tokens_local(user_prompt)
-    total_context_tokens = system_tokens + context_tokens + user_tokens
-
-    # Build header
-    header_basic = f"[{model} - {reasoning_effort}]"
-    debug_header = (f"[Context Tokens: {total_context_tokens}]\n"
-                    f"  [System Message: {system_tokens}]\n"
-                    f"  [Pruned Context: {context_tokens}]\n"
-                    f"    [Chat Blocks: {chat_blocks}]\n"
-                    f"    [Topic Tags: {topic_tags}]\n"
-                    f"    [Oldest Block: {oldest_block}]\n"
-                    f"  [User Prompt: {user_tokens}]\n")
-    
-    if debug:
-        sys.stdout.write(header_basic + "\n" + debug_header)
-    else:
-        sys.stdout.write(header_basic + "\n")
-    sys.stdout.flush()
-        
-    combined_system = system_message + "\n\n" + pruned_context
-    messages = [
-        {"role": "system", "content": combined_system},
-        {"role": "user", "content": user_prompt}
+    try:
+        template_mtime = os.stat(SYSTEM_MESSAGE_FILE).st_mtime_ns
+    except OSError:
+        template_mtime = None
+    try:
+        os_release_mtime = os.stat("/etc/os-release").st_mtime_ns
+    except OSError:
+        os_release_mtime = None
+    parts = [
+        template_mtime,
+        os.getenv("SHELL", ""),
+        os.getenv("EDITOR", ""),
+        platform.system(),
+        platform.release(),
+        os_release_mtime,
     ]
-    
-    # Always disable streaming.
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        max_completion_tokens=MAX_CONTEXT_TOKENS,
-        response_format={"type": "json_schema", "json_schema": RESPONSE_SCHEMA},
-        n=1,
-        presence_penalty=PRESENCE_PENALTY,
-        stream=False,
-        store=True
-    )
-    
-    raw_content = response.choices[0].message.content
-    
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+# In-process copy of the cache entry, for long-lived processes like the daemon.
+_system_message_memo = {}
+
+def load_system_message():
+    """
+    Return the rendered system message, re-rendering it (and re-running
+    neofetch) only when the fingerprint changes or SYSTEM_INFO_TTL expires.
+    """
+    global _system_message_memo
+    fingerprint = system_message_fingerprint()
+    now = time.time()
+    memo = _system_message_memo
+    if memo.get("fingerprint") == fingerprint and now - memo.get("created", 0) < SYSTEM_INFO_TTL:
+        return memo["message"]
+    try:
+        with open(SYSTEM_MESSAGE_CACHE_FILE, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if (cached.get("fingerprint") == fingerprint
+                and now - cached.get("created", 0) < SYSTEM_INFO_TTL):
+            _system_message_memo = cached
+            return cached["message"]
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+
+    message = render_system_message()
+    cache_entry = {"fingerprint": fingerprint, "created": now, "message": message}
+    _system_message_memo = cache_entry
+    temp_file = f"{SYSTEM_MESSAGE_CACHE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(cache_entry, f)
+        os.replace(temp_file, SYSTEM_MESSAGE_CACHE_FILE)
+    except OSError:
+        pass
+    return message
+
+def parse_structured_output(raw_content):
+    """Parse a RESPONSE_SCHEMA document, treating unparsable content as the answer."""
     if raw_content is None:
         raw_content = ""
     try:
-        structured_output = json.loads(raw_content)
+        return json.loads(raw_content)
     except json.JSONDecodeError:
-        structured_output = {
+        return {
             "answer": raw_content,
             "topics": [],
             "reasoning_tokens": 0
         }
-        
-    answer_text = structured_output.get("answer", "")
-    topics = structured_output.get("topics", [])
-    reasoning_tokens_used = structured_output.get("reasoning_tokens", 0)
-    
-    if debug:
-        header2 = f"[Reasoning Tokens: {reasoning_tokens_used}]\n"
-        full_output = header2 + "\n" + answer_text
-    else:
-        full_output = answer_text
 
-    sys.stdout.write("\n" + full_output + "\n")
-    sys.stdout.flush()
-    
-    add_to_context(user_prompt, answer_text, topics, reasoning_effort)
-    return full_output
+def format_usage(usage):
+    """Format the token usage reported by the API for the debug output."""
+    if usage is None:
+        return "[API Usage: unavailable]\n"
+    fields = usage_fields(usage)
+    cached_share = fields["cached_tokens"] * 100 // fields["prompt_tokens"] if fields["prompt_tokens"] else 0
+    return (f"[API Usage: {fields['total_tokens']}]\n"
+            f"  [Prompt: {fields['prompt_tokens']}]\n"
+            f"    [Cached: {fields['cached_tokens']} ({cached_share}%)]\n"
+            f"  [Completion: {fields['completion_tokens']}]\n"
+            f"    [Reasoning: {fields['reasoning_tokens']}]\n")
+
+def build_messages(system_message, permanent_context, pruned_context, user_prompt):
+    """
+    Lay the request out so its prefix stays byte-identical across turns and
+    the provider's prompt cache can reuse it: the static system message
+    first, then the permanent memories, then the volatile context blocks,
+    then the prompt.
+    """
+    messages = [{"role": "system", "content": system_message}]
+    if permanent_context:
+        messages.append({"role": "system", "content": permanent_context})
+    if pruned_context:
+        messages.append({"role": "system", "content": pruned_context})
+    messages.append({"role": "user", "content": user_prompt})
+    return messages
+
+def completion_options(model, messages, reasoning_effort=None):
+    """
+    Return the chat completion parameters shared by every request path
+    (single queries and batch requests). reasoning_effort is only sent to
+    models that accept it (REASONING_MODEL_PREFIXES).
+    """
+    options = {
+        "model": model,
+        "messages": messages,
+        "max_completion_tokens": MAX_CONTEXT_TOKENS,
+        "response_format": {"type": "json_schema", "json_schema": RESPONSE_SCHEMA},
+        "n": 1,
+        "presence_penalty": PRESENCE_PENALTY,
+        "store": True,
+    }
+    if reasoning_effort and model.startswith(REASONING_MODEL_PREFIXES):
+        options["reasoning_effort"] = reasoning_effort
+    return options
+
+def format_phases(timer):
+    """Format the phase timings recorded so far for the debug output."""
+    return "[Phases (ms): " + ", ".join(f"{name} {ms:.0f}" for name, ms in timer.phases.items()) + "]\n"
+
+def tool_call_dict(tool_call):
+    """Convert a tool call from the API into the message dict sent back with the conversation."""
+    return {"id": tool_call.id, "type": "function",
+            "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments}}
+
+def stream_structured_output(response, out=None, tool_calls=None):
+    """
+    Write the answer field of a streamed response to out (stdout by
+    default) as it arrives.
+    Returns the fully parsed structured output once the stream ends, along
+    with the usage reported in the final chunk. Tool calls streamed by the
+    model are assembled into the tool_calls list, when one is given.
+    """
+    out = out or sys.stdout
+    parser = AnswerStreamParser()
+    usage = None
+    for chunk in response:
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        if tool_calls is not None:
+            # Each call arrives as its id and name, then its arguments in pieces.
+            for call_delta in chunk.choices[0].delta.tool_calls or []:
+                while len(tool_calls) <= call_delta.index:
+                    tool_calls.append({"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                call = tool_calls[call_delta.index]
+                call["id"] = call_delta.id or call["id"]
+                if call_delta.function is not None:
+                    call["function"]["name"] += call_delta.function.name or ""
+                    call["function"]["arguments"] += call_delta.function.arguments or ""
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        text = parser.feed(delta)
+        if text:
+            out.write(text)
+            out.flush()
+    structured_output = parser.result()
+    if parser.state == "seek" and not tool_calls:
+        # The model never produced an answer field; show whatever it sent.
+        out.write(structured_output.get("answer", ""))
+    return structured_output, usage
+
+def single_query(user_prompt, reasoning_effort="medium", debug=False, model=None, stream=None,
+                 out=None, record=True, cache=True, refresh=False, include_context=True, route=None,
+                 hedge=False, search=False):
+    """
+    Send a query to the AI using the specified reasoning effort.
+    A header is printed at the beginning of each response:
+      [<model_name> - <reasoning_effort>]
+    When streaming (config.STREAM by default), the answer is printed as it
+    is generated and the reasoning tokens follow it in debug mode.
+    Output goes to out (stdout by default). With record=False the exchange
+    is not added to the context, leaving that to the caller.
+    Responses are served from the local response cache unless cache=False;
+    refresh=True skips the lookup but still stores the new response.
+    include_context=False leaves out the chat history (permanent memories
+    are still sent), for self-contained requests such as map-reduce parts.
+    route labels a query whose model and effort were picked by the router;
+    it is shown in the header and kept in the context block.
+    Requests time out, are retried with backoff and, with hedge=True, are
+    hedged (see request_executor); the model that answered is the one
+    recorded.
+    search=True offers the model a web_search tool (see web_search); its
+    searches run between requests for up to SEARCH_MAX_ROUNDS rounds, and
+    the response cache is not used since the answer depends on the results.
+
+    Returns a dict with the printed output, the structured answer fields,
+    the model and the reasoning effort used.
+    """
+    # Default parameters if not provided.
+    if not reasoning_effort:
+        reasoning_effort = "medium"
+    if not model:
+        model = MODEL
+    if stream is None:
+        stream = STREAM
+    out = out or sys.stdout
+    if search:
+        cache = False
+
+    with query_timer() as timer:
+        with phase("system_message"):
+            system_message = load_system_message()
+        # Blobs referenced by both the context and the prompt are sent once.
+        sent_blobs = set()
+        with phase("prune_context"):
+            permanent_context, permanent_tokens = build_permanent_context()
+            if include_context:
+                pruned_context, chat_blocks, topic_tags, oldest_block, context_tokens = prune_context(
+                    user_prompt, include_permanent=False, sent_blobs=sent_blobs)
+            else:
+                pruned_context, chat_blocks, topic_tags, oldest_block, context_tokens = "", 0, "", None, 0
+        prompt_text = blob_store.expand(user_prompt, sent_blobs)
+
+        system_tokens = count_tokens(system_message)
+        user_tokens = count_tokens(prompt_text)
+        total_context_tokens = system_tokens + permanent_tokens + context_tokens + user_tokens
+
+        # Build header
+        header_basic = f"[{model} - {reasoning_effort}, {route}]" if route else f"[{model} - {reasoning_effort}]"
+        debug_header = (f"[Context Tokens: {total_context_tokens}]\n"
+                        f"  [System Message: {system_tokens}]\n"
+                        f"  [Permanent Memories: {permanent_tokens}]\n"
+                        f"  [Pruned Context: {context_tokens}]\n"
+                        f"    [Chat Blocks: {chat_blocks}]\n"
+                        f"    [Topic Tags: {topic_tags}]\n"
+                        f"    [Oldest Block: {oldest_block}]\n"
+                        f"  [User Prompt: {user_tokens}]\n")
+
+        if debug:
+            out.write(header_basic + "\n" + debug_header)
+        else:
+            out.write(header_basic + "\n")
+        out.flush()
 
+        messages = build_messages(system_message, permanent_context, pruned_context, prompt_text)
+
+        cache_key = None
+        cached_output = None
+        if cache:
+            with phase("cache_lookup"):
+                cache_key = response_cache.cache_key(model, reasoning_effort, messages, user_prompt, RESPONSE_SCHEMA)
+                if not refresh:
+                    cached_output = response_cache.lookup(cache_key)
+
+        if cached_output is not None:
+            structured_output = cached_output
+            usage = None
+            if stream:
+                out.write("\n" + structured_output.get("answer", ""))
+        else:
+            request_options = {}
+            if stream:
+                # Ask for a final chunk carrying the token usage.
+                request_options["stream_options"] = {"include_usage": True}
+            if search:
+                request_options["tools"] = [SEARCH_TOOL]
+            client = get_client()
+            if stream:
+                out.write("\n")
+                out.flush()
+            usages = []
+            for search_round in range(SEARCH_MAX_ROUNDS + 1):
+                if search and search_round == SEARCH_MAX_ROUNDS:
+                    # Out of rounds: the model has to answer with what it has.
+                    request_options["tool_choice"] = "none"
+                with phase("request_send"):
+                    response, model = execute(
+                        client,
+                        dict(completion_options(model, messages, reasoning_effort), stream=stream, **request_options),
+                        hedge=hedge
+                    )
+
+                tool_calls = []
+                if stream:
+                    with phase("generation"):
+                        structured_output, usage = stream_structured_output(
+                            response, out, tool_calls if search else None)
+                else:
+                    with phase("parse"):
+                        message = response.choices[0].message
+                        structured_output = parse_structured_output(message.content)
+                        tool_calls = [tool_call_dict(tool_call) for tool_call in message.tool_calls or []]
+                    usage = response.usage
+                usages.append(usage)
+                if not tool_calls:
+                    break
+                out.write(f"[web search: {'; '.join(tool_call_queries(tool_calls))}]\n")
+                out.flush()
+                with phase("web_search"):
+                    results = run_tool_calls(tool_calls)
+                messages = messages + [{"role": "assistant", "content": None, "tool_calls": tool_calls}] + results
+            usage = combine_usage(usages)
+            if cache:
+                with phase("cache_store"):
+                    response_cache.store(cache_key, structured_output)
+
+        answer_text = structured_output.get("answer", "")
+        topics = structured_output.get("topics", [])
+        reasoning_tokens_used = structured_output.get("reasoning_tokens", 0)
+
+        if cache:
+            hits, misses = response_cache.stats()
+            outcome = "hit" if cached_output is not None else "miss"
+            cache_status = f"[Response Cache: {outcome} (hits {hits} / misses {misses})]\n"
+        else:
+            outcome = None
+            cache_status = "[Response Cache: disabled]\n"
+        debug_footer = (f"[Reasoning Tokens: {reasoning_tokens_used}]\n" + format_usage(usage)
+                        + cache_status + format_phases(timer))
+
+        if stream:
+            full_output = answer_text
+            if debug:
+                out.write("\n\n" + debug_footer)
+            else:
+                out.write("\n")
+        else:
+            if debug:
+                header2 = debug_footer
+                full_output = header2 + "\n" + answer_text
+            else:
+                full_output = answer_text
+            out.write("\n" + full_output + "\n")
+        out.flush()
+
+        if record:
+            with phase("add_to_context"):
+                add_to_context(user_prompt, answer_text, topics, reasoning_effort, model=model, route=route)
+        timer.add("total", timer.since_start())
+        record_usage(model, reasoning_effort, usage, phases=timer.phases, cache=outcome, route=route)
+    return {
+        "output": full_output,
+        "answer": answer_text,
+        "topics": topics,
+        "reasoning_tokens": reasoning_tokens_used,
+        "model": model,
+        "reasoning_effort": reasoning_effort
+    }
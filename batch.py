@@ -0,0 +1,217 @@
+# batch.py
+
+import os
+import json
+import time
+import asyncio
+from config import (
+        MODEL,
+        BATCH_MAX_CONCURRENCY,
+        BATCH_REQUESTS_PER_MINUTE,
+        BATCH_MAX_RETRIES
+)
+
+# Endpoint used for provider batch files.
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+def read_batch_file(path):
+    """
+    Read prompt records from a JSONL file. Each line is an object with a
+    "prompt" and optional "id", "model" and "reasoning_effort" (or
+    "effort") fields; records without an id get their line number.
+    Blank lines are skipped.
+    """
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})")
+            if not isinstance(record, dict) or not isinstance(record.get("prompt"), str):
+                raise ValueError(f"{path}:{line_number}: expected an object with a \"prompt\" string")
+            records.append({
+                "id": record.get("id", line_number),
+                "prompt": record["prompt"],
+                "model": record.get("model") or MODEL,
+                "reasoning_effort": record.get("reasoning_effort") or record.get("effort") or "medium",
+            })
+    return records
+
+def default_output_path(path):
+    """Return "<input without extension>.results.jsonl"."""
+    return os.path.splitext(path)[0] + ".results.jsonl"
+
+def build_batch_messages(prompt):
+    """
+    Messages for one batch prompt: the system message and permanent
+    memories, without chat history, so each record stands on its own.
+    """
+    from ai_client import load_system_message, build_messages
+    from memory_manager import build_permanent_context
+
+    permanent_context, _ = build_permanent_context()
+    return build_messages(load_system_message(), permanent_context, "", prompt)
+
+class RateLimiter:
+    """Space request starts so no more than requests_per_minute begin per minute."""
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_start - now
+            self.next_start = max(now, self.next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+async def _run_record(client, record, semaphore, limiter, cache):
+    """Run one record with retries and return its result line."""
+    import openai
+    import response_cache
+    from ai_client import completion_options, parse_structured_output, RESPONSE_SCHEMA
+    from metrics import usage_fields, record_usage
+    from request_executor import backoff_delay
+
+    retryable = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+                 openai.InternalServerError)
+    result = {"id": record["id"], "model": record["model"], "reasoning_effort": record["reasoning_effort"]}
+    messages = build_batch_messages(record["prompt"])
+    key = None
+    if cache:
+        key = response_cache.cache_key(record["model"], record["reasoning_effort"], messages,
+                                       record["prompt"], RESPONSE_SCHEMA)
+        cached_output = response_cache.lookup(key)
+        if cached_output is not None:
+            result.update(answer=cached_output.get("answer", ""), topics=cached_output.get("topics", []),
+                          cached=True)
+            return result
+
+    async with semaphore:
+        for attempt in range(BATCH_MAX_RETRIES + 1):
+            await limiter.wait()
+            try:
+                response = await client.chat.completions.create(
+                    **completion_options(record["model"], messages, record["reasoning_effort"]))
+                break
+            except retryable as e:
+                delay = backoff_delay(attempt, e)
+                if attempt == BATCH_MAX_RETRIES or delay is None:
+                    result["error"] = str(e)
+                    return result
+                await asyncio.sleep(delay)
+            except openai.OpenAIError as e:
+                result["error"] = str(e)
+                return result
+
+    structured_output = parse_structured_output(response.choices[0].message.content)
+    record_usage(record["model"], record["reasoning_effort"], response.usage)
+    if cache:
+        response_cache.store(key, structured_output)
+    result.update(answer=structured_output.get("answer", ""), topics=structured_output.get("topics", []),
+                  usage=usage_fields(response.usage))
+    return result
+
+async def _run_batch(records, output_path, concurrency, requests_per_minute, cache):
+    from openai import AsyncOpenAI
+
+    # Retries are ours, so the client does not add its own on top.
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(requests_per_minute)
+    tasks = [asyncio.ensure_future(_run_record(client, record, semaphore, limiter, cache))
+             for record in records]
+    failed = 0
+    try:
+        with open(output_path, "w", encoding="utf-8") as out:
+            for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+                result = await task
+                failed += "error" in result
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                print(f"\r[batch: {done}/{len(records)} done, {failed} failed]", end="", flush=True)
+        print()
+    finally:
+        await client.close()
+    return failed
+
+def run_batch(path, output_path=None, concurrency=BATCH_MAX_CONCURRENCY,
+              requests_per_minute=BATCH_REQUESTS_PER_MINUTE, cache=True):
+    """
+    Run every record of a JSONL prompt file concurrently (at most
+    concurrency requests in flight, at most requests_per_minute started per
+    minute, retrying transient errors). Result lines are written to
+    output_path in completion order, each carrying its record's id.
+    Batch results are not added to the context.
+
+    Returns (output_path, number of records, number failed).
+    """
+    records = read_batch_file(path)
+    output_path = output_path or default_output_path(path)
+    failed = asyncio.run(_run_batch(records, output_path, concurrency, requests_per_minute, cache))
+    return output_path, len(records), failed
+
+def export_provider_batch(path, export_path):
+    """
+    Write the records as a provider batch file: one request per line with
+    custom_id, method, url and body. Returns the number of requests.
+    """
+    from ai_client import completion_options
+
+    records = read_batch_file(path)
+    with open(export_path, "w", encoding="utf-8") as out:
+        for record in records:
+            body = completion_options(record["model"], build_batch_messages(record["prompt"]),
+                                      record["reasoning_effort"])
+            out.write(json.dumps({"custom_id": str(record["id"]), "method": "POST",
+                                  "url": BATCH_ENDPOINT, "body": body}) + "\n")
+    return len(records)
+
+def submit_provider_batch(export_path):
+    """Upload a provider batch file and start the batch. Returns its batch id."""
+    from ai_client import get_client
+
+    client = get_client()
+    with open(export_path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT,
+                                  completion_window="24h")
+    return batch.id
+
+def collect_provider_batch(batch_id, output_path):
+    """
+    Fetch a submitted batch. When it has completed, write its results to
+    output_path in the same format as run_batch. Returns the batch status.
+    """
+    from ai_client import get_client, parse_structured_output
+
+    client = get_client()
+    batch = client.batches.retrieve(batch_id)
+    if batch.status != "completed":
+        return batch.status
+    lines = []
+    for file_id in (batch.output_file_id, getattr(batch, "error_file_id", None)):
+        if file_id:
+            lines.extend(client.files.content(file_id).text.splitlines())
+    with open(output_path, "w", encoding="utf-8") as out:
+        for line in lines:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            result = {"id": item["custom_id"]}
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                result["error"] = json.dumps(item.get("error") or response.get("body"))
+            else:
+                body = response["body"]
+                structured_output = parse_structured_output(body["choices"][0]["message"]["content"])
+                result.update(model=body.get("model"), answer=structured_output.get("answer", ""),
+                              topics=structured_output.get("topics", []), usage=body.get("usage"))
+            out.write(json.dumps(result) + "\n")
+    return batch.status
@@ -0,0 +1,267 @@
+# benchmark.py
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import datetime
+import tempfile
+import statistics
+import subprocess
+from config import CONTEXT_FILE, PERMANENT_MEMORY_FILE, SYSTEM_MESSAGE_FILE, DELIMITER
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+DEFAULT_MEMORIES = 1_000
+DEFAULT_RUNS = 10
+DEFAULT_STARTUP_RUNS = 5
+# A median this many times the baseline's is reported as a regression.
+DEFAULT_THRESHOLD = 1.25
+
+TOPICS = ["linux", "bash", "git", "python", "docker", "networking", "ssh", "vim", "systemd",
+          "postgres", "c", "rust", "kubernetes", "nginx", "tar", "awk", "sed", "make", "gcc", "zsh"]
+ACTIONS = ["How do I", "What is the fastest way to", "Why does it fail when I", "Can you explain how to",
+           "What flag lets me", "Show me how to"]
+TASKS = ["list open ports", "rebase a branch", "find large files", "extract an archive",
+         "restart a service", "profile a script", "compile with debug symbols", "rotate logs",
+         "follow a log file", "copy files over ssh", "undo the last commit", "replace text in files"]
+WORDS = ("use the option to run the command with sudo and check the output before you pipe it into "
+         "another tool then inspect the exit status and the log for errors").split()
+
+def synthetic_block(rng, timestamp):
+    """Return one context block in the format add_to_context writes."""
+    topics = rng.sample(TOPICS, 3)
+    prompt = f"{rng.choice(ACTIONS)} {rng.choice(TASKS)} with {topics[-1]}?"
+    answer = " ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 40))).capitalize() + "."
+    return (f"[{timestamp}]\n>>> {prompt}\n[gpt-5 - medium] {answer}\n"
+            f"Topic Tags: {', '.join(topics)}")
+
+def generate_history(directory, blocks, memories=DEFAULT_MEMORIES, seed=0):
+    """
+    Write a synthetic CONTEXT_FILE of blocks exchanges and a
+    PERMANENT_MEMORY_FILE of memories entries into directory. Timestamps
+    are spread over the current retention period, so nothing is rotated
+    while the benchmarks run.
+    """
+    from retention import period_label, period_start
+    from tokenizer import count_tokens
+
+    rng = random.Random(seed)
+    now = datetime.datetime.now().replace(microsecond=0)
+    start = period_start(period_label(now))
+    step = (now - start).total_seconds() / max(blocks, 1)
+    with open(os.path.join(directory, CONTEXT_FILE), "w", encoding="utf-8") as f:
+        for index in range(blocks):
+            timestamp = (start + datetime.timedelta(seconds=index * step)).strftime("%Y-%m-%d %H:%M:%S")
+            f.write(synthetic_block(rng, timestamp) + DELIMITER)
+
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    entries = [{"name": "Benchmark User"}, {"topics_of_interest": ", ".join(TOPICS[:5])}]
+    entries += [{f"fact_{index}": f"I {rng.choice(ACTIONS).lower()} {rng.choice(TASKS)} every week."}
+                for index in range(max(memories - len(entries), 0))]
+    snapshot = []
+    for mem_id, data in enumerate(entries, 1):
+        entry = {"id": mem_id, "timestamp": timestamp, **data}
+        text = "; ".join(f"{k}: {v}" for k, v in data.items())
+        entry["tokens"] = count_tokens(f"[{timestamp}] (PERMANENT) {text}")
+        snapshot.append(entry)
+    with open(os.path.join(directory, PERMANENT_MEMORY_FILE), "w", encoding="utf-8") as f:
+        json.dump({"next_id": len(snapshot) + 1, "memories": snapshot}, f, indent=2)
+
+def time_calls(function, runs):
+    """Call function runs times and return the durations in seconds."""
+    samples = []
+    for run in range(runs):
+        start = time.perf_counter()
+        function(run)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def summarize(name, size, samples):
+    """Reduce a benchmark's durations to one result record (milliseconds)."""
+    ms = sorted(sample * 1000 for sample in samples)
+    return {
+        "benchmark": name,
+        "size": size,
+        "runs": len(ms),
+        "min_ms": round(ms[0], 3),
+        "median_ms": round(statistics.median(ms), 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+def run_local_benchmarks(size, runs):
+    """Time the context and memory functions against the history in the working directory."""
+    from memory_manager import (load_context_blocks, prune_context, add_to_context,
+                                add_permanent_memory, forget_permanent_memory)
+
+    results = []
+    # The first read builds the context index from scratch.
+    results.append(summarize("index_build", size, time_calls(lambda run: load_context_blocks(), 1)))
+    results.append(summarize("load_context_blocks", size,
+                             time_calls(lambda run: load_context_blocks(), runs)))
+    prompts = [f"{ACTIONS[run % len(ACTIONS)]} {TASKS[run % len(TASKS)]} with {TOPICS[run % len(TOPICS)]}?"
+               for run in range(runs)]
+    results.append(summarize("prune_context", size,
+                             time_calls(lambda run: prune_context(prompts[run]), runs)))
+    results.append(summarize("add_to_context", size, time_calls(
+        lambda run: add_to_context(prompts[run], "Benchmark answer.", ["benchmark"]), runs)))
+    added = []
+    results.append(summarize("add_permanent_memory", size, time_calls(
+        lambda run: added.append(add_permanent_memory({f"bench_{run}": "A benchmark memory."})), runs)))
+    results.append(summarize("forget_permanent_memory", size, time_calls(
+        lambda run: forget_permanent_memory(added[run]["id"]), runs)))
+    return results
+
+def run_query_benchmarks(size, runs, latency, chunk_delay):
+    """
+    Time single_query end to end against a mock server, streamed and not.
+    Returns no results when the openai package is not installed.
+    """
+    try:
+        import openai  # noqa: F401
+    except ImportError:
+        print("openai is not installed; skipping the single_query benchmarks.", file=sys.stderr)
+        return []
+    from mock_server import start_mock_server
+    import ai_client
+
+    server, base_url = start_mock_server(latency=latency, chunk_delay=chunk_delay)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    ai_client.client = None
+    results = []
+    try:
+        # Warm up: creates the client and renders the system message.
+        ai_client.single_query("warm up", stream=False, out=io.StringIO(), cache=False)
+        for name, stream in (("single_query", False), ("single_query_stream", True)):
+            results.append(summarize(name, size, time_calls(
+                lambda run: ai_client.single_query(f"Benchmark question {run}?", stream=stream,
+                                                   out=io.StringIO(), cache=False), runs)))
+    finally:
+        server.shutdown()
+    return results
+
+def time_cli_startup(directory, size, runs):
+    """Time cold `cligpt.py view-memory` processes in directory."""
+    command = [sys.executable, os.path.join(REPO_DIR, "cligpt.py"), "view-memory"]
+    return summarize("cli_startup", size, time_calls(
+        lambda run: subprocess.run(command, cwd=directory, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True),
+        runs))
+
+def run_size(size, args):
+    """
+    Benchmark one history size in a scratch directory. The in-process
+    benchmarks run in a child process started in that directory, since the
+    store modules keep per-process connections and caches keyed by path.
+    """
+    directory = tempfile.mkdtemp(prefix=f"cligpt-bench-{size}-")
+    try:
+        print(f"Generating {size} blocks...", file=sys.stderr)
+        generate_history(directory, size, args.memories, args.seed)
+        shutil.copy(os.path.join(REPO_DIR, SYSTEM_MESSAGE_FILE), directory)
+        print(f"Benchmarking {size} blocks...", file=sys.stderr)
+        command = [sys.executable, os.path.abspath(__file__), "--worker", str(size),
+                   "--runs", str(args.runs), "--latency", str(args.latency),
+                   "--chunk-delay", str(args.chunk_delay)]
+        if args.no_query:
+            command.append("--no-query")
+        worker = subprocess.run(command, cwd=directory, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, text=True, check=True)
+        results = json.loads(worker.stdout)
+        results.append(time_cli_startup(directory, size, args.startup_runs))
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report, baseline, threshold):
+    """
+    Print each benchmark's median against the baseline report and return
+    the (benchmark, size) pairs that slowed down by more than threshold.
+    """
+    previous = {(r["benchmark"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"{'benchmark':<26}{'size':>10}{'baseline ms':>14}{'median ms':>12}{'ratio':>8}")
+    for result in report["results"]:
+        key = (result["benchmark"], result["size"])
+        if key not in previous or not previous[key]["median_ms"]:
+            continue
+        ratio = result["median_ms"] / previous[key]["median_ms"]
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{key[0]:<26}{key[1]:>10}{previous[key]['median_ms']:>14.2f}"
+              f"{result['median_ms']:>12.2f}{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cligpt against synthetic histories.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated numbers of context blocks (default 1000,100000,1000000)")
+    parser.add_argument("--memories", type=int, default=DEFAULT_MEMORIES,
+                        help=f"Permanent memories in each history (default {DEFAULT_MEMORIES})")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS,
+                        help=f"Timed runs per benchmark (default {DEFAULT_RUNS})")
+    parser.add_argument("--startup-runs", type=int, default=DEFAULT_STARTUP_RUNS,
+                        help=f"Timed cold CLI starts per size (default {DEFAULT_STARTUP_RUNS})")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Mock server delay before each response, in seconds")
+    parser.add_argument("--chunk-delay", type=float, default=0.0,
+                        help="Mock server delay between streamed chunks, in seconds")
+    parser.add_argument("--no-query", action="store_true", help="Skip the single_query benchmarks")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic histories")
+    parser.add_argument("-o", "--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="Compare against an earlier JSON report; exits 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Median ratio counted as a regression (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        results = run_local_benchmarks(args.worker, args.runs)
+        if not args.no_query:
+            results += run_query_benchmarks(args.worker, args.runs, args.latency, args.chunk_delay)
+        print(json.dumps(results))
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    report = {
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"sizes": sizes, "memories": args.memories, "runs": args.runs,
+                     "latency": args.latency, "chunk_delay": args.chunk_delay},
+        "results": [],
+    }
+    for size in sizes:
+        report["results"] += run_size(size, args)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    elif not args.compare:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
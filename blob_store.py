@@ -0,0 +1,86 @@
+# blob_store.py
+
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from config import BLOB_DIR, BLOB_MIN_TOKENS
+from tokenizer import count_tokens
+
+# A stored output as it appears in prompts and context blocks: the first 16
+# hex digits of its SHA-256 and its token count, so the context can be
+# budgeted without opening the blob.
+REF_PATTERN = re.compile(r"\[\[blob:([0-9a-f]{16}):(\d+)\]\]")
+
+# Blob contents recently read, for long-lived processes such as the daemon.
+BLOB_CACHE_ENTRIES = 32
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def blob_path(blob_id):
+    return os.path.join(BLOB_DIR, blob_id + ".txt")
+
+def put(text):
+    """Store text under its hash, once, and return its blob id."""
+    blob_id = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    path = blob_path(blob_id)
+    if not os.path.exists(path):
+        os.makedirs(BLOB_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    return blob_id
+
+def get(blob_id):
+    """Return the stored text of blob_id, or None if it is missing."""
+    with _cache_lock:
+        if blob_id in _cache:
+            _cache.move_to_end(blob_id)
+            return _cache[blob_id]
+    try:
+        with open(blob_path(blob_id), "r", encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    with _cache_lock:
+        _cache[blob_id] = text
+        while len(_cache) > BLOB_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return text
+
+def reference(text):
+    """
+    Return text unchanged when it is shorter than BLOB_MIN_TOKENS, otherwise
+    store it and return a reference to it.
+    """
+    tokens = count_tokens(text)
+    if tokens < BLOB_MIN_TOKENS:
+        return text
+    return f"[[blob:{put(text)}:{tokens}]]"
+
+def referenced_tokens(text):
+    """Return the tokens of the distinct blobs referenced in text."""
+    return sum(int(tokens) for tokens in dict(REF_PATTERN.findall(text)).values())
+
+def expand(text, sent):
+    """
+    Replace the blob references in text with their contents for the model.
+    Blobs whose ids are in sent were already included earlier in the same
+    request and are only pointed back to; the rest are added to sent.
+    """
+    def render(match):
+        blob_id = match.group(1)
+        label = blob_id[:8]
+        if blob_id in sent:
+            return f"[output {label}: same as shown above]"
+        sent.add(blob_id)
+        content = get(blob_id)
+        if content is None:
+            return f"[output {label}: no longer available]"
+        return f"[output {label}]\n{content}\n[end of output {label}]"
+
+    if "[[blob:" not in text:
+        return text
+    return REF_PATTERN.sub(render, text)
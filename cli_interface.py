@@ -1,17 +1,52 @@
+import os
 import sys
-import re
-import subprocess
 import argparse
-from ai_client import single_query
-from config import MODEL
+from config import (MODEL, FAST_MODEL, DELIMITER, BATCH_MAX_CONCURRENCY, BATCH_REQUESTS_PER_MINUTE,
+                    DIGEST_MAX_PER_RUN)
+from startup_profile import span
+from command_substitution import process_command_substitutions
 from memory_manager import (
         ensure_required_permanent_memories, 
         add_permanent_memory, 
         view_permanent_memory, 
         forget_permanent_memory, 
         export_permanent_memory,
+        tail_context,
+        repeat_response,
+        grep_context,
 )
 
+def caller_path(path):
+    """
+    Resolve a path given on the command line against the directory gpt was
+    run from. The gpt wrapper changes to $GPT_HOME and passes the caller's
+    directory in GPT_CALLER_CWD.
+    """
+    return os.path.join(os.getenv("GPT_CALLER_CWD", ""), os.path.expanduser(path))
+
+def run_query(prompt, reasoning_effort="medium", debug=False, model=None, stream=None,
+              cache=True, refresh=False, route=None, hedge=False, search=False):
+    """
+    Run a query on the warm daemon when it is running, otherwise in-process.
+    """
+    from daemon import run_via_daemon
+    if run_via_daemon(prompt, reasoning_effort=reasoning_effort, debug=debug, model=model, stream=stream,
+                      cache=cache, refresh=refresh, route=route, hedge=hedge, search=search):
+        return
+    from ai_client import single_query
+    single_query(prompt, reasoning_effort=reasoning_effort, debug=debug, model=model, stream=stream,
+                 cache=cache, refresh=refresh, route=route, hedge=hedge, search=search)
+
+def mode_header(reasoning_effort, fast=False, auto=False, effort_explicit=False):
+    """Return the REPL's "[mode: ...]" line for the current settings."""
+    if fast:
+        return f"[mode: {FAST_MODEL} - realtime]"
+    if auto and effort_explicit:
+        return f"[mode: auto - model picked per query - reasoning effort: {reasoning_effort}]"
+    if auto:
+        return "[mode: auto - model and reasoning effort picked per query]"
+    return f"[mode: {MODEL} - reasoning effort: {reasoning_effort}]"
+
 def read_multiline_input(prompt=">>> "):
     """
     Read user input over multiple lines until all occurrences of "$(" have
@@ -23,35 +58,64 @@ def read_multiline_input(prompt=">>> "):
         query += "\n" + input("... ")
     return query
 
-def process_command_substitutions(query):
+def run_repl_query(prompt, options, out):
+    """Answer an interactive query in-process, leaving the context to the QueryRunner."""
+    from ai_client import single_query
+    result = single_query(prompt, out=out, record=False, **options)
+    return result["answer"], result["topics"], result["reasoning_effort"], result["model"], options["route"]
+
+def run_repl_fast_query(session, lock, prompt, out):
+    """Answer an interactive query over the realtime session, one at a time."""
+    from realtime_client import fast_query
+    with lock:
+        answer = fast_query(session, prompt, out=out, record=False)
+    return answer.strip(), [], "realtime", session.model, None
+
+def interactive_mode(initial_reasoning_effort, initial_debug_mode, initial_stream=None, initial_cache=True,
+                     initial_fast=False, initial_auto=False, initial_hedge=False, initial_search=False):
     """
-    Scan the query for all occurrences of command substitution (i.e. $(...))
-    and replace each with its shell-expanded output.
+    Run the REPL. Queries are answered in the background while the prompt
+    stays available (see query_runner); each uses the flags in effect when
+    it was submitted.
     """
-    # Pattern to match $( ... ) non-greedily across newlines.
-    pattern = r'\$\((.*?)\)'
-    
-    def replacer(match):
-        command = match.group(1)
-        try:
-            # Run the extracted command in a shell.
-            output = subprocess.check_output(command, shell=True, text=True)
-            return output.strip()
-        except subprocess.CalledProcessError as e:
-            print("Error processing command substitution:", e)
-            # On error, return the original text.
-            return match.group(0)
-    
-    # Replace every occurrence of $(...) in the query.
-    return re.sub(pattern, replacer, query, flags=re.DOTALL)
+    import asyncio
+    try:
+        asyncio.run(interactive_session(initial_reasoning_effort, initial_debug_mode, initial_stream,
+                                        initial_cache, initial_fast, initial_auto, initial_hedge, initial_search))
+    except KeyboardInterrupt:
+        print("\nExiting interactive mode.")
+
+async def interactive_session(initial_reasoning_effort, initial_debug_mode, initial_stream=None, initial_cache=True,
+                              initial_fast=False, initial_auto=False, initial_hedge=False, initial_search=False):
+    # Only the REPL needs these; local subcommands start without them.
+    import threading
+    from functools import partial
+    from query_runner import Console, QueryRunner, run_in_thread
 
-def interactive_mode(initial_reasoning_effort, initial_debug_mode):
+    console = Console()
+    runner = QueryRunner(console)
     # Set initial flag values (default reasoning effort defaults to "medium")
     current_reasoning_effort = initial_reasoning_effort or "medium"
+    # --auto only picks the effort when none was chosen explicitly.
+    effort_explicit = initial_reasoning_effort is not None
     current_debug_mode = initial_debug_mode
+    current_stream = initial_stream
+    current_cache = initial_cache
+    current_fast = initial_fast
+    current_auto = initial_auto
+    current_hedge = initial_hedge
+    current_search = initial_search
+    # One realtime WebSocket for the whole session, opened on first use;
+    # its turns cannot overlap, so fast queries take turns on it.
+    fast_session = None
+    fast_lock = threading.Lock()
+    if current_fast:
+        from realtime_client import RealtimeSession
+        fast_session = RealtimeSession()
+        fast_session.connect_in_background()
 
     # Print initial REPL header.
-    header = f"[mode: {MODEL} - reasoning effort: {current_reasoning_effort}]"
+    header = mode_header(current_reasoning_effort, current_fast, current_auto, effort_explicit)
     if current_debug_mode:
         header += " (Debug mode enabled)"
     print(header)
@@ -62,14 +126,31 @@ def interactive_mode(initial_reasoning_effort, initial_debug_mode):
     print("  :forget-memory <id>  : Remove a permanent memory by its ID")
     print("  :export-memory <file>: Export permanent memories to the specified file")
     print("You can adjust flags on the fly by prepending your input with them.")
-    print("  Recognized flags: +debug (+d), -debug (-d), --high (-h), --medium (-m), --low (-l)")
+    print("  Recognized flags: +debug (+d), -debug (-d), --high (-h), --medium (-m), --low (-l),")
+    print("                    --stream, --no-stream, --cache, --no-cache, --refresh (this query only),")
+    print("                    --fast, --no-fast (realtime model over a persistent WebSocket),")
+    print("                    --auto, --no-auto (pick the model and effort per query),")
+    print("                    --hedge, --no-hedge (send a duplicate request when the first is slow)")
+    print("                    --search, --no-search (let the model search the web)")
     print("If only flags are provided, a confirmation message is printed.")
+    print("Queries run in the background, labelled r1, r2, ...; their answers are printed as they complete.")
     
     try:
         while True:
-            user_input = read_multiline_input(">>> ").strip()
+            console.start_input(">>> ", runner.status())
+            try:
+                user_input = (await run_in_thread(read_multiline_input, ">>> ")).strip()
+            except EOFError:
+                print()
+                user_input = "exit"
+            finally:
+                console.end_input()
             
             if user_input.lower() in ["exit", "quit"]:
+                running = runner.running()
+                if running:
+                    print(f"Waiting for {len(running)} running queries (Ctrl-C to abandon them).")
+                    await runner.wait()
                 print("Exiting interactive mode.")
                 break
            
@@ -83,15 +164,14 @@ def interactive_mode(initial_reasoning_effort, initial_debug_mode):
                 print("  :view-memory           : Display all long-term memories")
                 print("  :forget-memory <id>    : Remove a long-term memory by its ID")
                 print("  :export-memory <file>  : Export long-term memories to a file")
-                print("  Flags: +debug (+d), -debug (-d), --high (-h), --medium (-m), --low (-l)")
+                print("  Flags: +debug (+d), -debug (-d), --high (-h), --medium (-m), --low (-l),")
+                print("         --stream, --no-stream, --cache, --no-cache, --refresh (this query only),")
+                print("         --fast, --no-fast, --auto, --no-auto, --hedge, --no-hedge, --search, --no-search")
                 print("  Type your query directly to send it to the AI.")
                 continue
                 
-            user_input = process_command_substitutions(user_input)
-            prev_input = None
-            while prev_input != user_input:
-                prev_input = user_input
-                user_input = process_command_substitutions(user_input)
+            # Commands can run for SUBSTITUTION_TIMEOUT; keep answering meanwhile.
+            user_input = await run_in_thread(process_command_substitutions, user_input)
 
             # Handle special in-chat memory commands.
             if user_input.startswith("--remember "):
@@ -117,8 +197,10 @@ def interactive_mode(initial_reasoning_effort, initial_debug_mode):
                     continue
                 try:
                     entry_id = int(parts[1])
-                    forget_permanent_memory(entry_id)
-                    print(f"Permanent memory with id {entry_id} has been removed.")
+                    if forget_permanent_memory(entry_id):
+                        print(f"Permanent memory with id {entry_id} has been removed.")
+                    else:
+                        print(f"No permanent memory with id {entry_id}.")
                 except ValueError:
                     print("Invalid ID. Must be an integer.")
                 continue
@@ -135,9 +217,13 @@ def interactive_mode(initial_reasoning_effort, initial_debug_mode):
             # Split the input into tokens.
             tokens = user_input.split()
             recognized_flags = {"+debug", "+d", "-debug", "-d", "--high", "-high", "-h",
-                               "--medium", "-medium", "-m", "--low", "-low", "-l"}
+                               "--medium", "-medium", "-m", "--low", "-low", "-l",
+                               "--stream", "--no-stream", "--cache", "--no-cache", "--refresh",
+                               "--fast", "--no-fast", "--auto", "--no-auto", "--hedge", "--no-hedge",
+                               "--search", "--no-search"}
             flag_tokens = []
             query_tokens = []
+            refresh = False
             for token in tokens:
                 if token in recognized_flags:
                     flag_tokens.append(token)
@@ -153,30 +239,112 @@ def interactive_mode(initial_reasoning_effort, initial_debug_mode):
                     print("Debug mode turned OFF.")
                 elif flag in {"--high", "-high", "-h"}:
                     current_reasoning_effort = "high"
+                    effort_explicit = True
                     print("Reasoning effort set to high.")
                 elif flag in {"--medium", "-medium", "-m"}:
                     current_reasoning_effort = "medium"
+                    effort_explicit = True
                     print("Reasoning effort set to medium.")
                 elif flag in {"--low", "-low", "-l"}:
                     current_reasoning_effort = "low"
+                    effort_explicit = True
                     print("Reasoning effort set to low.")
+                elif flag == "--stream":
+                    current_stream = True
+                    print("Streaming turned ON.")
+                elif flag == "--no-stream":
+                    current_stream = False
+                    print("Streaming turned OFF.")
+                elif flag == "--cache":
+                    current_cache = True
+                    print("Response cache turned ON.")
+                elif flag == "--no-cache":
+                    current_cache = False
+                    print("Response cache turned OFF.")
+                elif flag == "--refresh":
+                    refresh = True
+                elif flag == "--fast":
+                    current_fast = True
+                    if fast_session is None:
+                        from realtime_client import RealtimeSession
+                        fast_session = RealtimeSession()
+                        fast_session.connect_in_background()
+                    print("Fast mode turned ON.")
+                elif flag == "--no-fast":
+                    current_fast = False
+                    print("Fast mode turned OFF.")
+                elif flag == "--auto":
+                    current_auto = True
+                    print("Automatic routing turned ON.")
+                elif flag == "--no-auto":
+                    current_auto = False
+                    print("Automatic routing turned OFF.")
+                elif flag == "--hedge":
+                    current_hedge = True
+                    print("Hedged requests turned ON.")
+                elif flag == "--no-hedge":
+                    current_hedge = False
+                    print("Hedged requests turned OFF.")
+                elif flag == "--search":
+                    current_search = True
+                    print("Web search turned ON.")
+                elif flag == "--no-search":
+                    current_search = False
+                    print("Web search turned OFF.")
             # If only flags were provided, reprint the header with updated settings.
             if not query_tokens:
-                new_header = f"[mode: {MODEL} - reasoning effort: {current_reasoning_effort}]"
+                new_header = mode_header(current_reasoning_effort, current_fast, current_auto, effort_explicit)
                 if current_debug_mode:
                     new_header += " (Debug mode enabled)"
                 print(new_header)
             else:
                 # Otherwise, join query tokens into a query string and process it.
+                # The query keeps the settings in effect now, whatever flags
+                # are given while it runs.
                 query = " ".join(query_tokens)
-                single_query(query, reasoning_effort=current_reasoning_effort, debug=current_debug_mode)
-    except (KeyboardInterrupt, EOFError):
-        print("\nExiting interactive mode.")
+                if current_fast:
+                    from realtime_client import RealtimeSession
+                    fast_session = fast_session or RealtimeSession()
+                    runner.submit(query, partial(run_repl_fast_query, fast_session, fast_lock, query),
+                                  f" [{fast_session.model} - realtime]")
+                    continue
+                options = {"reasoning_effort": current_reasoning_effort, "debug": current_debug_mode,
+                           "model": MODEL, "stream": current_stream, "cache": current_cache, "refresh": refresh,
+                           "route": None, "hedge": current_hedge, "search": current_search}
+                if current_auto:
+                    from router import route
+                    chosen = route(query)
+                    options.update(model=chosen["model"], route=chosen["label"])
+                    if not effort_explicit:
+                        options["reasoning_effort"] = chosen["effort"]
+                describe = f"{options['model']} - {options['reasoning_effort']}"
+                if options["route"]:
+                    describe += f", {options['route']}"
+                runner.submit(query, partial(run_repl_query, query, options), f" [{describe}]")
+    finally:
+        if fast_session is not None:
+            fast_session.close()
 
 def parse_args():
     argv = sys.argv[1:]
-    subcmds = {"query", "remember", "view-memory", "forget-memory", "export-memory"}
-    if not any(arg in subcmds for arg in argv) and any(not arg.startswith(('-', '+')) for arg in argv):
+    # Subcommands and how many positional words each takes (None: any number).
+    subcmds = {"query": None, "remember": 1, "view-memory": 0, "forget-memory": 1, "export-memory": 1,
+               "tail": 0, "repeat": 1, "grep": None, "jobs": 0, "result": 1, "daemon": 1,
+               "batch": 1, "rotate": 0, "stats": 0}
+    valued = {"-m", "--model", "-f", "--file", "--match", "-n", "-o", "--output",
+              "-j", "--concurrency", "--rpm", "--export", "--collect", "--max-digests"}
+    # Only the first word can name a subcommand, and only when the rest fits
+    # it, so "gpt how do I use grep" and "gpt repeat the last command" are
+    # queries. Option values are not words.
+    words = [i for i, arg in enumerate(argv)
+             if not arg.startswith(('-', '+')) and (i == 0 or argv[i - 1] not in valued)]
+    command = argv[words[0]] if words else None
+    if command in subcmds and (subcmds[command] is None or len(words) - 1 <= subcmds[command]):
+        # Global flags given before the subcommand belong to it.
+        argv = [command] + argv[:words[0]] + argv[words[0] + 1:]
+    elif (any(not arg.startswith(('-', '+')) for arg in argv)
+            or "-i" in argv or "--stdin" in argv or not sys.stdin.isatty()):
+        # Piped input with no prompt is still a query, not the REPL.
         argv = ["query"] + argv
 
     # Define a parent parser for global flags.
@@ -189,10 +357,25 @@ def parse_args():
     global_parser.add_argument("--high", dest="reasoning", action="store_const",
                                const="high", help="Set reasoning effort to high")
     global_parser.add_argument("--medium", dest="reasoning", action="store_const",
-                               const="medium", help="Set reasoning effort to medium (default)",
-                               default="medium")
+                               const="medium", help="Set reasoning effort to medium (default)")
     global_parser.add_argument("--low", dest="reasoning", action="store_const",
                                const="low", help="Set reasoning effort to low")
+    global_parser.add_argument("--stream", dest="stream", action="store_true", default=None,
+                               help="Print the answer as it is generated")
+    global_parser.add_argument("--no-stream", dest="stream", action="store_false",
+                               help="Wait for the complete answer before printing")
+    global_parser.add_argument("--no-cache", dest="cache", action="store_false", default=True,
+                               help="Neither read nor write the local response cache")
+    global_parser.add_argument("--fast", dest="fast", action="store_true", default=False,
+                               help=f"Use {FAST_MODEL} over a persistent realtime WebSocket")
+    global_parser.add_argument("--auto", dest="auto", action="store_true", default=False,
+                               help="Pick the model and reasoning effort from the prompt and past latency")
+    global_parser.add_argument("--hedge", dest="hedge", action="store_true", default=False,
+                               help="Send a duplicate request when the first is slower than usual")
+    global_parser.add_argument("--search", dest="search", action="store_true", default=False,
+                               help="Let the model search the web before answering")
+    global_parser.add_argument("--refresh", dest="refresh", action="store_true", default=False,
+                               help="Ignore any cached response and cache the new one")
     
     # Create the main parser.
     parser = argparse.ArgumentParser(
@@ -204,9 +387,19 @@ def parse_args():
     # Define subcommands.
     parser_query = subparsers.add_parser("query", parents=[global_parser],
                                          help="Run a one-off query", prefix_chars='-+')
-    parser_query.add_argument("prompt", type=str, help="User prompt to query the AI")
-    parser_query.add_argument("-m", "--model", dest="model", default=MODEL,
-                              help="Select model to use")
+    parser_query.add_argument("prompt", nargs="*", help="User prompt to query the AI (all words are joined)")
+    parser_query.add_argument("-i", "--stdin", dest="stdin", action="store_true",
+                              help="Append standard input to the prompt (implied when input is piped)")
+    parser_query.add_argument("--match", dest="match", default=None,
+                              help="Regex of lines to keep when large input has to be reduced")
+    parser_query.add_argument("-f", "--file", dest="file", default=None,
+                              help="Answer the prompt over a file or directory (map-reduce when large)")
+    parser_query.add_argument("--map-reduce", dest="map_reduce", action="store_true",
+                              help="Read all of the piped input in parts instead of reducing it")
+    parser_query.add_argument("-m", "--model", dest="model", default=None,
+                              help=f"Select model to use (default {MODEL})")
+    parser_query.add_argument("-b", "--background", dest="background", action="store_true",
+                              help="Run the query as a background job")
     
     parser_remember = subparsers.add_parser("remember", parents=[global_parser],
                                             help="Save text permanently", prefix_chars='-+')
@@ -223,19 +416,144 @@ def parse_args():
                                           help="Export permanent memories to a file", prefix_chars='-+')
     parser_export.add_argument("output", type=str, help="Output file path")
     
+    parser_tail = subparsers.add_parser("tail", parents=[global_parser],
+                                        help="Show the last context blocks", prefix_chars='-+')
+    parser_tail.add_argument("-n", dest="count", type=int, default=10,
+                             help="Number of blocks to show (default 10)")
+    
+    parser_repeat = subparsers.add_parser("repeat", parents=[global_parser],
+                                          help="Repeat the Nth last unique response, or the last about a topic",
+                                          prefix_chars='-+')
+    parser_repeat.add_argument("selector", nargs="?", default="1",
+                               help="N (default 1) or a topic to match")
+    
+    parser_grep = subparsers.add_parser("grep", parents=[global_parser],
+                                        help="Show all context blocks about a topic", prefix_chars='-+')
+    parser_grep.add_argument("topic", nargs="+", help="Topic or terms to match")
+    
+    parser_jobs = subparsers.add_parser("jobs", parents=[global_parser],
+                                        help="List background jobs", prefix_chars='-+')
+    parser_jobs.add_argument("-n", dest="count", type=int, default=20,
+                             help="Number of jobs to list (default 20)")
+    
+    parser_result = subparsers.add_parser("result", parents=[global_parser],
+                                          help="Print the output of a background job", prefix_chars='-+')
+    parser_result.add_argument("id", type=int, help="ID of the background job")
+    
+    parser_daemon = subparsers.add_parser("daemon", parents=[global_parser],
+                                          help="Manage the warm background daemon", prefix_chars='-+')
+    parser_daemon.add_argument("action", choices=["start", "stop", "status"],
+                               help="Start, stop or check the daemon")
+    
+    parser_rotate = subparsers.add_parser("rotate", parents=[global_parser],
+                                          help="Archive old context by period and write digests", prefix_chars='-+')
+    parser_rotate.add_argument("--no-digests", dest="digests", action="store_false",
+                               help="Only rotate and compress, without writing digests")
+    parser_rotate.add_argument("--max-digests", dest="max_digests", type=int, default=DIGEST_MAX_PER_RUN,
+                               help=f"Digests to write, newest period first (default {DIGEST_MAX_PER_RUN})")
+    
+    parser_stats = subparsers.add_parser("stats", parents=[global_parser],
+                                         help="Show latency percentiles per query phase", prefix_chars='-+')
+    parser_stats.add_argument("--json", dest="json", action="store_true",
+                              help="Print the statistics as JSON")
+    
+    parser_batch = subparsers.add_parser("batch", parents=[global_parser],
+                                         help="Run a JSONL file of prompts concurrently", prefix_chars='-+')
+    parser_batch.add_argument("input", nargs="?", help="JSONL file of {\"id\", \"prompt\", \"model\", \"effort\"} records")
+    parser_batch.add_argument("-o", "--output", dest="output", default=None,
+                              help="Results file (default <input>.results.jsonl)")
+    parser_batch.add_argument("-j", "--concurrency", dest="concurrency", type=int, default=BATCH_MAX_CONCURRENCY,
+                              help=f"Requests in flight (default {BATCH_MAX_CONCURRENCY})")
+    parser_batch.add_argument("--rpm", dest="rpm", type=int, default=BATCH_REQUESTS_PER_MINUTE,
+                              help=f"Requests started per minute (default {BATCH_REQUESTS_PER_MINUTE})")
+    parser_batch.add_argument("--export", dest="export", default=None,
+                              help="Write a provider batch file instead of running the prompts")
+    parser_batch.add_argument("--submit", dest="submit", action="store_true",
+                              help="Upload the exported batch file and start a provider batch")
+    parser_batch.add_argument("--collect", dest="collect", default=None, metavar="BATCH_ID",
+                              help="Fetch the results of a submitted provider batch")
+    
     return parser.parse_args(argv)
 
 def main():
-    ensure_required_permanent_memories()
-    args = parse_args()
+    with span("parse_args"):
+        args = parse_args()
+    if getattr(args, "command", None) in (None, "query"):
+        # Only model queries need the required memories; local subcommands skip it.
+        with span("ensure_required_permanent_memories"):
+            ensure_required_permanent_memories()
     if not hasattr(args, "reasoning"):
-        args.reasoning = "medium"
+        args.reasoning = None
     if not hasattr(args, "debug"):
         args.debug = False
+    if not hasattr(args, "stream"):
+        args.stream = None
+    if not hasattr(args, "cache"):
+        args.cache = True
+    if not hasattr(args, "refresh"):
+        args.refresh = False
+    if not hasattr(args, "fast"):
+        args.fast = False
+    if not hasattr(args, "auto"):
+        args.auto = False
+    if not hasattr(args, "hedge"):
+        args.hedge = False
+    if not hasattr(args, "search"):
+        args.search = False
+    args.route = None
+    if getattr(args, "command", None) == "query":
+        args.prompt = " ".join(args.prompt)
+        if args.file or args.map_reduce:
+            from map_reduce import run_map_reduce, iter_path_lines, iter_stdin_lines
+            path = caller_path(args.file) if args.file else None
+            if path and not os.path.exists(path):
+                print(f"No such file or directory: {args.file}")
+                return
+            lines = iter_path_lines(path) if path else iter_stdin_lines()
+            run_map_reduce(args.prompt, lines, args.file or "standard input",
+                           reasoning_effort=args.reasoning or "medium", debug=args.debug, model=args.model,
+                           stream=args.stream, cache=args.cache, refresh=args.refresh)
+            return
+        if args.stdin or not sys.stdin.isatty():
+            from stdin_reader import read_stdin
+            with span("read_stdin"):
+                piped = read_stdin(match=args.match)
+            if piped.strip():
+                from blob_store import reference
+                piped = reference(piped)
+                args.prompt = f"{args.prompt}\n\n{piped}" if args.prompt else piped
+        if not args.prompt.strip():
+            print("Nothing to ask: give a prompt or pipe some input.")
+            return
+        if args.auto and not args.fast:
+            # The router only fills in what was not chosen explicitly.
+            from router import route
+            chosen = route(args.prompt)
+            args.model = args.model or chosen["model"]
+            args.reasoning = args.reasoning or chosen["effort"]
+            args.route = chosen["label"]
+        args.model = args.model or MODEL
+    # The REPL defaults the effort itself, so it can tell an explicit one.
+    if getattr(args, "command", None) and not args.reasoning:
+        args.reasoning = "medium"
     if not getattr(args, "command", None):
-        interactive_mode(args.reasoning, args.debug)
+        interactive_mode(args.reasoning, args.debug, args.stream, args.cache, args.fast, args.auto, args.hedge,
+                         args.search)
+    elif args.command == "query" and args.background:
+        from job_queue import submit_job
+        job_id = submit_job(args.prompt, reasoning_effort=args.reasoning, model=args.model, route=args.route)
+        print(f"Started background job [{job_id}]. Use 'gpt result {job_id}' to see its output.")
+    elif args.command == "query" and args.fast:
+        from realtime_client import RealtimeSession, fast_query
+        session = RealtimeSession()
+        try:
+            fast_query(session, args.prompt)
+        finally:
+            session.close()
     elif args.command == "query":
-        single_query(args.prompt, reasoning_effort=args.reasoning, debug=args.debug, model=args.model)
+        run_query(args.prompt, reasoning_effort=args.reasoning, debug=args.debug, model=args.model,
+                  stream=args.stream, cache=args.cache, refresh=args.refresh, route=args.route,
+                  hedge=args.hedge, search=args.search)
     elif args.command == "remember":
         try:
             entry = add_permanent_memory(args.text)
@@ -250,11 +568,126 @@ def main():
         else:
             print("No permanent memories found.")
     elif args.command == "forget-memory":
-        forget_permanent_memory(args.id)
-        print(f"Permanent memory with id {args.id} has been removed.")
+        if forget_permanent_memory(args.id):
+            print(f"Permanent memory with id {args.id} has been removed.")
+        else:
+            print(f"No permanent memory with id {args.id}.")
     elif args.command == "export-memory":
         export_permanent_memory(args.output)
         print(f"Permanent memories exported to {args.output}.")
+    elif args.command == "tail":
+        blocks = tail_context(args.count)
+        if blocks:
+            print(DELIMITER.join(blocks))
+        else:
+            print("No context found.")
+    elif args.command == "repeat":
+        answer = repeat_response(args.selector)
+        if answer is None:
+            print(f"No previous response found for '{args.selector}'.")
+        else:
+            print(answer)
+    elif args.command == "grep":
+        topic = " ".join(args.topic)
+        blocks = grep_context(topic)
+        if blocks:
+            print(DELIMITER.join(blocks))
+        else:
+            print(f"No context found about '{topic}'.")
+    elif args.command == "jobs":
+        from job_queue import list_jobs
+        jobs = list_jobs(args.count)
+        if not jobs:
+            print("No background jobs found.")
+        for job in jobs:
+            prompt = job["prompt"].splitlines()[0] if job["prompt"] else ""
+            if len(prompt) > 40:
+                prompt = prompt[:37] + "..."
+            print(f"[{job['id']}] {job['status']:<7} ({job['submitted']}) "
+                  f"[{job['model']} - {job['reasoning_effort']}] {prompt}")
+    elif args.command == "result":
+        from job_queue import get_job
+        job = get_job(args.id)
+        if job is None:
+            print(f"No background job with id {args.id}.")
+        elif job["status"] in ("queued", "running"):
+            print(f"Background job [{args.id}] is still {job['status']}.")
+        elif job["status"] == "failed":
+            print(f"Background job [{args.id}] failed: {job['error']}")
+        else:
+            print(job["output"].strip("\n"))
+    elif args.command == "rotate":
+        from retention import rotate, generate_digests, pending_digests
+        rotated, compressed = rotate()
+        for segment in rotated:
+            print(f"Rotated old blocks into {segment}.")
+        for segment in compressed:
+            print(f"Compressed {segment}.")
+        if args.digests:
+            for entry in generate_digests(limit=args.max_digests):
+                print(f"Wrote digest of {entry['period']} ({entry['blocks']} exchanges, {entry['tokens']} tokens).")
+            remaining = len(pending_digests())
+            if remaining:
+                print(f"{remaining} older periods have no digest yet; run 'gpt rotate' again to write more.")
+        if not rotated and not compressed:
+            print("Context is already rotated.")
+    elif args.command == "stats":
+        from metrics import phase_stats, format_phase_stats
+        stats = phase_stats()
+        if args.json:
+            import json
+            print(json.dumps([{"model": model, "reasoning_effort": effort, **group}
+                              for (model, effort), group in stats.items()], indent=2))
+        elif not stats:
+            print("No query timings recorded yet.")
+        else:
+            print(format_phase_stats(stats))
+    elif args.command == "batch":
+        from batch import (run_batch, export_provider_batch, submit_provider_batch,
+                           collect_provider_batch)
+        if args.output:
+            args.output = caller_path(args.output)
+        if args.export:
+            args.export = caller_path(args.export)
+        if args.collect:
+            output = args.output or caller_path(f"{args.collect}.results.jsonl")
+            status = collect_provider_batch(args.collect, output)
+            if status == "completed":
+                print(f"Batch {args.collect} results written to {output}.")
+            else:
+                print(f"Batch {args.collect} is {status}.")
+            return
+        if not args.input:
+            print("Usage: gpt batch <input.jsonl> [-o output] [--export file [--submit]] | --collect BATCH_ID")
+            return
+        args.input = caller_path(args.input)
+        try:
+            if args.export or args.submit:
+                export = args.export or os.path.splitext(args.input)[0] + ".batch.jsonl"
+                count = export_provider_batch(args.input, export)
+                print(f"Wrote {count} requests to {export}.")
+                if args.submit:
+                    batch_id = submit_provider_batch(export)
+                    print(f"Submitted batch {batch_id}. Use 'gpt batch --collect {batch_id}' to fetch it.")
+                return
+            output, count, failed = run_batch(args.input, args.output, concurrency=args.concurrency,
+                                              requests_per_minute=args.rpm, cache=args.cache)
+            print(f"{count - failed}/{count} prompts answered. Results written to {output}.")
+        except (OSError, ValueError) as e:
+            print(e)
+    elif args.command == "daemon":
+        from daemon import start_daemon, stop_daemon, daemon_running
+        if args.action == "start":
+            if daemon_running():
+                print("Daemon is already running.")
+            elif start_daemon():
+                print("Daemon started.")
+            else:
+                print("Daemon failed to start.")
+        elif args.action == "stop":
+            print("Daemon stopped." if stop_daemon() else "Daemon is not running.")
+        else:
+            print("Daemon is running." if daemon_running() else "Daemon is not running.")
 
 if __name__ == "__main__":
     main()
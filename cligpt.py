@@ -1,7 +1,14 @@
 # cligpt.py
 
+import sys
+
+# --startup-profile is handled before any other import so it can time them all.
+if "--startup-profile" in sys.argv:
+    sys.argv.remove("--startup-profile")
+    import startup_profile
+    startup_profile.enable()
+
 from cli_interface import main
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,143 @@
+# command_substitution.py
+
+import os
+import time
+import signal
+import selectors
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from config import SUBSTITUTION_TIMEOUT, SUBSTITUTION_MAX_TOKENS, SUBSTITUTION_MAX_WORKERS
+from tokenizer import count_tokens
+import blob_store
+
+READ_CHUNK = 16 * 1024
+
+def _kill(proc):
+    """Kill a command's whole process group, including anything the shell spawned."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def find_substitutions(text):
+    """
+    Return (start, end, command) for every top-level $(...) in text.
+    Parentheses are matched with nesting and quoting in mind, so a nested
+    $(...) stays inside its parent's command and is expanded by the shell
+    when the parent runs. Unterminated substitutions are ignored.
+    """
+    found = []
+    i = 0
+    while True:
+        start = text.find("$(", i)
+        if start == -1:
+            return found
+        depth = 0
+        quote = None
+        j = start + 1
+        end = None
+        while j < len(text):
+            char = text[j]
+            if quote:
+                if char == "\\" and quote == '"':
+                    j += 1
+                elif char == quote:
+                    quote = None
+            elif char in ("'", '"'):
+                quote = char
+            elif char == "\\":
+                j += 1
+            elif char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth == 0:
+                    end = j + 1
+                    break
+            j += 1
+        if end is None:
+            return found
+        found.append((start, end, text[start + 2:end - 1]))
+        i = end
+
+def run_command(command, timeout=SUBSTITUTION_TIMEOUT, max_tokens=SUBSTITUTION_MAX_TOKENS):
+    """
+    Run command in a shell and return its stripped stdout, or None on
+    failure or timeout. Output is read as it is produced and the command is
+    stopped once it exceeds max_tokens, so a runaway command cannot flood
+    the prompt.
+    """
+    proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    chunks = []
+    tokens = 0
+    truncated = False
+    timed_out = False
+    with selectors.DefaultSelector() as selector:
+        selector.register(proc.stdout, selectors.EVENT_READ)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            if not selector.select(remaining):
+                continue
+            data = os.read(proc.stdout.fileno(), READ_CHUNK)
+            if not data:
+                break
+            chunk = data.decode("utf-8", errors="replace")
+            tokens += count_tokens(chunk)
+            chunks.append(chunk)
+            if tokens > max_tokens:
+                truncated = True
+                break
+    if timed_out or truncated:
+        _kill(proc)
+    proc.stdout.close()
+    try:
+        returncode = proc.wait(timeout=max(deadline - time.monotonic(), 0))
+    except subprocess.TimeoutExpired:
+        # stdout was closed but the command itself is still running.
+        _kill(proc)
+        returncode = proc.wait()
+        timed_out = not truncated
+
+    if timed_out:
+        print(f"Command substitution timed out after {timeout}s: {command}")
+        return None
+    output = "".join(chunks)
+    if truncated:
+        # Trim roughly to the budget by characters before adding the note.
+        output = output[:len(output) * max_tokens // tokens]
+        return output.strip() + f"\n[output truncated at {max_tokens} tokens]"
+    if returncode != 0:
+        print(f"Error processing command substitution: '{command}' returned non-zero exit status {returncode}.")
+        return None
+    return output.strip()
+
+def process_command_substitutions(query):
+    """
+    Scan the query for all top-level command substitutions (i.e. $(...))
+    and replace each with its shell-expanded output in a single pass.
+    Identical commands run once, and distinct commands run concurrently.
+    Large outputs are stored in the blob store and replaced by a reference.
+    On error the original text is kept.
+    """
+    substitutions = find_substitutions(query)
+    if not substitutions:
+        return query
+    commands = list(dict.fromkeys(command for _, _, command in substitutions))
+    with ThreadPoolExecutor(max_workers=min(SUBSTITUTION_MAX_WORKERS, len(commands))) as pool:
+        outputs = dict(zip(commands, pool.map(run_command, commands)))
+    outputs = {command: None if output is None else blob_store.reference(output)
+               for command, output in outputs.items()}
+
+    pieces = []
+    position = 0
+    for start, end, command in substitutions:
+        output = outputs[command]
+        pieces.append(query[position:start])
+        pieces.append(query[start:end] if output is None else output)
+        position = end
+    pieces.append(query[position:])
+    return "".join(pieces)
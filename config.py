@@ -8,15 +8,169 @@ FAST_MODEL = "gpt-4o-realtime-preview"
 STREAM = True
 N = 1
 PRESENCE_PENALTY = 0
+# Models that accept a reasoning_effort parameter; others ignore --low/--high.
+REASONING_MODEL_PREFIXES = ("gpt-5", "o1", "o3", "o4")
 
 # File paths
 SYSTEM_MESSAGE_FILE = "system_message.txt"
+SYSTEM_MESSAGE_CACHE_FILE = "system_message_cache.json"  # rendered system message
 CONTEXT_FILE = "context.txt"
-PERMANENT_MEMORY_FILE = "permanent_memory.json"  # permanent memories stored here
+CONTEXT_INDEX_FILE = "context_index.db"  # timestamp/offset index over CONTEXT_FILE
+CONTEXT_ARCHIVE_DIR = "context_archive"  # rotated (and compressed) context segments
+CONTEXT_DIGEST_FILE = "context_digests.jsonl"  # one summary per rotated segment
+PERMANENT_MEMORY_FILE = "permanent_memory.json"  # snapshot of permanent memories
+PERMANENT_MEMORY_LOG = "permanent_memory.log"  # memory changes since the snapshot
+JOBS_FILE = "jobs.db"  # background job table
+DAEMON_SOCKET = "cligpt.sock"  # Unix socket of the optional warm daemon
+RESPONSE_CACHE_FILE = "response_cache.db"  # local cache of model responses
+METRICS_FILE = "metrics.jsonl"  # per-query token usage and phase timings
+BLOB_DIR = "blobs"  # large substituted outputs, stored once by hash
+SEARCH_CACHE_FILE = "search_cache.db"  # web search results by normalized query
+
+# Response cache eviction: entries older than the max age are dropped, then
+# the least recently used ones until the cache is under the size cap.
+RESPONSE_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+RESPONSE_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# METRICS_FILE is rotated to METRICS_FILE.1 (then .2, ...) once it reaches
+# the size cap; this many rotated files are kept for `gpt stats`.
+METRICS_MAX_BYTES = 5 * 1024 * 1024
+METRICS_BACKUPS = 3
+
+# Permanent memory changes are appended to PERMANENT_MEMORY_LOG and folded
+# into a new snapshot once the log holds this many operations.
+PERMANENT_MEMORY_COMPACT_OPS = 50
+
+# Maximum concurrent API calls made by the background worker and the daemon
+BACKGROUND_MAX_WORKERS = 3
+DAEMON_MAX_WORKERS = 4
+# Queries the interactive mode runs at once (later ones wait their turn),
+# and seconds between updates of its progress line.
+REPL_MAX_IN_FLIGHT = 4
+REPL_PROGRESS_INTERVAL = 1.0
 
 # Token limit for assembling context
 MAX_CONTEXT_TOKENS = 100_000
 
+# Token counting: "bpe" uses tiktoken when installed, "approx" never does,
+# and "auto" prefers tiktoken and falls back to the approximation.
+TOKENIZER = "auto"
+TOKENIZER_ENCODING = "o200k_base"
+
+# Seconds before cached hardware/OS details (neofetch, distro) are refreshed
+SYSTEM_INFO_TTL = 24 * 60 * 60
+
+# Context selection: blocks are ranked by a mix of lexical relevance to the
+# prompt (BM25) and recency decay, then packed greedily into the budget.
+CONTEXT_RECENT_CANDIDATES = 50      # newest blocks always considered
+CONTEXT_RELEVANT_CANDIDATES = 200   # best-matching blocks considered
+CONTEXT_HALF_LIFE_HOURS = 24        # recency score halves every N hours
+RELEVANCE_WEIGHT = 0.6
+RECENCY_WEIGHT = 0.4
+TOPIC_TAG_WEIGHT = 3                # topic tag terms count N times
+
+# Context retention: blocks from before the current period ("day", "week"
+# or "month") are rotated out of CONTEXT_FILE into one segment per period,
+# segments are gzipped once their period ended N days ago, and each segment
+# gets a digest written by a cheap model. Queries include the newest digests
+# up to CONTEXT_DIGEST_TOKENS, so old history costs a few hundred tokens.
+CONTEXT_SEGMENT_PERIOD = "week"
+CONTEXT_COMPRESS_AFTER_DAYS = 30
+CONTEXT_DIGEST_TOKENS = 2_000
+DIGEST_MODEL = "gpt-5-nano"
+DIGEST_REASONING_EFFORT = "low"
+DIGEST_MAX_INPUT_TOKENS = 20_000
+# Seconds between attempts to write digests that are still pending (e.g.
+# after a failed DIGEST_MODEL call); rotation starts a worker right away.
+DIGEST_RETRY_INTERVAL = 15 * 60
+# Digests are only written automatically (by a detached process after a
+# query) with DIGEST_AUTOMATIC on, and only for periods that ended in the
+# last DIGEST_AUTO_DAYS days; older history is digested by `gpt rotate`.
+# One run writes at most DIGEST_MAX_PER_RUN digests, newest period first.
+DIGEST_AUTOMATIC = True
+DIGEST_AUTO_DAYS = 14
+DIGEST_MAX_PER_RUN = 4
+
+# API requests: seconds to connect, to wait for the first byte of a streamed
+# response (also the longest silence allowed between streamed chunks) and
+# for the whole of a non-streamed one, and retries of rate limits, 5xx
+# errors, timeouts and dropped connections with jittered exponential
+# backoff that honours Retry-After. A server asking for a longer wait than
+# REQUEST_MAX_RETRY_AFTER fails the request instead.
+REQUEST_CONNECT_TIMEOUT = 10.0
+REQUEST_FIRST_BYTE_TIMEOUT = 300.0
+REQUEST_TOTAL_TIMEOUT = 1800.0
+REQUEST_MAX_RETRIES = 3
+REQUEST_BACKOFF = 1.0
+REQUEST_MAX_BACKOFF = 30.0
+REQUEST_MAX_RETRY_AFTER = 120.0
+
+# Hedged requests (--hedge): when no first byte has arrived after the
+# HEDGE_PERCENTILE of the model's recent time to first byte, a duplicate is
+# sent to HEDGE_MODEL (None for the same model) and the first to answer
+# wins. FAST_MODEL is a realtime model and cannot serve these requests.
+HEDGE_MODEL = None
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_DELAY = 2.0
+HEDGE_DEFAULT_DELAY = 15.0
+HEDGE_HISTORY = 200
+HEDGE_MIN_SAMPLES = 10
+
+# Web search tool (--search): the backend is a "module.function" taking
+# (query, k) and returning {"title", "url", "snippet"} dicts; set
+# CLIGPT_SEARCH_BACKEND=mock_server.fake_search to test without the network.
+# Results are cached by normalized query for SEARCH_CACHE_TTL seconds, and
+# each search's results are cut to SEARCH_MAX_TOKENS before the model sees them.
+SEARCH_BACKEND = os.getenv("CLIGPT_SEARCH_BACKEND", "ddgs.do_search")
+SEARCH_RESULTS = 5
+SEARCH_MAX_TOKENS = 1_500
+SEARCH_MAX_WORKERS = 4
+SEARCH_MAX_ROUNDS = 3
+SEARCH_CACHE_TTL = 24 * 60 * 60
+
+# Automatic routing (--auto): each prompt is classified locally as a
+# "command" lookup, a "general" question or a "design" question and sent to
+# that class's (model, effort). When a route's median latency over the last
+# ROUTER_HISTORY queries exceeds its class's budget (seconds), the next
+# cheaper route is used instead. A budget of None means no limit.
+ROUTER_ROUTES = {
+    "command": ("gpt-5-mini", "low"),
+    "general": (MODEL, "medium"),
+    "design": (MODEL, "high"),
+}
+ROUTER_LATENCY_BUDGET = {"command": 8.0, "general": 45.0, "design": None}
+ROUTER_HISTORY = 200
+ROUTER_MIN_SAMPLES = 5
+ROUTER_COMMAND_MAX_WORDS = 25
+ROUTER_DESIGN_MIN_WORDS = 120
+
+# Command substitution $(...) in prompts: per-command timeout in seconds,
+# maximum tokens of output kept per command, and commands run in parallel.
+SUBSTITUTION_TIMEOUT = 30
+SUBSTITUTION_MAX_TOKENS = 20_000
+SUBSTITUTION_MAX_WORKERS = 8
+# Outputs of at least this many tokens (substitutions and piped input) are
+# stored once in BLOB_DIR and referenced from prompts and context blocks.
+BLOB_MIN_TOKENS = 500
+
+# Piped stdin: input over the token budget is reduced to its head, its tail
+# and the lines in between matching the pattern (overridable with --match).
+STDIN_MAX_TOKENS = MAX_CONTEXT_TOKENS
+STDIN_MATCH_PATTERN = r"(?i)\b(error|fail(ed|ure)?|exception|traceback|fatal|panic|warn(ing)?)\b"
+
+# Map-reduce over input larger than one request: tokens of input per part
+# and concurrent part requests. Rate limits are retried by each request
+# (REQUEST_MAX_RETRIES).
+MAP_REDUCE_CHUNK_TOKENS = 20_000
+MAP_REDUCE_MAX_WORKERS = 4
+
+# gpt batch: requests in flight, requests started per minute, and retries
+# on rate limits and transient errors (with the backoff of REQUEST_BACKOFF
+# and Retry-After, as for single requests).
+BATCH_MAX_CONCURRENCY = 8
+BATCH_REQUESTS_PER_MINUTE = 60
+BATCH_MAX_RETRIES = 5
+
 # Delimiter for context blocks
 DELIMITER = "\n" + "-" * 15 + "\n"
 
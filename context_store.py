@@ -0,0 +1,509 @@
+# context_store.py
+
+import os
+import re
+import gzip
+import math
+import fcntl
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from collections import Counter
+from config import CONTEXT_FILE, CONTEXT_INDEX_FILE, CONTEXT_ARCHIVE_DIR, DELIMITER, TOPIC_TAG_WEIGHT
+from tokenizer import count_tokens
+from blob_store import referenced_tokens
+
+TIMESTAMP_PATTERN = re.compile(r"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]")
+TOPIC_TAGS_PATTERN = re.compile(r"^Topic Tags: (.*)$", re.MULTILINE)
+TERM_PATTERN = re.compile(r"[a-z0-9_][a-z0-9_.+#-]*[a-z0-9_+#]|[a-z0-9]")
+DELIMITER_BYTES = DELIMITER.encode("utf-8")
+SEGMENT_PATTERN = re.compile(r"^(context-[\w-]+)\.txt(\.gz)?$")
+SCHEMA_VERSION = 4
+LOCK_FILE = CONTEXT_FILE + ".lock"
+
+# Chunk size for reading CONTEXT_FILE backwards.
+REVERSE_READ_CHUNK = 64 * 1024
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Terms that appear in more than this share of blocks carry no signal.
+MAX_DOCUMENT_FREQUENCY = 0.5
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from how i if in is it its me my
+no not of on or so that the this to was what when where which who why will
+with you your none topic tags
+""".split())
+
+# One connection per thread; sqlite3 connections cannot be shared across threads.
+_local = threading.local()
+
+# Decompressed bytes of the most recently read cold segments, keyed by path
+# and mtime, so reading several blocks from one segment inflates it once.
+_inflated = {}
+INFLATED_SEGMENTS = 2
+
+def _create_schema(conn):
+    """Drop any stale index tables and create the current schema."""
+    conn.executescript("""
+        DROP TABLE IF EXISTS blocks;
+        DROP TABLE IF EXISTS meta;
+        CREATE TABLE blocks (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            terms INTEGER NOT NULL DEFAULT 0,
+            tokens INTEGER NOT NULL DEFAULT 0,
+            segment TEXT
+        );
+        CREATE INDEX blocks_timestamp ON blocks (timestamp);
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        DROP TABLE IF EXISTS postings;
+        CREATE TABLE postings (
+            term TEXT NOT NULL,
+            block_id INTEGER NOT NULL,
+            tf REAL NOT NULL,
+            PRIMARY KEY (term, block_id)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+def get_connection():
+    """
+    Return this thread's connection to CONTEXT_INDEX_FILE.
+    The index only holds offsets into CONTEXT_FILE and the archived
+    segments, so an outdated schema is simply rebuilt from the logs.
+    """
+    conn = getattr(_local, "connection", None)
+    if conn is None:
+        conn = sqlite3.connect(CONTEXT_INDEX_FILE, timeout=30)
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with context_lock():
+                if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                    _rebuild_locked(conn)
+        _local.connection = conn
+    sync_index(conn)
+    return conn
+
+@contextmanager
+def context_lock():
+    """
+    Hold an exclusive advisory lock on the context log. Every write to the
+    log or its segments and every index update happens under it, so
+    concurrent gpt processes (and background job threads) cannot interleave
+    blocks or index them twice. The lock lives in its own file because
+    rotation replaces CONTEXT_FILE.
+    """
+    with open(LOCK_FILE, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def segment_path(segment):
+    """
+    Return the file holding a segment: CONTEXT_FILE for the hot segment
+    (None), otherwise the archived file, compressed or not.
+    """
+    if segment is None:
+        return CONTEXT_FILE
+    compressed = os.path.join(CONTEXT_ARCHIVE_DIR, segment + ".txt.gz")
+    if os.path.exists(compressed):
+        return compressed
+    return os.path.join(CONTEXT_ARCHIVE_DIR, segment + ".txt")
+
+def list_segments():
+    """Return the names of the archived segments, oldest first."""
+    if not os.path.isdir(CONTEXT_ARCHIVE_DIR):
+        return []
+    names = set()
+    for file_name in os.listdir(CONTEXT_ARCHIVE_DIR):
+        m_segment = SEGMENT_PATTERN.match(file_name)
+        if m_segment:
+            names.add(m_segment.group(1))
+    return sorted(names)
+
+def segment_bytes(segment):
+    """Return the full uncompressed contents of a segment."""
+    path = segment_path(segment)
+    if not path.endswith(".gz"):
+        with open(path, "rb") as f:
+            return f.read()
+    key = (path, os.stat(path).st_mtime_ns)
+    data = _inflated.get(key)
+    if data is None:
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+        while len(_inflated) >= INFLATED_SEGMENTS:
+            _inflated.pop(next(iter(_inflated)))
+        _inflated[key] = data
+    return data
+
+def _get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def _set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+def tokenize(text):
+    """Split text into lowercase index terms, dropping stopwords."""
+    return [term for term in TERM_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+def block_term_frequencies(text):
+    """
+    Return term frequencies for a block. Terms from its Topic Tags line are
+    weighted by TOPIC_TAG_WEIGHT since they summarize the whole exchange.
+    """
+    frequencies = Counter(tokenize(text))
+    m_tags = TOPIC_TAGS_PATTERN.search(text)
+    if m_tags:
+        for term in tokenize(m_tags.group(1)):
+            frequencies[term] += TOPIC_TAG_WEIGHT - 1
+    return frequencies
+
+def _index_block(conn, block_bytes, offset, segment=None):
+    """Insert the index rows for a block stored at offset in a segment (CONTEXT_FILE by default)."""
+    text = block_bytes.decode("utf-8", errors="replace")
+    m_time = TIMESTAMP_PATTERN.search(text)
+    timestamp = m_time.group(1) if m_time else None
+    frequencies = block_term_frequencies(text)
+    term_count = int(sum(frequencies.values()))
+    cursor = conn.execute(
+        "INSERT INTO blocks (timestamp, offset, length, terms, tokens, segment) VALUES (?, ?, ?, ?, ?, ?)",
+        (timestamp, offset, len(block_bytes), term_count, count_tokens(text) + referenced_tokens(text), segment)
+    )
+    block_id = cursor.lastrowid
+    conn.executemany("INSERT INTO postings (term, block_id, tf) VALUES (?, ?, ?)",
+                     [(term, block_id, tf) for term, tf in frequencies.items()])
+    _set_meta(conn, "total_terms", int(_get_meta(conn, "total_terms", 0)) + term_count)
+
+def sync_index(conn):
+    """
+    Index any complete blocks appended to CONTEXT_FILE since the last sync.
+    On first use this migrates an existing context.txt in a single pass.
+    """
+    if not os.path.exists(CONTEXT_FILE):
+        return
+    if os.path.getsize(CONTEXT_FILE) == int(_get_meta(conn, "indexed_size", 0)):
+        return
+    with context_lock():
+        _sync_locked(conn)
+
+def _index_data(conn, data, base_offset, segment=None, seen=None):
+    """
+    Index the complete blocks in data, which starts at base_offset in its
+    segment. Blocks whose bytes are in seen are skipped (used on rebuild to
+    ignore copies left by an interrupted rotation). Returns the number of
+    bytes consumed.
+    """
+    position = 0
+    while True:
+        end = data.find(DELIMITER_BYTES, position)
+        if end == -1:
+            break
+        raw = data[position:end]
+        stripped = raw.strip()
+        if stripped:
+            digest = hashlib.sha1(stripped).digest() if seen is not None else None
+            if digest is None or digest not in seen:
+                leading = len(raw) - len(raw.lstrip())
+                _index_block(conn, stripped, base_offset + position + leading, segment)
+                if seen is not None:
+                    seen.add(digest)
+        position = end + len(DELIMITER_BYTES)
+    return position
+
+def _rebuild_locked(conn):
+    """Recreate the index from the archived segments and CONTEXT_FILE."""
+    _create_schema(conn)
+    seen = set()
+    for segment in list_segments():
+        _index_data(conn, segment_bytes(segment), 0, segment, seen)
+    indexed_size = 0
+    if os.path.exists(CONTEXT_FILE):
+        with open(CONTEXT_FILE, "rb") as f:
+            indexed_size = _index_data(conn, f.read(), 0, None, seen)
+    _set_meta(conn, "indexed_size", indexed_size)
+    conn.commit()
+
+def _sync_locked(conn):
+    """Index the unindexed tail of CONTEXT_FILE; the caller holds context_lock()."""
+    indexed_size = int(_get_meta(conn, "indexed_size", 0))
+    file_size = os.path.getsize(CONTEXT_FILE) if os.path.exists(CONTEXT_FILE) else 0
+    if file_size == indexed_size:
+        return
+    if file_size < indexed_size:
+        # The log was truncated or replaced; rebuild from scratch.
+        _rebuild_locked(conn)
+        return
+    with open(CONTEXT_FILE, "rb") as f:
+        f.seek(indexed_size)
+        data = f.read()
+    position = _index_data(conn, data, indexed_size)
+    _set_meta(conn, "indexed_size", indexed_size + position)
+    conn.commit()
+
+def append_block(block):
+    """Append a block to CONTEXT_FILE and record its offset in the index."""
+    conn = get_connection()
+    encoded = block.encode("utf-8")
+    with context_lock(), open(CONTEXT_FILE, "ab") as f:
+        # Another process may have appended since get_connection() synced.
+        _sync_locked(conn)
+        offset = f.seek(0, os.SEEK_END)
+        f.write(encoded + DELIMITER_BYTES)
+        f.flush()
+        end = f.tell()
+        _index_block(conn, encoded, offset)
+        _set_meta(conn, "indexed_size", end)
+        conn.commit()
+
+def _write_atomically(path, data, compress=False):
+    """Write data to path through a temporary file and a rename."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    opener = gzip.open if compress else open
+    with opener(tmp_path, "wb") as f:
+        f.write(data)
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def rotate_blocks(segment_of):
+    """
+    Move blocks out of CONTEXT_FILE into archived segments.
+    segment_of(timestamp) names the segment a block belongs in, or returns
+    None to keep it in CONTEXT_FILE; blocks without a timestamp follow the
+    block before them. Segments are rewritten before CONTEXT_FILE, so an
+    interrupted rotation at worst leaves copies that the index rebuild
+    skips. Returns the names of the segments that received blocks.
+    """
+    conn = get_connection()
+    with context_lock():
+        _sync_locked(conn)
+        rows = conn.execute("SELECT id, timestamp, offset, length FROM blocks "
+                            "WHERE segment IS NULL ORDER BY id").fetchall()
+        if not rows:
+            return []
+        with open(CONTEXT_FILE, "rb") as f:
+            hot = f.read()
+        moved = {}
+        kept = []
+        segment = None
+        for block_id, timestamp, offset, length in rows:
+            if timestamp:
+                segment = segment_of(timestamp)
+            block = (block_id, hot[offset:offset + length])
+            if segment is None:
+                kept.append(block)
+            else:
+                moved.setdefault(segment, []).append(block)
+        if not moved:
+            return []
+
+        os.makedirs(CONTEXT_ARCHIVE_DIR, exist_ok=True)
+        updates = []
+        for name, blocks in moved.items():
+            existing_path = segment_path(name)
+            data = bytearray(segment_bytes(name) if os.path.exists(existing_path) else b"")
+            for block_id, block in blocks:
+                updates.append((name, len(data), block_id))
+                data += block + DELIMITER_BYTES
+            _write_atomically(os.path.join(CONTEXT_ARCHIVE_DIR, name + ".txt"), bytes(data))
+            if existing_path.endswith(".gz"):
+                # New blocks reopened a cold segment; it is recompressed later.
+                os.unlink(existing_path)
+        data = bytearray()
+        for block_id, block in kept:
+            updates.append((None, len(data), block_id))
+            data += block + DELIMITER_BYTES
+        # Anything after the last complete block is still being written.
+        tail = hot[int(_get_meta(conn, "indexed_size", 0)):]
+        _write_atomically(CONTEXT_FILE, bytes(data) + tail)
+
+        conn.executemany("UPDATE blocks SET segment = ?, offset = ? WHERE id = ?", updates)
+        _set_meta(conn, "indexed_size", len(data))
+        conn.commit()
+        return sorted(moved)
+
+def compress_segment(segment):
+    """Gzip an archived segment. Offsets stay valid since they refer to the uncompressed bytes."""
+    path = os.path.join(CONTEXT_ARCHIVE_DIR, segment + ".txt")
+    with context_lock():
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as f:
+            data = f.read()
+        _write_atomically(path + ".gz", data, compress=True)
+        os.unlink(path)
+    return True
+
+def _read_rows(rows):
+    """Read the block text for each (timestamp, offset, length, segment) row."""
+    results = []
+    files = {}
+    try:
+        for timestamp, offset, length, segment in rows:
+            path = segment_path(segment)
+            if path.endswith(".gz"):
+                data = segment_bytes(segment)[offset:offset + length]
+            else:
+                if path not in files:
+                    files[path] = open(path, "rb")
+                files[path].seek(offset)
+                data = files[path].read(length)
+            results.append((timestamp, data.decode("utf-8", errors="replace")))
+    finally:
+        for f in files.values():
+            f.close()
+    return results
+
+def read_block_texts(block_ids):
+    """Return {block_id: text} for the given block ids."""
+    conn = get_connection()
+    rows = []
+    for block_id in block_ids:
+        row = conn.execute("SELECT timestamp, offset, length, segment FROM blocks WHERE id = ?",
+                           (block_id,)).fetchone()
+        if row:
+            rows.append((block_id, row))
+    texts = _read_rows([row for _, row in rows])
+    return {block_id: text for (block_id, _), (_, text) in zip(rows, texts)}
+
+def recent_blocks(limit):
+    """Return (id, timestamp, tokens) for the newest limit blocks, newest first."""
+    conn = get_connection()
+    return conn.execute("SELECT id, timestamp, tokens FROM blocks ORDER BY id DESC LIMIT ?",
+                        (limit,)).fetchall()
+
+def score_blocks(query):
+    """
+    Score blocks against query with BM25 over the incrementally maintained
+    postings. Returns {block_id: (score, timestamp, tokens)} for blocks
+    matching at least one informative query term.
+    """
+    conn = get_connection()
+    terms = set(tokenize(query))
+    if not terms:
+        return {}
+    block_count = conn.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+    if not block_count:
+        return {}
+    average_terms = int(_get_meta(conn, "total_terms", 0)) / block_count or 1.0
+
+    scores = {}
+    for term in terms:
+        document_frequency = conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?",
+                                          (term,)).fetchone()[0]
+        if not document_frequency or document_frequency > max(MAX_DOCUMENT_FREQUENCY * block_count, 10):
+            continue
+        idf = math.log(1 + (block_count - document_frequency + 0.5) / (document_frequency + 0.5))
+        rows = conn.execute(
+            "SELECT p.block_id, p.tf, b.terms, b.timestamp, b.tokens FROM postings p "
+            "JOIN blocks b ON b.id = p.block_id WHERE p.term = ?",
+            (term,)
+        )
+        for block_id, tf, block_terms, timestamp, tokens in rows:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * block_terms / average_terms)
+            term_score = idf * tf * (BM25_K1 + 1) / (tf + norm)
+            previous = scores.get(block_id, (0.0,))[0]
+            scores[block_id] = (previous + term_score, timestamp, tokens)
+    return scores
+
+def read_blocks(since=None):
+    """
+    Return (timestamp, text) pairs in log order.
+    If since is given ("%Y-%m-%d %H:%M:%S"), only blocks at or after it are read.
+    """
+    conn = get_connection()
+    if since is None:
+        rows = conn.execute("SELECT timestamp, offset, length, segment FROM blocks ORDER BY id").fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT timestamp, offset, length, segment FROM blocks WHERE timestamp >= ? ORDER BY id",
+            (since,)
+        ).fetchall()
+    return _read_rows(rows)
+
+def _iter_file_reversed(f):
+    """Yield the blocks of an open log file newest first, reading backwards in chunks."""
+    f.seek(0, os.SEEK_END)
+    position = f.tell()
+    buffer = b""
+    while position > 0:
+        read_size = min(REVERSE_READ_CHUNK, position)
+        position -= read_size
+        f.seek(position)
+        buffer = f.read(read_size) + buffer
+        parts = buffer.split(DELIMITER_BYTES)
+        # parts[0] may be the tail of an earlier block; keep it for the next chunk.
+        buffer = parts[0]
+        for part in reversed(parts[1:]):
+            if part.strip():
+                yield part.strip().decode("utf-8", errors="replace")
+    if buffer.strip():
+        yield buffer.strip().decode("utf-8", errors="replace")
+
+def iter_blocks_reversed():
+    """
+    Yield block texts newest first by reading CONTEXT_FILE backwards in
+    chunks, then the archived segments from newest to oldest, so the cost
+    depends on how many blocks are consumed, not on the size of the history.
+    """
+    if os.path.exists(CONTEXT_FILE):
+        with open(CONTEXT_FILE, "rb") as f:
+            yield from _iter_file_reversed(f)
+    for segment in reversed(list_segments()):
+        path = segment_path(segment)
+        if path.endswith(".gz"):
+            for part in reversed(segment_bytes(segment).split(DELIMITER_BYTES)):
+                if part.strip():
+                    yield part.strip().decode("utf-8", errors="replace")
+        else:
+            with open(path, "rb") as f:
+                yield from _iter_file_reversed(f)
+
+def tail_blocks(count):
+    """Return the last count blocks in log order."""
+    blocks = []
+    for block in iter_blocks_reversed():
+        if len(blocks) >= count:
+            break
+        blocks.append(block)
+    blocks.reverse()
+    return blocks
+
+def oldest_hot_timestamp():
+    """Return the oldest block timestamp still in CONTEXT_FILE, or None."""
+    conn = get_connection()
+    return conn.execute("SELECT MIN(timestamp) FROM blocks WHERE segment IS NULL").fetchone()[0]
+
+def segment_block_counts():
+    """Return {segment: number of blocks} for the archived segments."""
+    conn = get_connection()
+    return dict(conn.execute("SELECT segment, COUNT(*) FROM blocks "
+                             "WHERE segment IS NOT NULL GROUP BY segment").fetchall())
+
+def search_block_ids(query, limit=None):
+    """
+    Return ids of blocks whose index terms (text and topic tags) contain
+    every term of query, newest first.
+    """
+    conn = get_connection()
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+    matches = None
+    for term in terms:
+        ids = {row[0] for row in conn.execute("SELECT block_id FROM postings WHERE term = ?", (term,))}
+        matches = ids if matches is None else matches & ids
+        if not matches:
+            return []
+    ordered = sorted(matches, reverse=True)
+    return ordered[:limit] if limit else ordered
@@ -0,0 +1,189 @@
+# daemon.py
+
+import os
+import sys
+import json
+import time
+import codecs
+import socket
+import subprocess
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from config import DAEMON_SOCKET, DAEMON_MAX_WORKERS
+
+# Seconds to wait for a freshly started daemon to accept connections.
+START_TIMEOUT = 5.0
+
+class SocketWriter:
+    """File-like object that sends everything written straight to a socket."""
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def write(self, text):
+        self.sock.sendall(text.encode("utf-8"))
+        return len(text)
+
+    def flush(self):
+        pass
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    """Handle one JSON request line and stream the query output back."""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+        except ValueError:
+            return
+        command = request.get("command", "query")
+        if command == "ping":
+            self.wfile.write(b"pong\n")
+        elif command == "shutdown":
+            self.wfile.write(b"stopping\n")
+            self.server.shutdown_requested = True
+        elif command == "query":
+            from ai_client import single_query
+            out = SocketWriter(self.connection)
+            try:
+                single_query(request["prompt"], reasoning_effort=request.get("reasoning_effort"),
+                             debug=request.get("debug", False), model=request.get("model"),
+                             stream=request.get("stream"), out=out,
+                             cache=request.get("cache", True), refresh=request.get("refresh", False),
+                             route=request.get("route"), hedge=request.get("hedge", False),
+                             search=request.get("search", False))
+            except Exception as e:
+                out.write(f"\nError: {e}\n")
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """
+    Unix socket server that handles requests on a fixed thread pool, so the
+    per-thread context index connections stay open between queries.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, QueryHandler)
+        self.pool = ThreadPoolExecutor(max_workers=DAEMON_MAX_WORKERS)
+        self.shutdown_requested = False
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def service_actions(self):
+        if self.shutdown_requested:
+            # shutdown() waits for serve_forever(), so it must run elsewhere,
+            # and only once.
+            self.shutdown_requested = False
+            self.pool.submit(self.shutdown)
+
+def serve():
+    """Warm up the client, system message and indexes, then serve forever."""
+    from ai_client import get_client, load_system_message
+    from memory_manager import load_permanent_memories
+    from context_store import get_connection
+
+    if os.path.exists(DAEMON_SOCKET):
+        if daemon_running():
+            return
+        os.unlink(DAEMON_SOCKET)
+    get_client()
+    load_system_message()
+    load_permanent_memories()
+    get_connection()
+    server = DaemonServer(DAEMON_SOCKET)
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        server.pool.shutdown(wait=True)
+        server.server_close()
+        if os.path.exists(DAEMON_SOCKET):
+            os.unlink(DAEMON_SOCKET)
+
+def _connect():
+    """Connect to the daemon socket, or return None if it is not running."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(DAEMON_SOCKET)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+def _request(payload):
+    """Send a request and return the connected socket, or None."""
+    sock = _connect()
+    if sock is None:
+        return None
+    sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+    return sock
+
+def daemon_running():
+    """Return True if a daemon answers on DAEMON_SOCKET."""
+    sock = _request({"command": "ping"})
+    if sock is None:
+        return False
+    with sock:
+        return sock.recv(16).startswith(b"pong")
+
+def run_via_daemon(prompt, reasoning_effort="medium", debug=False, model=None, stream=None, out=None,
+                   cache=True, refresh=False, route=None, hedge=False, search=False):
+    """
+    Run a query on the daemon, copying its output to out (stdout by default)
+    as it arrives. Returns False without doing anything when no daemon is
+    running, so the caller can fall back to running the query in-process.
+    """
+    sock = _request({"command": "query", "prompt": prompt, "reasoning_effort": reasoning_effort,
+                     "debug": debug, "model": model, "stream": stream,
+                     "cache": cache, "refresh": refresh, "route": route, "hedge": hedge,
+                     "search": search})
+    if sock is None:
+        return False
+    out = out or sys.stdout
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with sock:
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            out.write(decoder.decode(data))
+            out.flush()
+    out.write(decoder.decode(b"", final=True))
+    return True
+
+def start_daemon():
+    """Start a detached daemon in the current directory unless one is running."""
+    if daemon_running():
+        return False
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__)],
+        cwd=os.getcwd(),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if daemon_running():
+            return True
+        time.sleep(0.1)
+    return False
+
+def stop_daemon():
+    """Ask a running daemon to shut down. Returns False if none was running."""
+    sock = _request({"command": "shutdown"})
+    if sock is None:
+        return False
+    with sock:
+        sock.recv(16)
+    return True
+
+if __name__ == "__main__":
+    serve()
@@ -1,12 +1,16 @@
-#!/usr/bini/env python3
-import openai, json, os
-from duckduckgo_search import DDGS
+#!/usr/bin/env python3
+# ddgs.py
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+import sys
 
 def do_search(query: str, k: int = 5):
+    """Return up to k DuckDuckGo text results as {"title", "url", "snippet"} dicts."""
+    from duckduckgo_search import DDGS
+
     with DDGS() as ddgs:
-        hits = [r["body"] for r in ddgs.text(query, max_results=k)]
-    return "\n".join(hits)
+        return [{"title": r.get("title", ""), "url": r.get("href", ""), "snippet": r.get("body", "")}
+                for r in ddgs.text(query, max_results=k)]
 
-functions
+if __name__ == "__main__":
+    for result in do_search(" ".join(sys.argv[1:])):
+        print(f"{result['title']} ({result['url']})\n  {result['snippet']}")
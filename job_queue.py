@@ -0,0 +1,200 @@
+# job_queue.py
+
+import os
+import io
+import sys
+import json
+import fcntl
+import sqlite3
+import contextlib
+import datetime
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import JOBS_FILE, BACKGROUND_MAX_WORKERS
+
+WORKER_LOCK_FILE = JOBS_FILE + ".worker"
+
+# Serializes context writes between the worker's job threads.
+_record_lock = threading.Lock()
+
+def _connect():
+    """Open a connection to JOBS_FILE, creating the job table if needed."""
+    conn = sqlite3.connect(JOBS_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            submitted TEXT NOT NULL,
+            finished TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            prompt TEXT NOT NULL,
+            model TEXT,
+            reasoning_effort TEXT,
+            output TEXT,
+            answer TEXT,
+            topics TEXT,
+            error TEXT,
+            recorded INTEGER NOT NULL DEFAULT 0,
+            route TEXT
+        )
+    """)
+    # Job tables created before automatic routing lack the route column.
+    if "route" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+        conn.execute("ALTER TABLE jobs ADD COLUMN route TEXT")
+    return conn
+
+@contextlib.contextmanager
+def _transaction():
+    """Open a connection (see _connect), commit or roll back on exit, and close it."""
+    with contextlib.closing(_connect()) as conn, conn:
+        yield conn
+
+def submit_job(prompt, reasoning_effort="medium", model=None, route=None):
+    """Queue a query for the background worker and make sure one is running."""
+    submitted = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with _transaction() as conn:
+        cursor = conn.execute(
+            "INSERT INTO jobs (submitted, prompt, model, reasoning_effort, route) VALUES (?, ?, ?, ?, ?)",
+            (submitted, prompt, model, reasoning_effort, route)
+        )
+        job_id = cursor.lastrowid
+    ensure_worker()
+    return job_id
+
+def list_jobs(limit=20):
+    """Return the most recent jobs, newest first."""
+    with _transaction() as conn:
+        return conn.execute(
+            "SELECT id, submitted, finished, status, model, reasoning_effort, prompt "
+            "FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+def get_job(job_id):
+    """Return a job row by id, or None."""
+    with _transaction() as conn:
+        return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+def _worker_running():
+    """Return True if a worker currently holds WORKER_LOCK_FILE."""
+    with open(WORKER_LOCK_FILE, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(f, fcntl.LOCK_UN)
+    return False
+
+def ensure_worker():
+    """Start a detached worker process unless one is already running."""
+    if _worker_running():
+        return
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__)],
+        cwd=os.getcwd(),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+def _claim_next_job(conn):
+    """Mark the oldest queued job as running and return it, or None."""
+    row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+    if row is None:
+        return None
+    conn.execute("UPDATE jobs SET status = 'running' WHERE id = ?", (row["id"],))
+    conn.commit()
+    return row
+
+def run_job(job):
+    """Run one job through single_query, storing its output instead of printing it."""
+    from ai_client import single_query
+
+    out = io.StringIO()
+    try:
+        result = single_query(job["prompt"], reasoning_effort=job["reasoning_effort"],
+                              model=job["model"], stream=False, out=out, record=False, route=job["route"])
+        finished = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with _transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', finished = ?, output = ?, answer = ?, topics = ?, "
+                "model = ? WHERE id = ?",
+                (finished, out.getvalue(), result["answer"], json.dumps(result["topics"]),
+                 result["model"], job["id"])
+            )
+    except Exception as e:
+        finished = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with _transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished = ?, output = ?, error = ? WHERE id = ?",
+                (finished, out.getvalue(), str(e), job["id"])
+            )
+    record_finished_jobs()
+
+def record_finished_jobs():
+    """
+    Add finished jobs to the context in submission order. A job is only
+    recorded once every earlier job has finished, and each block keeps its
+    job's submission timestamp.
+    """
+    from memory_manager import add_to_context
+
+    with _record_lock, _transaction() as conn:
+        rows = conn.execute("SELECT * FROM jobs WHERE recorded = 0 ORDER BY id").fetchall()
+        for row in rows:
+            if row["status"] not in ("done", "failed"):
+                break
+            if row["status"] == "done":
+                add_to_context(row["prompt"], row["answer"], json.loads(row["topics"] or "[]"),
+                               row["reasoning_effort"], model=row["model"], timestamp=row["submitted"],
+                               route=row["route"])
+            conn.execute("UPDATE jobs SET recorded = 1 WHERE id = ?", (row["id"],))
+            conn.commit()
+
+def _process_queue():
+    """Run queued jobs until none are left queued or running."""
+    with contextlib.closing(_connect()) as conn, ThreadPoolExecutor(max_workers=BACKGROUND_MAX_WORKERS) as pool:
+        running = set()
+        while True:
+            while len(running) < BACKGROUND_MAX_WORKERS:
+                job = _claim_next_job(conn)
+                if job is None:
+                    break
+                running.add(pool.submit(run_job, job))
+            if not running:
+                break
+            _, running = wait(running, timeout=1, return_when=FIRST_COMPLETED)
+    record_finished_jobs()
+
+def _has_queued_jobs():
+    with _transaction() as conn:
+        return conn.execute("SELECT 1 FROM jobs WHERE status = 'queued' LIMIT 1").fetchone() is not None
+
+def run_worker():
+    """
+    Process queued jobs with at most BACKGROUND_MAX_WORKERS concurrent API
+    calls, exiting once the queue is empty. Only one worker runs at a time.
+    """
+    with open(WORKER_LOCK_FILE, "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        with _transaction() as conn:
+            # Jobs left running by a worker that died are retried.
+            conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+        while True:
+            _process_queue()
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            # A job submitted while we were finishing saw the lock held and
+            # did not start a worker, so pick it up before exiting.
+            if not _has_queued_jobs():
+                break
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                break
+
+if __name__ == "__main__":
+    run_worker()
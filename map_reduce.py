@@ -0,0 +1,173 @@
+# map_reduce.py
+
+import io
+import os
+import sys
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import (
+        MAP_REDUCE_CHUNK_TOKENS,
+        MAP_REDUCE_MAX_WORKERS
+)
+from tokenizer import count_tokens
+
+MAP_PROMPT = (
+    "You are reading part {part} of a larger input ({source}) that is too big to read at once. "
+    "Answer the request below using only this part. Quote the details the final answer will need. "
+    "If this part holds nothing relevant, say so in one line.\n\n"
+    "Request: {prompt}\n\n"
+    "Part {part}:\n{chunk}"
+)
+
+REDUCE_PROMPT = (
+    "The input ({source}) was too big to read at once, so it was split into parts and the request "
+    "was answered for each part separately. Combine these partial answers into a single answer to "
+    "the request. Drop parts that found nothing relevant and merge duplicates.\n\n"
+    "Request: {prompt}\n\n"
+    "{partials}"
+)
+
+# Bytes inspected when deciding whether a file is binary.
+BINARY_SNIFF_BYTES = 8192
+
+def _is_binary(path):
+    with open(path, "rb") as f:
+        return b"\0" in f.read(BINARY_SNIFF_BYTES)
+
+def iter_path_lines(path):
+    """
+    Yield the lines of a file, or of every text file under a directory
+    (sorted, hidden entries skipped) with a "==> name <==" line before each.
+    Files are read line by line, so nothing has to fit in memory at once.
+    """
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                if name.startswith(".") or not os.path.isfile(file_path) or _is_binary(file_path):
+                    continue
+                yield f"==> {os.path.relpath(file_path, path)} <==\n"
+                with open(file_path, errors="replace") as f:
+                    yield from f
+    else:
+        with open(path, errors="replace") as f:
+            yield from f
+
+def iter_stdin_lines():
+    """Yield the lines of standard input as they arrive."""
+    with open(sys.stdin.fileno(), errors="replace", closefd=False) as f:
+        yield from f
+
+def iter_chunks(lines, max_tokens=MAP_REDUCE_CHUNK_TOKENS):
+    """
+    Group lines into chunks of at most max_tokens. A single line longer than
+    the budget is split by characters.
+    """
+    chunk = []
+    tokens = 0
+    for line in lines:
+        line_tokens = count_tokens(line)
+        if line_tokens > max_tokens:
+            width = max(len(line) * max_tokens // line_tokens, 1)
+            pieces = [line[i:i + width] for i in range(0, len(line), width)]
+        else:
+            pieces = [line]
+        for piece in pieces:
+            piece_tokens = count_tokens(piece) if len(pieces) > 1 else line_tokens
+            if chunk and tokens + piece_tokens > max_tokens:
+                yield "".join(chunk)
+                chunk = []
+                tokens = 0
+            chunk.append(piece)
+            tokens += piece_tokens
+    if chunk:
+        yield "".join(chunk)
+
+def _progress(message):
+    sys.stderr.write(f"\r[map-reduce: {message}]")
+    sys.stderr.flush()
+
+def _answer_parts(prompts, max_workers, **kwargs):
+    """
+    Answer an iterable of self-contained prompts concurrently and return the
+    answers in input order. At most twice max_workers prompts are held at a
+    time, so a long input is consumed as the requests complete.
+    """
+    from ai_client import single_query
+
+    answers = {}
+    pending = {}
+    total = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        def collect():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                answers[pending.pop(future)] = future.result()["answer"]
+            _progress(f"{len(answers)}/{total} parts done")
+
+        for index, prompt in enumerate(prompts):
+            total += 1
+            while len(pending) >= max_workers * 2:
+                collect()
+            # single_query retries rate limits itself (see request_executor).
+            pending[pool.submit(single_query, prompt, out=io.StringIO(), stream=False,
+                                record=False, include_context=False, **kwargs)] = index
+        while pending:
+            collect()
+    sys.stderr.write("\n")
+    return [answers[index] for index in range(total)]
+
+def _format_partials(partials, first=1):
+    return "\n\n".join(f"--- Part {first + i} ---\n{answer}" for i, answer in enumerate(partials))
+
+def run_map_reduce(prompt, lines, source, reasoning_effort="medium", debug=False, model=None,
+                   stream=None, cache=True, refresh=False, max_workers=MAP_REDUCE_MAX_WORKERS,
+                   chunk_tokens=MAP_REDUCE_CHUNK_TOKENS):
+    """
+    Answer prompt over input too large for one request. The lines are split
+    into chunks of chunk_tokens, each chunk is answered on its own
+    (concurrently, max_workers at a time) and the partial answers are
+    reduced, in rounds if they do not fit in one request, into a final
+    answer. Only the final exchange is printed and added to the context.
+    """
+    from ai_client import single_query
+    from memory_manager import add_to_context
+
+    chunks = iter_chunks(lines, chunk_tokens)
+    first = next(chunks, None)
+    if first is None:
+        print(f"Nothing to read from {source}.")
+        return None
+    second = next(chunks, None)
+    part_options = {"reasoning_effort": reasoning_effort, "model": model, "cache": cache, "refresh": refresh}
+
+    if second is None:
+        # Small enough for one request after all.
+        final_prompt = f"{prompt}\n\n{first}"
+        parts = 1
+    else:
+        map_prompts = (MAP_PROMPT.format(part=part, source=source, prompt=prompt, chunk=chunk)
+                       for part, chunk in enumerate(itertools.chain([first, second], chunks), start=1))
+        partials = _answer_parts(map_prompts, max_workers, **part_options)
+        parts = len(partials)
+        # Reduce in rounds until the partial answers fit in one request.
+        while count_tokens(_format_partials(partials)) > chunk_tokens and len(partials) > 1:
+            groups = []
+            for partial in partials:
+                if groups and count_tokens(_format_partials(groups[-1] + [partial])) <= chunk_tokens:
+                    groups[-1].append(partial)
+                else:
+                    groups.append([partial])
+            if len(groups) == len(partials):
+                break
+            partials = _answer_parts(
+                (REDUCE_PROMPT.format(source=source, prompt=prompt, partials=_format_partials(group))
+                 for group in groups),
+                max_workers, **part_options)
+        final_prompt = REDUCE_PROMPT.format(source=source, prompt=prompt, partials=_format_partials(partials))
+
+    result = single_query(final_prompt, debug=debug, stream=stream, record=False, **part_options)
+    add_to_context(f"{prompt} [map-reduce over {source}: {parts} parts]", result["answer"],
+                   result["topics"], reasoning_effort, model=result["model"])
+    return result
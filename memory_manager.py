@@ -1,15 +1,44 @@
 # memory_manager.py
 
 import sys
-import os
 import datetime
 import re
 import json
 import subprocess
-from config import MODEL, CONTEXT_FILE, PERMANENT_MEMORY_FILE, DELIMITER, MAX_CONTEXT_TOKENS
+from config import (
+        MODEL,
+        DELIMITER,
+        MAX_CONTEXT_TOKENS,
+        CONTEXT_RECENT_CANDIDATES,
+        CONTEXT_RELEVANT_CANDIDATES,
+        CONTEXT_HALF_LIFE_HOURS,
+        RELEVANCE_WEIGHT,
+        RECENCY_WEIGHT
+)
+from context_store import (
+        read_blocks,
+        append_block,
+        recent_blocks,
+        score_blocks,
+        read_block_texts,
+        tokenize,
+        iter_blocks_reversed,
+        tail_blocks,
+        search_block_ids
+)
+from retention import digest_context, maintain_context
+from tokenizer import count_tokens
+import permanent_store
+import blob_store
 
 REQUIRED_PERMANENT_MEMORIES = ["name", "topics_of_interest"]
 
+# Matches the "[<model> - <effort>] <answer>" part of a context block.
+ANSWER_PATTERN = re.compile(r"^\[[^\]\n]+ - [^\]\n]+\] (.*?)(?:\nTopic Tags: [^\n]*)?\Z", re.MULTILINE | re.DOTALL)
+
+# Bookkeeping keys of a permanent memory entry that are not part of the memory.
+MEMORY_METADATA_KEYS = ("id", "timestamp", "tokens")
+
 def get_neofetch_output():
     try:
         # Run neofetch with the --stdout flag to capture its output.
@@ -19,37 +48,24 @@ def get_neofetch_output():
         return f"Neofetch output unavailable: {e}"
 
 def estimate_tokens(text):
-    """Estimate token count by splitting text on whitespace."""
-    return len(text.split())
+    """Count tokens with the configured tokenizer backend."""
+    return count_tokens(text)
 
 def load_context_blocks():
     """Load context blocks from CONTEXT_FILE as a list of blocks."""
-    if not os.path.exists(CONTEXT_FILE):
-        return []
-    with open(CONTEXT_FILE, "r", encoding="utf-8") as f:
-        content = f.read().strip()
-    return content.split(DELIMITER) if content else []
+    return [text for _, text in read_blocks()]
 
 def save_context_block(block):
     """Append a block to CONTEXT_FILE."""
-    with open(CONTEXT_FILE, "a", encoding="utf-8") as f:
-        f.write(block + DELIMITER)
+    append_block(block)
 
 def load_permanent_memories():
-    """Load permanent memories from PERMANENT_MEMORY_FILE as a list of entries."""
-    if not os.path.exists(PERMANENT_MEMORY_FILE):
-        return []
-    with open(PERMANENT_MEMORY_FILE, "r", encoding="utf-8") as f:
-        try:
-            memories = json.load(f)
-            return memories if isinstance(memories, list) else []
-        except json.JSONDecodeError:
-            return []
+    """Load permanent memories (snapshot plus operation log) as a list of entries."""
+    return [dict(mem) for mem in permanent_store.load()]
 
 def save_permanent_memories(memories):
-    """Save the list of permanent memories to PERMANENT_MEMORY_FILE."""
-    with open(PERMANENT_MEMORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(memories, f, indent=2)
+    """Replace all permanent memories with the given list, atomically."""
+    permanent_store.replace_all(memories)
 
 def add_permanent_memory(memory_data):
     # If a string is passed, require a colon-separated key-value pair.
@@ -63,45 +79,58 @@ def add_permanent_memory(memory_data):
         value = value.strip()
         memory_data = {key: value}
     
-    memories = load_permanent_memories()
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    entry = {"id": len(memories) + 1, "timestamp": timestamp}
+    entry = {"timestamp": timestamp}
     entry.update(memory_data)
-    memories.append(entry)
-    save_permanent_memories(memories)
-    return entry
+    # Count the rendered context line once, at write time.
+    entry["tokens"] = estimate_tokens(format_permanent_memory(entry))
+    # The store assigns the next stable id under its lock.
+    return permanent_store.add(entry)
 
 def ensure_required_permanent_memories():
     memories = load_permanent_memories()
     for key in REQUIRED_PERMANENT_MEMORIES:
         # Check if any memory entry contains this key.
         if not any(key in mem for mem in memories):
+            # Piped stdin is the query's input, so there is nobody to ask.
+            if not sys.stdin.isatty():
+                print(f"Permanent memory for '{key}' not found. Run gpt interactively to set it.",
+                      file=sys.stderr)
+                continue
             # If not, prompt the user for the value.
             value = input(f"Permanent memory for '{key}' not found. Please provide your {key}: ")
-            add_permanent_memory({key: value})
+            try:
+                add_permanent_memory({key: value})
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                return
             print(f"Added permanent memory for '{key}'.")
 
+def memory_text(mem):
+    """Return the text of a permanent memory entry without its bookkeeping keys."""
+    if "text" in mem:
+        return mem["text"]
+    return "; ".join(f"{k}: {v}" for k, v in mem.items() if k not in MEMORY_METADATA_KEYS)
+
+def format_permanent_memory(mem):
+    """Format a permanent memory entry as a context line."""
+    return f"[{mem['timestamp']}] (PERMANENT) {memory_text(mem)}"
+
 def view_permanent_memory():
     """Return a list of permanent memory entries as formatted strings."""
     memories = load_permanent_memories()
     lines = []
     for mem in memories:
-        display_text = mem.get("text")
-        if not display_text:
-            # Combine all keys except 'id' and 'timestamp'
-            display_text = "; ".join(f"{k}: {v}" for k, v in mem.items() if k not in ("id", "timestamp"))
+        display_text = memory_text(mem)
         lines.append(f"[{mem['id']}] ({mem['timestamp']}) {display_text}")
     return lines
 
 def forget_permanent_memory(entry_id):
-    """Remove a permanent memory entry by its id."""
-    memories = load_permanent_memories()
-    new_memories = [mem for mem in memories if mem["id"] != entry_id]
-    # Reassign IDs sequentially
-    for idx, mem in enumerate(new_memories, start=1):
-        mem["id"] = idx
-    save_permanent_memories(new_memories)
-    return new_memories
+    """
+    Remove a permanent memory entry by its id. IDs are stable, so the other
+    entries keep theirs. Returns False if there was no such entry.
+    """
+    return permanent_store.forget(entry_id)
 
 def export_permanent_memory(output_file):
     """Export permanent memories to the specified file in JSON format."""
@@ -110,83 +139,170 @@ def export_permanent_memory(output_file):
         json.dump(memories, f, indent=2)
     return output_file
 
-def prune_context(user_prompt):
+def rank_context_blocks(user_prompt, now=None):
+    """
+    Rank candidate blocks by combined relevance and recency, best first.
+    Candidates are the newest CONTEXT_RECENT_CANDIDATES blocks plus the
+    CONTEXT_RELEVANT_CANDIDATES best BM25 matches for user_prompt.
+
+    Returns a list of (score, block_id, timestamp, tokens).
+    """
+    now = now or datetime.datetime.now()
+    relevance = score_blocks(user_prompt)
+    best_matches = sorted(relevance.items(), key=lambda item: item[1][0], reverse=True)
+    candidates = dict(best_matches[:CONTEXT_RELEVANT_CANDIDATES])
+    for block_id, timestamp, tokens in recent_blocks(CONTEXT_RECENT_CANDIDATES):
+        candidates.setdefault(block_id, (0.0, timestamp, tokens))
+
+    top_relevance = max((score for score, _, _ in candidates.values()), default=0.0) or 1.0
+    ranked = []
+    for block_id, (bm25, timestamp, tokens) in candidates.items():
+        recency = 0.0
+        if timestamp:
+            try:
+                block_time = datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+                age_hours = max((now - block_time).total_seconds() / 3600, 0.0)
+                recency = 0.5 ** (age_hours / CONTEXT_HALF_LIFE_HOURS)
+            except ValueError:
+                pass
+        score = RELEVANCE_WEIGHT * bm25 / top_relevance + RECENCY_WEIGHT * recency
+        ranked.append((score, block_id, timestamp, tokens))
+    # Ties (e.g. no relevant matches) favour the newest block.
+    ranked.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return ranked
+
+# Rendered permanent context keyed by the store's state, re-rendered only
+# after the snapshot or the operation log changes.
+_permanent_context_cache = {}
+
+def build_permanent_context():
+    """Return the permanent memories rendered as context lines, and their token count."""
+    key = permanent_store.state_key()
+    if _permanent_context_cache.get("key") == key:
+        return _permanent_context_cache["value"]
+    perm_texts = []
+    tokens = 0
+    for mem in permanent_store.load():
+        line = format_permanent_memory(mem)
+        perm_texts.append(line)
+        tokens += mem["tokens"] if "tokens" in mem else estimate_tokens(line)
+    value = ("\n".join(perm_texts), tokens)
+    _permanent_context_cache.update(key=key, value=value)
+    return value
+
+def prune_context(user_prompt, include_permanent=True, sent_blobs=None):
     """
     Assemble context for the AI prompt in prioritized order:
       1. Permanent memories (always included)
-      2. Recent context blocks (within the last hour)
-    Older blocks can be added if there’s remaining token space.
+      2. Digests of rotated periods, newest first up to CONTEXT_DIGEST_TOKENS
+      3. Context blocks ranked by relevance to user_prompt and recency
+    Blocks are packed greedily from the best score down; a block that does
+    not fit is skipped so smaller, lower-ranked blocks can still use the
+    remaining budget. Selected blocks are presented in chronological order.
+    With include_permanent=False the permanent memories still count against
+    the budget but are left out of the text, for callers that send them as
+    a separate message.
+    Blob references in the selected blocks are expanded, each distinct blob
+    once; the ids of the expanded blobs are added to sent_blobs so the
+    caller can do the same for the prompt.
     
     Returns:
       pruned_context (str), count of selected non-permanent blocks,
-      a dummy aggregated topic_tags, and the oldest timestamp found.
+      the prompt terms matched in the selection, the oldest timestamp found,
+      and the token count of the returned context.
     """
     now = datetime.datetime.now()
 
-    # Load permanent memories and format them as context blocks.
-    permanent_memories = load_permanent_memories()
-    perm_texts = []
-    for mem in permanent_memories:
-        if "text" in mem:
-            text_value = mem["text"]
-        else:
-            # Combine any keys besides 'id' and 'timestamp'
-            other_keys = [f"{k}: {v}" for k, v in mem.items() if k not in ("id", "timestamp")]
-            text_value = "; ".join(other_keys)
-        perm_texts.append(f"[{mem['timestamp']}] (PERMANENT) {text_value}")
-    permanent_context = "\n".join(perm_texts)
-
-    blocks = load_context_blocks()
-    selected_blocks = []
-    accumulated_tokens = estimate_tokens(permanent_context)
-
-    for block in blocks:
-        # Check if block is recent (within last hour)
-        is_recent = False
-        m_time = re.search(r"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]", block)
-        if m_time:
-            try:
-                block_time = datetime.datetime.strptime(m_time.group(1), "%Y-%m-%d %H:%M:%S")
-                if now - block_time <= datetime.timedelta(hours=1):
-                    is_recent = True
-            except Exception:
-                pass
-        if is_recent:
-            tokens = estimate_tokens(block)
-            if accumulated_tokens + tokens > MAX_CONTEXT_TOKENS:
-                break
-            selected_blocks.append(block)
-            accumulated_tokens += tokens
+    permanent_context, permanent_tokens = build_permanent_context()
+    accumulated_tokens = permanent_tokens
+    if not include_permanent:
+        permanent_context = ""
+    digests, digest_tokens, _ = digest_context()
+    accumulated_tokens += digest_tokens
+
+    # Pack on the token counts stored at write time; only selected blocks are read.
+    selected = []
+    for _, block_id, block_time, tokens in rank_context_blocks(user_prompt, now):
+        if accumulated_tokens + tokens > MAX_CONTEXT_TOKENS:
+            continue
+        selected.append((block_id, block_time))
+        accumulated_tokens += tokens
+    selected.sort()
+    texts = read_block_texts([block_id for block_id, _ in selected])
+    selected_blocks = [texts[block_id] for block_id, _ in selected if block_id in texts]
+    sent_blobs = set() if sent_blobs is None else sent_blobs
+    expanded_blocks = [blob_store.expand(block, sent_blobs) for block in selected_blocks]
 
     # Assemble final context: permanent memories come first.
     pruned_context = permanent_context
     if permanent_context:
         pruned_context += "\n" + DELIMITER
-    pruned_context += DELIMITER.join(selected_blocks)
-
-    # Dummy topic tags and oldest timestamp calculation.
-    topic_tags = "permanent, recent" if selected_blocks else "permanent"
-    oldest_timestamp = "None"
-    if selected_blocks:
-        times = []
-        for block in selected_blocks:
-            m_time = re.search(r"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]", block)
-            if m_time:
-                try:
-                    t = datetime.datetime.strptime(m_time.group(1), "%Y-%m-%d %H:%M:%S")
-                    times.append(t)
-                except Exception:
-                    pass
-        if times:
-            oldest_timestamp = min(times).strftime("%Y-%m-%d %H:%M:%S")
-    return pruned_context, len(selected_blocks), topic_tags, oldest_timestamp
-
-def add_to_context(user_prompt, answer_text, topics, reasoning_effort="medium"):
+    if digests:
+        pruned_context += digests + "\n" + DELIMITER
+    pruned_context += DELIMITER.join(expanded_blocks)
+
+    selected_terms = set()
+    for block in selected_blocks:
+        selected_terms.update(tokenize(block))
+    matched_terms = sorted(set(tokenize(user_prompt)) & selected_terms)
+    topic_tags = ", ".join(matched_terms) if matched_terms else "None"
+    selected_times = [block_time for _, block_time in selected if block_time]
+    oldest_timestamp = min(selected_times) if selected_times else "None"
+    if not include_permanent:
+        accumulated_tokens -= permanent_tokens
+    return pruned_context, len(selected_blocks), topic_tags, oldest_timestamp, accumulated_tokens
+
+def add_to_context(user_prompt, answer_text, topics, reasoning_effort="medium", model=None, timestamp=None,
+                   route=None):
     """
     Append a new conversation block to the context file.
+    timestamp defaults to now; background jobs pass their submission time.
+    route is the router's label for auto-routed queries, kept after the effort.
     """
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if not timestamp:
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    model = model or MODEL
     topics_str = ", ".join(topics) if topics else "None"
-    block = f"[{timestamp}]\n>>> {user_prompt}\n[{MODEL} - {reasoning_effort}] {answer_text}\nTopic Tags: {topics_str}"
+    effort = f"{reasoning_effort}, {route}" if route else reasoning_effort
+    block = f"[{timestamp}]\n>>> {user_prompt}\n[{model} - {effort}] {answer_text}\nTopic Tags: {topics_str}"
     save_context_block(block)
+    maintain_context()
+
+
+def block_answer(block):
+    """Return the model's answer from a context block, or None if it has none."""
+    m_answer = ANSWER_PATTERN.search(block)
+    return m_answer.group(1) if m_answer else None
+
+def tail_context(count=10):
+    """Return the last count context blocks, oldest first."""
+    return tail_blocks(count)
+
+def repeat_response(selector="1"):
+    """
+    Return a previous answer. A number N selects the Nth last unique answer;
+    any other text selects the latest answer whose block matches it in the
+    topic-tag and term index. Returns None when nothing matches.
+    """
+    if str(selector).isdigit():
+        wanted = max(int(selector), 1)
+        seen = set()
+        for block in iter_blocks_reversed():
+            answer = block_answer(block)
+            if answer is None or answer in seen:
+                continue
+            seen.add(answer)
+            if len(seen) == wanted:
+                return answer
+        return None
+    block_ids = search_block_ids(selector, limit=1)
+    if not block_ids:
+        return None
+    block = read_block_texts(block_ids).get(block_ids[0])
+    return block_answer(block) if block else None
 
+def grep_context(query, limit=None):
+    """Return the context blocks matching every term of query, oldest first."""
+    block_ids = search_block_ids(query, limit)
+    texts = read_block_texts(sorted(block_ids))
+    return [texts[block_id] for block_id in sorted(block_ids) if block_id in texts]
@@ -0,0 +1,230 @@
+# metrics.py
+
+import os
+import json
+import time
+import fcntl
+import datetime
+import threading
+from types import SimpleNamespace
+from contextlib import contextmanager
+from config import METRICS_FILE, METRICS_MAX_BYTES, METRICS_BACKUPS
+from startup_profile import span
+
+METRICS_LOCK_FILE = METRICS_FILE + ".lock"
+
+# The timer of the query running on this thread, so nested code (such as
+# the neofetch call behind the system message) can report its own phase.
+_local = threading.local()
+
+class QueryTimer:
+    """Per-phase durations, in milliseconds, of one query."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = round(self.phases.get(name, 0.0) + seconds * 1000, 2)
+
+    def since_start(self):
+        return time.perf_counter() - self.started
+
+@contextmanager
+def query_timer():
+    """Make a new QueryTimer current on this thread for the duration of a query."""
+    previous = getattr(_local, "timer", None)
+    timer = QueryTimer()
+    _local.timer = timer
+    try:
+        yield timer
+    finally:
+        _local.timer = previous
+
+@contextmanager
+def phase(name):
+    """
+    Time a phase of the current query (if any) and of the startup profile
+    (if enabled). Repeated phases add up.
+    """
+    timer = getattr(_local, "timer", None)
+    start = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        if timer is not None:
+            timer.add(name, time.perf_counter() - start)
+
+def record_phase(name, seconds):
+    """Record a duration measured by the caller for the current query."""
+    timer = getattr(_local, "timer", None)
+    if timer is not None:
+        timer.add(name, seconds)
+
+def usage_fields(usage):
+    """Extract the token counts we track from an API usage object."""
+    if usage is None:
+        return {}
+    # Realtime sessions report input/output tokens instead of prompt/completion.
+    prompt_details = (getattr(usage, "prompt_tokens_details", None)
+                      or getattr(usage, "input_token_details", None))
+    completion_details = getattr(usage, "completion_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None) or 0,
+        "cached_tokens": getattr(prompt_details, "cached_tokens", None) or 0,
+        "completion_tokens": (getattr(usage, "completion_tokens", None)
+                              or getattr(usage, "output_tokens", None) or 0),
+        "reasoning_tokens": getattr(completion_details, "reasoning_tokens", None) or 0,
+        "total_tokens": usage.total_tokens,
+    }
+
+def combine_usage(usages):
+    """
+    Add up the usage of several requests made for one query (such as the
+    rounds of a web search) into a single usage object.
+    """
+    usages = [usage for usage in usages if usage is not None]
+    if len(usages) <= 1:
+        return usages[0] if usages else None
+    totals = {}
+    for usage in usages:
+        for name, value in usage_fields(usage).items():
+            totals[name] = totals.get(name, 0) + value
+    return SimpleNamespace(
+        prompt_tokens=totals["prompt_tokens"],
+        prompt_tokens_details=SimpleNamespace(cached_tokens=totals["cached_tokens"]),
+        completion_tokens=totals["completion_tokens"],
+        completion_tokens_details=SimpleNamespace(reasoning_tokens=totals["reasoning_tokens"]),
+        total_tokens=totals["total_tokens"],
+    )
+
+def _rotate_locked():
+    """Shift METRICS_FILE to .1, .1 to .2 and so on, dropping the oldest."""
+    for index in range(METRICS_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{METRICS_FILE}.{index}"):
+            os.replace(f"{METRICS_FILE}.{index}", f"{METRICS_FILE}.{index + 1}")
+    if METRICS_BACKUPS:
+        os.replace(METRICS_FILE, f"{METRICS_FILE}.1")
+    else:
+        os.unlink(METRICS_FILE)
+
+def record_usage(model, reasoning_effort, usage, phases=None, cache=None, route=None):
+    """
+    Append one query's token usage, phase timings (ms), response cache
+    outcome and router label to METRICS_FILE as a JSON line. The file is rotated once it
+    exceeds METRICS_MAX_BYTES, keeping METRICS_BACKUPS old files.
+    """
+    if usage is None and not phases:
+        return
+    record = {
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "model": model,
+        "reasoning_effort": reasoning_effort,
+        "usage": usage_fields(usage),
+    }
+    if phases:
+        record["phases"] = phases
+    if cache:
+        record["cache"] = cache
+    if route:
+        record["route"] = route
+    with open(METRICS_LOCK_FILE, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(METRICS_FILE) and os.path.getsize(METRICS_FILE) >= METRICS_MAX_BYTES:
+                _rotate_locked()
+            with open(METRICS_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def read_metrics():
+    """Yield the records of METRICS_FILE and its rotated copies, oldest first."""
+    paths = [f"{METRICS_FILE}.{index}" for index in range(METRICS_BACKUPS, 0, -1)] + [METRICS_FILE]
+    for path in paths:
+        try:
+            f = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+def recent_metrics(limit):
+    """
+    Return up to the last limit records of METRICS_FILE, read from its end
+    so the cost does not grow with the file.
+    """
+    try:
+        f = open(METRICS_FILE, "rb")
+    except FileNotFoundError:
+        return []
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        # Records are well under 2 KiB each.
+        start = max(size - limit * 2048, 0)
+        f.seek(start)
+        lines = f.read().splitlines()
+    if start:
+        lines = lines[1:]
+    records = []
+    for line in lines[-limit:]:
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return records
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    rank = max(int(-(-fraction * len(values) // 1)), 1)
+    return values[rank - 1]
+
+def phase_stats(records=None):
+    """
+    Group phase timings by (model, reasoning effort) and summarize them.
+    Returns {(model, effort): {"queries": n, "cache_hits": n,
+    "phases": {phase: {"count", "p50", "p95", "p99"}}}}.
+    """
+    groups = {}
+    for record in records if records is not None else read_metrics():
+        if not record.get("phases"):
+            continue
+        group = groups.setdefault((record.get("model"), record.get("reasoning_effort")),
+                                  {"queries": 0, "cache_hits": 0, "samples": {}})
+        group["queries"] += 1
+        group["cache_hits"] += record.get("cache") == "hit"
+        for name, value in record["phases"].items():
+            group["samples"].setdefault(name, []).append(value)
+
+    stats = {}
+    for key, group in groups.items():
+        phases = {}
+        for name, samples in group["samples"].items():
+            samples.sort()
+            phases[name] = {
+                "count": len(samples),
+                "p50": percentile(samples, 0.50),
+                "p95": percentile(samples, 0.95),
+                "p99": percentile(samples, 0.99),
+            }
+        stats[key] = {"queries": group["queries"], "cache_hits": group["cache_hits"], "phases": phases}
+    return stats
+
+def format_phase_stats(stats):
+    """Render phase_stats() as one table per (model, reasoning effort)."""
+    lines = []
+    for (model, effort), group in sorted(stats.items(), key=lambda item: tuple(map(str, item[0]))):
+        lines.append(f"[{model} - {effort}] {group['queries']} queries, {group['cache_hits']} cache hits")
+        lines.append(f"  {'phase':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, summary in group["phases"].items():
+            lines.append(f"  {name:<16}{summary['count']:>7}{summary['p50']:>10.1f}"
+                         f"{summary['p95']:>10.1f}{summary['p99']:>10.1f}")
+        lines.append("")
+    return "\n".join(lines).rstrip("\n")
@@ -0,0 +1,330 @@
+# mock_server.py
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+MOCK_ANSWER = {
+    "answer": "Use `tar -xf archive.tar` to extract an archive into the current directory.",
+    "topics": ["linux", "tar", "archives"],
+    "reasoning_tokens": 0
+}
+
+class MockSettings:
+    """Behaviour of a mock server, shared by its request handlers."""
+
+    def __init__(self, latency=0.0, chunk_delay=0.0, chunk_size=8, answer=None,
+                 fail_first=0, fail_rate=0.0, fail_status=503, retry_after=None,
+                 stall_first=0, stall_rate=0.0, stall=30.0, seed=None, tool_calls=0):
+        self.latency = latency          # seconds before the response starts
+        self.chunk_delay = chunk_delay  # seconds between streamed chunks
+        self.chunk_size = chunk_size    # characters of content per chunk
+        self.content = json.dumps(answer or MOCK_ANSWER)
+        # Fault injection: the first fail_first requests (then a fail_rate
+        # share) get an error status, with a Retry-After header if set; the
+        # first stall_first requests (then a stall_rate share) wait stall
+        # seconds before the response starts.
+        self.fail_first = fail_first
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.stall_first = stall_first
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.random = random.Random(seed)
+        # When the request offers tools and has no tool results yet, answer
+        # with this many web_search calls instead.
+        self.tool_calls = tool_calls
+        self.requests = 0
+        self.lock = threading.Lock()
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Answers POST /v1/chat/completions the way the OpenAI API does, with a
+    fixed structured answer, streamed as server-sent events when asked.
+    """
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; do not let Nagle hold the body back.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the request (a timeout or a hedge that lost).
+            pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        settings = self.server.settings
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body.", "type": "invalid_request_error"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}.", "type": "not_found"}})
+            return
+        with settings.lock:
+            settings.requests += 1
+            number = settings.requests
+            fail = number <= settings.fail_first or settings.random.random() < settings.fail_rate
+            stall = number <= settings.stall_first or settings.random.random() < settings.stall_rate
+
+        if fail:
+            headers = {"Retry-After": str(settings.retry_after)} if settings.retry_after is not None else {}
+            error_type = "rate_limit_exceeded" if settings.fail_status == 429 else "server_error"
+            self._send_json(settings.fail_status, {"error": {
+                "message": f"Injected failure for request {number}.", "type": error_type}}, headers)
+            return
+        if stall:
+            time.sleep(settings.stall)
+        time.sleep(settings.latency)
+        messages = request.get("messages", [])
+        tool_results = [m for m in messages if m.get("role") == "tool"]
+        tool_calls = []
+        content = settings.content
+        if request.get("tools") and settings.tool_calls and not tool_results:
+            prompt = str(messages[-1].get("content", "")) if messages else ""
+            tool_calls = [{"id": f"call_{number}_{index}", "type": "function", "function": {
+                "name": "web_search", "arguments": json.dumps({"query": f"{prompt[:60]} {index}"})}}
+                for index in range(settings.tool_calls)]
+            content = None
+        elif tool_results:
+            answer = json.loads(settings.content)
+            answer["answer"] += f" (Based on {len(tool_results)} search results.)"
+            content = json.dumps(answer)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        completion_tokens = len(content or json.dumps(tool_calls)) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+            "completion_tokens_details": {"reasoning_tokens": 0},
+        }
+        base = {"id": f"chatcmpl-mock-{number}", "created": int(time.time()),
+                "model": request.get("model", "mock")}
+
+        finish_reason = "tool_calls" if tool_calls else "stop"
+
+        if not request.get("stream"):
+            message = {"role": "assistant", "content": content}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            self._send_json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                "index": 0,
+                "message": message,
+                "finish_reason": finish_reason
+            }]))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def event(payload):
+            self.wfile.write(b"data: " + payload.encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        def delta_event(delta):
+            event(json.dumps(dict(base, object="chat.completion.chunk", choices=[
+                {"index": 0, "delta": delta, "finish_reason": None}])))
+
+        for index, call in enumerate(tool_calls):
+            # The call's id and name first, then its arguments in pieces.
+            delta_event({"role": "assistant", "tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                                              "function": {"name": "web_search", "arguments": ""}}]})
+            arguments = call["function"]["arguments"]
+            for start in range(0, len(arguments), settings.chunk_size):
+                delta_event({"tool_calls": [{"index": index, "function": {
+                    "arguments": arguments[start:start + settings.chunk_size]}}]})
+        for start in range(0, len(content or ""), settings.chunk_size):
+            if start:
+                time.sleep(settings.chunk_delay)
+            delta = {"content": content[start:start + settings.chunk_size]}
+            if not start:
+                delta["role"] = "assistant"
+            delta_event(delta)
+        event(json.dumps(dict(base, object="chat.completion.chunk", choices=[
+            {"index": 0, "delta": {}, "finish_reason": finish_reason}])))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            event(json.dumps(dict(base, object="chat.completion.chunk", choices=[], usage=usage)))
+        event("[DONE]")
+        self.close_connection = True
+
+def realtime_session(connection, settings):
+    """
+    Serve one realtime API WebSocket the way the OpenAI realtime API does
+    for text: session.update, conversation.item.create and response.create
+    are answered with their events, and each response echoes the last user
+    message back as text deltas.
+    """
+    with settings.lock:
+        settings.requests += 1
+        number = settings.requests
+    counter = iter(range(1, 1 << 31))
+    session = {"id": f"sess_mock{number}", "object": "realtime.session", "model": "mock-realtime",
+               "modalities": ["text"], "instructions": ""}
+    last_text = ""
+
+    def send(event_type, **fields):
+        connection.send(json.dumps(dict(fields, type=event_type, event_id=f"event_{number}_{next(counter)}")))
+
+    send("session.created", session=session)
+    for message in connection:
+        try:
+            event = json.loads(message)
+        except json.JSONDecodeError:
+            send("error", error={"type": "invalid_request_error", "message": "Invalid JSON event."})
+            continue
+        if event.get("type") == "session.update":
+            session.update(event.get("session", {}))
+            send("session.updated", session=session)
+        elif event.get("type") == "conversation.item.create":
+            item = dict(event.get("item", {}), id=f"item_{number}_{next(counter)}", status="completed")
+            last_text = " ".join(part.get("text", "") for part in item.get("content", []))
+            send("conversation.item.created", previous_item_id=None, item=item)
+        elif event.get("type") == "response.create":
+            response_id = f"resp_{number}_{next(counter)}"
+            item_id = f"item_{number}_{next(counter)}"
+            send("response.created", response={"id": response_id, "object": "realtime.response",
+                                               "status": "in_progress", "output": []})
+            time.sleep(settings.latency)
+            text = f"You asked: {last_text}"
+            for start in range(0, len(text), settings.chunk_size):
+                if start:
+                    time.sleep(settings.chunk_delay)
+                send("response.text.delta", response_id=response_id, item_id=item_id, output_index=0,
+                     content_index=0, delta=text[start:start + settings.chunk_size])
+            send("response.text.done", response_id=response_id, item_id=item_id, output_index=0,
+                 content_index=0, text=text)
+            input_tokens = (len(session.get("instructions", "")) + len(last_text)) // 4
+            send("response.done", response={
+                "id": response_id, "object": "realtime.response", "status": "completed",
+                "output": [{"id": item_id, "object": "realtime.item", "type": "message", "role": "assistant",
+                            "status": "completed", "content": [{"type": "text", "text": text}]}],
+                "usage": {"input_tokens": input_tokens, "output_tokens": len(text) // 4,
+                          "total_tokens": input_tokens + len(text) // 4,
+                          "input_token_details": {"cached_tokens": 0, "text_tokens": input_tokens,
+                                                  "audio_tokens": 0},
+                          "output_token_details": {"text_tokens": len(text) // 4, "audio_tokens": 0}}
+            })
+        else:
+            send("error", error={"type": "invalid_request_error",
+                                 "message": f"Unsupported event type {event.get('type')!r}."})
+
+def start_realtime_server(port=0, **settings):
+    """
+    Serve the realtime API stub on 127.0.0.1:port (a free port by default)
+    from a daemon thread. Needs the websockets package, as --fast does.
+    Returns (server, base URL for OPENAI_WEBSOCKET_BASE_URL).
+    """
+    from websockets.exceptions import ConnectionClosed
+    from websockets.sync.server import serve
+
+    settings = MockSettings(**settings)
+
+    def handler(connection):
+        try:
+            realtime_session(connection, settings)
+        except ConnectionClosed:
+            pass
+
+    server = serve(handler, "127.0.0.1", port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"ws://127.0.0.1:{server.socket.getsockname()[1]}/v1"
+
+def fake_search(query, k=5):
+    """
+    Search backend for tests (CLIGPT_SEARCH_BACKEND=mock_server.fake_search):
+    k made-up results derived from the query, without any network access.
+    """
+    return [{"title": f"Result {number} for {query}",
+             "url": f"https://example.com/{number}?q={'+'.join(query.split())}",
+             "snippet": f"Snippet {number} about {query}."}
+            for number in range(1, k + 1)]
+
+def start_mock_server(port=0, **settings):
+    """
+    Serve on 127.0.0.1:port (a free port by default) from a daemon thread.
+    Returns (server, base URL for OPENAI_BASE_URL).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+    server.daemon_threads = True
+    server.settings = MockSettings(**settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server.")
+    parser.add_argument("--port", type=int, default=8700, help="Port to listen on (default 8700)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds to wait before responding (default 0)")
+    parser.add_argument("--chunk-delay", type=float, default=0.0,
+                        help="Seconds between streamed chunks (default 0)")
+    parser.add_argument("--chunk-size", type=int, default=8,
+                        help="Characters of content per streamed chunk (default 8)")
+    parser.add_argument("--fail-first", type=int, default=0,
+                        help="Answer the first N requests with an error status")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Share of later requests answered with an error status")
+    parser.add_argument("--fail-status", type=int, default=503,
+                        help="Status of injected errors (default 503; 429 for rate limits)")
+    parser.add_argument("--retry-after", type=int, default=None,
+                        help="Retry-After seconds sent with injected errors")
+    parser.add_argument("--stall-first", type=int, default=0,
+                        help="Stall the first N requests before responding")
+    parser.add_argument("--stall-rate", type=float, default=0.0,
+                        help="Share of later requests that stall")
+    parser.add_argument("--stall", type=float, default=30.0,
+                        help="Seconds a stalled request waits (default 30)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the injected faults")
+    parser.add_argument("--tool-calls", type=int, default=0,
+                        help="Answer requests that offer tools with N web_search calls first")
+    parser.add_argument("--realtime-port", type=int, default=0,
+                        help="Also serve the realtime WebSocket stub for --fast on this port (e.g. 8765)")
+    args = parser.parse_args()
+    server, base_url = start_mock_server(args.port, latency=args.latency,
+                                         chunk_delay=args.chunk_delay, chunk_size=args.chunk_size,
+                                         fail_first=args.fail_first, fail_rate=args.fail_rate,
+                                         fail_status=args.fail_status, retry_after=args.retry_after,
+                                         stall_first=args.stall_first, stall_rate=args.stall_rate,
+                                         stall=args.stall, seed=args.seed, tool_calls=args.tool_calls)
+    print(f"Mock server listening; set OPENAI_BASE_URL={base_url}", file=sys.stderr)
+    realtime_server = None
+    if args.realtime_port:
+        try:
+            realtime_server, websocket_url = start_realtime_server(args.realtime_port, latency=args.latency,
+                                                                   chunk_delay=args.chunk_delay,
+                                                                   chunk_size=args.chunk_size)
+            print(f"Realtime stub listening; set OPENAI_WEBSOCKET_BASE_URL={websocket_url}", file=sys.stderr)
+        except ImportError:
+            print("Realtime stub not started: the websockets package is not installed", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        if realtime_server is not None:
+            realtime_server.shutdown()
+
+if __name__ == "__main__":
+    main()
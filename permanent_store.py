@@ -0,0 +1,206 @@
+# permanent_store.py
+
+import os
+import sys
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+from config import PERMANENT_MEMORY_FILE, PERMANENT_MEMORY_LOG, PERMANENT_MEMORY_COMPACT_OPS
+
+LOCK_FILE = PERMANENT_MEMORY_FILE + ".lock"
+
+# Parsed state keyed by the (mtime, size) of the snapshot and the log, so
+# long-lived processes such as the daemon only re-read them after a change.
+_cache = {}
+_cache_lock = threading.Lock()
+
+@contextmanager
+def store_lock(shared=False):
+    """Hold an advisory lock on the store, shared for readers."""
+    with open(LOCK_FILE, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def state_key():
+    """Return a key that changes whenever the snapshot or the log changes."""
+    return (_stat_key(PERMANENT_MEMORY_FILE), _stat_key(PERMANENT_MEMORY_LOG))
+
+def _read_snapshot():
+    """
+    Return (memories by id, next id, ok) from PERMANENT_MEMORY_FILE. The old
+    plain-list format is still read. ok is False when the file cannot be
+    parsed, in which case it is left alone for the user to recover and no
+    new ids are handed out, since they could collide with the ones in it.
+    """
+    try:
+        with open(PERMANENT_MEMORY_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}, 1, True
+    except json.JSONDecodeError as e:
+        print(f"Warning: {PERMANENT_MEMORY_FILE} could not be read ({e}); it will not be rewritten.",
+              file=sys.stderr)
+        return {}, 1, False
+    if isinstance(data, dict):
+        entries = data.get("memories", [])
+        next_id = data.get("next_id", 1)
+    else:
+        entries = data if isinstance(data, list) else []
+        next_id = 1
+    memories = {mem["id"]: mem for mem in entries if isinstance(mem, dict) and "id" in mem}
+    return memories, max([next_id] + [mem_id + 1 for mem_id in memories]), True
+
+def _replay(memories, next_id):
+    """
+    Apply the operations in PERMANENT_MEMORY_LOG. Operations are idempotent
+    (add sets an entry by id, forget removes it), so replaying a log that a
+    snapshot already contains is harmless. A torn last line is skipped.
+    Returns (next id, number of operations).
+    """
+    try:
+        f = open(PERMANENT_MEMORY_LOG, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return next_id, 0
+    ops = 0
+    with f:
+        for line in f:
+            try:
+                op = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            ops += 1
+            next_id = _apply_op(memories, next_id, op)
+    return next_id, ops
+
+def _load_locked():
+    """Read the snapshot and replay the log. The caller holds the lock."""
+    key = state_key()
+    with _cache_lock:
+        if _cache.get("key") == key:
+            return _cache["state"]
+    memories, next_id, ok = _read_snapshot()
+    next_id, ops = _replay(memories, next_id)
+    state = {"memories": memories, "next_id": next_id, "ops": ops, "compactable": ok}
+    with _cache_lock:
+        _cache.update(key=key, state=state)
+    return state
+
+def load():
+    """
+    Return the current memories as a list of entries ordered by id. The
+    entries are shared with the cache, so callers must copy before changing
+    them.
+    """
+    key = state_key()
+    with _cache_lock:
+        if _cache.get("key") == key:
+            return list(_cache["state"]["memories"].values())
+    with store_lock(shared=True):
+        return list(_load_locked()["memories"].values())
+
+def _apply_op(memories, next_id, op):
+    """Apply one log operation to memories in place and return the next id."""
+    if op.get("op") == "add":
+        entry = op["entry"]
+        memories[entry["id"]] = entry
+        return max(next_id, entry["id"] + 1)
+    if op.get("op") == "forget":
+        memories.pop(op["id"], None)
+        return max(next_id, op["id"] + 1)
+    return next_id
+
+def _append_op(op):
+    """Append one operation to the log and flush it to disk."""
+    with open(PERMANENT_MEMORY_LOG, "ab") as f:
+        # A crash can leave a torn last line; start on a fresh one.
+        if f.tell() > 0:
+            with open(PERMANENT_MEMORY_LOG, "rb") as r:
+                r.seek(-1, os.SEEK_END)
+                if r.read(1) != b"\n":
+                    f.write(b"\n")
+        f.write((json.dumps(op) + "\n").encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+def _write_snapshot(memories, next_id):
+    """Atomically replace PERMANENT_MEMORY_FILE with a snapshot."""
+    tmp_path = f"{PERMANENT_MEMORY_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"next_id": next_id, "memories": list(memories)}, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, PERMANENT_MEMORY_FILE)
+
+def _write_op_locked(state, op):
+    """
+    Append op to the log and update the cached state without re-reading
+    the log. Compacts once the log holds PERMANENT_MEMORY_COMPACT_OPS
+    operations.
+    """
+    _append_op(op)
+    memories = dict(state["memories"])
+    next_id = _apply_op(memories, state["next_id"], op)
+    state = dict(state, memories=memories, next_id=next_id, ops=state["ops"] + 1)
+    if state["ops"] >= PERMANENT_MEMORY_COMPACT_OPS:
+        _compact_locked(state)
+        state["ops"] = 0
+    with _cache_lock:
+        _cache.update(key=state_key(), state=state)
+
+def _compact_locked(state):
+    """Fold the log into a new snapshot, then empty the log."""
+    if not state["compactable"]:
+        return
+    _write_snapshot(state["memories"].values(), state["next_id"])
+    with open(PERMANENT_MEMORY_LOG, "w"):
+        pass
+
+def compact():
+    """Fold the operation log into the snapshot now."""
+    with store_lock():
+        _compact_locked(_load_locked())
+
+def add(entry):
+    """
+    Give entry the next stable id and append it to the log. Returns the
+    entry with its id. Raises ValueError while the snapshot is unreadable.
+    """
+    with store_lock():
+        state = _load_locked()
+        if not state["compactable"]:
+            raise ValueError(f"{PERMANENT_MEMORY_FILE} could not be read; fix or remove it before "
+                             "adding memories, so their ids do not collide with the ones in it.")
+        entry = {"id": state["next_id"], **{k: v for k, v in entry.items() if k != "id"}}
+        _write_op_locked(state, {"op": "add", "entry": entry})
+    return entry
+
+def forget(entry_id):
+    """Remove the memory with entry_id. Returns False if there was none."""
+    with store_lock():
+        state = _load_locked()
+        if entry_id not in state["memories"]:
+            return False
+        _write_op_locked(state, {"op": "forget", "id": entry_id})
+    return True
+
+def replace_all(memories):
+    """Replace every memory with the given entries, keeping their ids."""
+    with store_lock():
+        state = _load_locked()
+        next_id = max([state["next_id"]] + [mem["id"] + 1 for mem in memories])
+        if not state["compactable"]:
+            raise ValueError(f"{PERMANENT_MEMORY_FILE} could not be read; refusing to overwrite it.")
+        _write_snapshot(memories, next_id)
+        with open(PERMANENT_MEMORY_LOG, "w"):
+            pass
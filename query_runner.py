@@ -0,0 +1,245 @@
+# query_runner.py
+
+import io
+import sys
+import time
+import queue
+import asyncio
+import datetime
+import threading
+from config import REPL_MAX_IN_FLIGHT, REPL_PROGRESS_INTERVAL
+
+class DaemonPool:
+    """
+    A bounded set of reused daemon threads. Unlike a ThreadPoolExecutor's
+    workers, they do not keep the process alive when the user quits with
+    requests still running; unlike a thread per call, they keep their
+    thread-local state (such as context_store's sqlite connection) for the
+    whole session.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.tasks = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.workers = 0
+        self.idle = 0
+
+    def submit(self, task):
+        """Run task() on a worker, starting one if none is idle and the pool is not full."""
+        with self.lock:
+            self.tasks.put(task)
+            if self.idle < self.tasks.qsize() and self.workers < self.max_workers:
+                self.workers += 1
+                threading.Thread(target=self._work, daemon=True).start()
+
+    def _work(self):
+        while True:
+            with self.lock:
+                self.idle += 1
+            task = self.tasks.get()
+            with self.lock:
+                self.idle -= 1
+            task()
+
+# Room for every query in flight, plus reading input, command substitution
+# and recording a finished query.
+_pool = DaemonPool(REPL_MAX_IN_FLIGHT + 3)
+
+def run_in_thread(function, *args, **kwargs):
+    """
+    Run function on one of the session's daemon threads and return an
+    asyncio future for its result. Unlike the loop's default executor, a
+    request that is still running does not keep the process alive when the
+    user quits.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def target():
+        try:
+            result, error = function(*args, **kwargs), None
+        except BaseException as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:
+            # The loop has already been closed.
+            pass
+
+    _pool.submit(target)
+    return future
+
+class Console:
+    """
+    Terminal output for the interactive mode while input is being read on
+    another thread. On a terminal, asynchronous output is printed above the
+    prompt, followed by a progress line, and the prompt and whatever the user
+    has typed so far are redrawn.
+    """
+
+    def __init__(self):
+        self.tty = sys.stdout.isatty()
+        self.prompt = None
+        self.status = None
+        self.status_shown = False
+        try:
+            import readline
+            self.readline = readline
+        except ImportError:
+            self.readline = None
+
+    def typed(self):
+        return self.readline.get_line_buffer() if self.readline else ""
+
+    def start_input(self, prompt, status=None):
+        """Note that prompt is about to be shown, with a progress line above it."""
+        self.prompt = prompt
+        self.status = status
+        if self.tty and status:
+            sys.stdout.write(status + "\n")
+            sys.stdout.flush()
+            self.status_shown = True
+
+    def end_input(self):
+        self.prompt = None
+        self.status_shown = False
+
+    def write(self, text):
+        """Print text above the prompt (or simply print it while no input is read)."""
+        if not text.endswith("\n"):
+            text += "\n"
+        if not (self.tty and self.prompt is not None):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            return
+        # Erase the prompt line, and the progress line above it.
+        sys.stdout.write("\r\x1b[K")
+        if self.status_shown:
+            sys.stdout.write("\x1b[1A\r\x1b[K")
+        sys.stdout.write(text)
+        self.status_shown = bool(self.status)
+        if self.status:
+            sys.stdout.write(self.status + "\n")
+        sys.stdout.write(self.prompt + self.typed())
+        sys.stdout.flush()
+
+    def set_status(self, status):
+        """Update the progress line above the prompt in place."""
+        self.status = status
+        if not (self.tty and self.prompt is not None) or status is None:
+            return
+        if self.status_shown:
+            # Save the cursor, rewrite the line above and restore the cursor.
+            sys.stdout.write(f"\x1b7\x1b[1A\r\x1b[K{status}\x1b8")
+        else:
+            sys.stdout.write(f"\r\x1b[K{status}\n{self.prompt}{self.typed()}")
+            self.status_shown = True
+        sys.stdout.flush()
+
+class QueryRunner:
+    """
+    Queries of one interactive session, running concurrently while the user
+    keeps typing. Each gets a short response ID (r1, r2, ...); its output is
+    collected and printed, labelled with the ID, when it completes. Finished
+    exchanges are added to the context in submission order, each with its
+    submission time, so a quick answer never lands before an earlier slow
+    one.
+    """
+
+    def __init__(self, console, max_in_flight=REPL_MAX_IN_FLIGHT):
+        self.console = console
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.record_lock = asyncio.Lock()
+        self.count = 0
+        self.queries = []
+        self.tasks = set()
+        self.ticker = None
+
+    def running(self):
+        return [query for query in self.queries if not query["done"]]
+
+    def status(self):
+        """Return the progress line for the queries still running, or None."""
+        running = self.running()
+        if not running:
+            return None
+        now = time.monotonic()
+        queued = self.slots.locked()
+        parts = [f"{query['id']} queued" if query["started"] is None and queued
+                 else f"{query['id']} {now - (query['started'] or now):.0f}s"
+                 for query in running]
+        return "[waiting: " + ", ".join(parts) + "]"
+
+    def submit(self, prompt, run, describe=""):
+        """
+        Start answering prompt with run(out), which writes the response to out
+        and returns (answer, topics, reasoning_effort, model, route), or None
+        when there is nothing to record. Returns the response ID.
+        """
+        self.count += 1
+        query = {
+            "id": f"r{self.count}",
+            "prompt": prompt,
+            "submitted": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "started": None,
+            "done": False,
+            "result": None,
+        }
+        self.queries.append(query)
+        self.console.write(f"[{query['id']}] sent{describe}")
+        task = asyncio.ensure_future(self._run(query, run))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        if self.console.tty and (self.ticker is None or self.ticker.done()):
+            self.ticker = asyncio.ensure_future(self._tick())
+        return query["id"]
+
+    async def _run(self, query, run):
+        async with self.slots:
+            query["started"] = time.monotonic()
+            out = io.StringIO()
+            try:
+                query["result"] = await run_in_thread(run, out)
+                outcome = f"done in {time.monotonic() - query['started']:.1f}s"
+            except Exception as e:
+                out.write(f"\nError: {e}\n")
+                outcome = f"failed after {time.monotonic() - query['started']:.1f}s"
+            query["done"] = True
+            self.console.status = self.status()
+            prompt = query["prompt"] if len(query["prompt"]) <= 60 else query["prompt"][:57] + "..."
+            self.console.write(f"[{query['id']}] {outcome} >>> {prompt}\n" + out.getvalue().rstrip("\n") + "\n")
+        await self._record_finished()
+
+    async def _record_finished(self):
+        """Add the finished queries at the front of the submission order to the context."""
+        from memory_manager import add_to_context
+
+        async with self.record_lock:
+            while self.queries and self.queries[0]["done"]:
+                query = self.queries.pop(0)
+                if query["result"] is None:
+                    continue
+                answer, topics, reasoning_effort, model, route = query["result"]
+                await run_in_thread(add_to_context, query["prompt"], answer, topics, reasoning_effort,
+                                    model=model, timestamp=query["submitted"], route=route)
+
+    async def _tick(self):
+        """Refresh the progress line while queries are running."""
+        while self.running():
+            self.console.set_status(self.status())
+            await asyncio.sleep(REPL_PROGRESS_INTERVAL)
+        self.console.set_status(None)
+
+    async def wait(self):
+        """Wait for every submitted query to finish and be recorded."""
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks))
@@ -0,0 +1,124 @@
+# realtime_client.py
+
+import sys
+import threading
+from config import FAST_MODEL
+from startup_profile import span
+
+FAST_INSTRUCTIONS = (
+    "\n\n# Fast Mode\n"
+    "Answer in plain text, not JSON. Be brief: quick command lookups deserve a one or two line "
+    "answer, usually just the command and what it does."
+)
+
+class RealtimeSession:
+    """
+    One persistent WebSocket to the realtime API, reused for every turn so
+    only the first question pays for the handshake. The conversation is
+    kept server-side, so earlier turns do not have to be resent.
+    """
+
+    def __init__(self, model=None):
+        self.model = model or FAST_MODEL
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """Open the WebSocket and configure the session, unless already open."""
+        from ai_client import get_client, load_system_message
+        from memory_manager import build_permanent_context
+
+        with self.lock:
+            if self.connection is not None:
+                return
+            with span("realtime connect"):
+                connection = get_client().beta.realtime.connect(model=self.model).enter()
+            permanent_context, _ = build_permanent_context()
+            instructions = load_system_message() + "\n" + permanent_context + FAST_INSTRUCTIONS
+            connection.session.update(session={"modalities": ["text"], "instructions": instructions})
+            self.connection = connection
+
+    def connect_in_background(self):
+        """Start connecting on a daemon thread so the handshake overlaps typing."""
+        threading.Thread(target=self._connect_quietly, daemon=True).start()
+
+    def _connect_quietly(self):
+        try:
+            self.connect()
+        except Exception:
+            # The next ask() connects again and reports the error.
+            pass
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                try:
+                    self.connection.close()
+                except Exception:
+                    pass
+                self.connection = None
+
+    def _send_turn(self, prompt):
+        self.connection.conversation.item.create(item={
+            "type": "message",
+            "role": "user",
+            "content": [{"type": "input_text", "text": prompt}],
+        })
+        self.connection.response.create()
+
+    def ask(self, prompt, out=None):
+        """
+        Send one user turn and write the text deltas to out (stdout by
+        default) as they arrive. A dropped connection is reopened once.
+        Returns (answer text, usage).
+        """
+        from websockets.exceptions import ConnectionClosed
+
+        out = out or sys.stdout
+        for attempt in range(2):
+            self.connect()
+            try:
+                self._send_turn(prompt)
+                return self._read_response(out)
+            except ConnectionClosed:
+                self.close()
+                if attempt:
+                    raise
+
+    def _read_response(self, out):
+        pieces = []
+        for event in self.connection:
+            if event.type == "response.text.delta":
+                pieces.append(event.delta)
+                out.write(event.delta)
+                out.flush()
+            elif event.type == "error":
+                raise RuntimeError(event.error.message)
+            elif event.type == "response.done":
+                return "".join(pieces), getattr(event.response, "usage", None)
+        raise RuntimeError("Realtime connection closed before the response finished.")
+
+def fast_query(session, user_prompt, out=None, record=True):
+    """
+    Answer user_prompt over a RealtimeSession, printing the same
+    "[<model> - realtime]" header as single_query, and add the exchange to
+    the context. Returns the answer text.
+    """
+    from memory_manager import add_to_context
+    from metrics import record_usage, query_timer, phase
+    import blob_store
+
+    out = out or sys.stdout
+    with query_timer() as timer:
+        out.write(f"[{session.model} - realtime]\n\n")
+        out.flush()
+        with phase("generation"):
+            answer, usage = session.ask(blob_store.expand(user_prompt, set()), out)
+        out.write("\n")
+        out.flush()
+        if record:
+            with phase("add_to_context"):
+                add_to_context(user_prompt, answer.strip(), [], "realtime", model=session.model)
+        timer.add("total", timer.since_start())
+        record_usage(session.model, "realtime", usage, phases=timer.phases)
+    return answer
@@ -0,0 +1,204 @@
+# request_executor.py
+
+import sys
+import time
+import random
+import threading
+import email.utils
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from config import (
+        REQUEST_CONNECT_TIMEOUT,
+        REQUEST_FIRST_BYTE_TIMEOUT,
+        REQUEST_TOTAL_TIMEOUT,
+        REQUEST_MAX_RETRIES,
+        REQUEST_BACKOFF,
+        REQUEST_MAX_BACKOFF,
+        REQUEST_MAX_RETRY_AFTER,
+        HEDGE_MODEL,
+        HEDGE_PERCENTILE,
+        HEDGE_MIN_DELAY,
+        HEDGE_DEFAULT_DELAY,
+        HEDGE_HISTORY,
+        HEDGE_MIN_SAMPLES
+)
+from metrics import record_phase, recent_metrics, percentile
+
+class PeekedStream:
+    """A streamed response whose first chunk has already been read, ttfb seconds after it was sent."""
+
+    def __init__(self, response, iterator, first, ttfb):
+        self.response = response
+        self.iterator = iterator
+        self.first = first
+        self.ttfb = ttfb
+
+    def __iter__(self):
+        if self.first is not None:
+            first, self.first = self.first, None
+            yield first
+        yield from self.iterator
+
+    def close(self):
+        self.response.close()
+
+def retryable_errors():
+    """Errors worth another attempt: rate limits, 5xx, timeouts and dropped connections."""
+    import openai
+    return (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+def retry_after(error):
+    """Return the delay in seconds the server asked for, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        moment = email.utils.parsedate_to_datetime(value)
+        return max(moment.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, error=None):
+    """
+    Jittered exponential backoff for a retry, capped at REQUEST_MAX_BACKOFF
+    and raised to the server's Retry-After when it asks for longer. Returns
+    None when the server asks for more than REQUEST_MAX_RETRY_AFTER, in
+    which case the request should fail rather than retry early.
+    """
+    delay = min(REQUEST_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5), REQUEST_MAX_BACKOFF)
+    requested = retry_after(error) if error is not None else None
+    if requested is None:
+        return delay
+    if requested > REQUEST_MAX_RETRY_AFTER:
+        return None
+    return max(delay, requested)
+
+def send(client, options):
+    """
+    Send one chat completion request with no client-side retries. A
+    streamed response gets the first-byte timeout and is returned once its
+    first chunk has arrived, so a stalled stream counts as a failed attempt
+    rather than a hang. A non-streamed response only arrives once it is
+    complete, so it gets REQUEST_TOTAL_TIMEOUT instead.
+    """
+    import httpx
+    import openai
+
+    stream = options.get("stream")
+    timeout = openai.Timeout(REQUEST_FIRST_BYTE_TIMEOUT if stream else REQUEST_TOTAL_TIMEOUT,
+                             connect=REQUEST_CONNECT_TIMEOUT)
+    started = time.perf_counter()
+    response = client.with_options(timeout=timeout, max_retries=0).chat.completions.create(**options)
+    if not stream:
+        return response
+    iterator = iter(response)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        first = None
+    except httpx.TimeoutException:
+        response.close()
+        raise openai.APITimeoutError(request=response.response.request)
+    except httpx.TransportError as e:
+        response.close()
+        raise openai.APIConnectionError(message=str(e), request=response.response.request)
+    return PeekedStream(response, iterator, first, time.perf_counter() - started)
+
+def hedge_delay(model):
+    """
+    Return how long to wait for a first byte before hedging: the
+    HEDGE_PERCENTILE of the model's recent time to first byte (recorded for
+    streamed requests only), at least
+    HEDGE_MIN_DELAY, or HEDGE_DEFAULT_DELAY without enough history.
+    """
+    samples = sorted(record["phases"]["ttfb"] / 1000 for record in recent_metrics(HEDGE_HISTORY)
+                     if record.get("model") == model and "ttfb" in record.get("phases", {}))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return max(percentile(samples, HEDGE_PERCENTILE), HEDGE_MIN_DELAY)
+
+def _discard(future):
+    """Close the response of a request that lost the race, once it arrives."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    response = future.result()
+    if isinstance(response, PeekedStream):
+        response.close()
+
+def _start(function, *args):
+    """
+    Run function on a daemon thread and return a future for its result.
+    Unlike a ThreadPoolExecutor's workers, a request that lost the race
+    does not keep the process alive once the answer has been printed.
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def target():
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+def send_hedged(client, options, hedge_model=None):
+    """
+    Send the request, and if no first byte arrives within hedge_delay()
+    send a duplicate (to hedge_model, or the same model). The first to
+    answer wins and the other is discarded. Returns (response, model).
+    """
+    hedge_options = dict(options, model=hedge_model or options["model"])
+    primary = _start(send, client, options)
+    done, _ = wait([primary], timeout=hedge_delay(options["model"]))
+    if done:
+        return primary.result(), options["model"]
+    print(f"[hedging: no response yet, also asking {hedge_options['model']}]", file=sys.stderr)
+    hedge = _start(send, client, hedge_options)
+    models = {primary: options["model"], hedge: hedge_options["model"]}
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.add_done_callback(_discard)
+                return future.result(), models[future]
+    # Both failed; report the original request's error.
+    return primary.result(), options["model"]
+
+def execute(client, options, hedge=False, hedge_model=HEDGE_MODEL):
+    """
+    Send a chat completion request (options as for create()) with timeouts,
+    retries with backoff and, with hedge=True, a hedged duplicate. Only
+    streamed requests are hedged: without a first chunk to go by, a slow
+    non-streamed request cannot be told from a long answer.
+    Records any backoff and, for streamed requests, the winning attempt's
+    time to first byte in the current query's phases.
+    Returns (response, model that answered).
+    """
+    retryable = retryable_errors()
+    hedge = hedge and options.get("stream")
+    for attempt in range(REQUEST_MAX_RETRIES + 1):
+        try:
+            if hedge:
+                response, model = send_hedged(client, options, hedge_model)
+            else:
+                response, model = send(client, options), options["model"]
+            if isinstance(response, PeekedStream):
+                record_phase("ttfb", response.ttfb)
+            return response, model
+        except retryable as e:
+            delay = backoff_delay(attempt, e)
+            if attempt == REQUEST_MAX_RETRIES or delay is None:
+                raise
+            print(f"[{type(e).__name__}: retrying in {delay:.1f}s ({attempt + 1}/{REQUEST_MAX_RETRIES})]",
+                  file=sys.stderr)
+            time.sleep(delay)
+            record_phase("backoff", delay)
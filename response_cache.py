@@ -0,0 +1,108 @@
+# response_cache.py
+
+import re
+import json
+import time
+import sqlite3
+import contextlib
+import hashlib
+from config import (
+        DELIMITER,
+        RESPONSE_CACHE_FILE,
+        RESPONSE_CACHE_MAX_AGE,
+        RESPONSE_CACHE_MAX_BYTES
+)
+
+PROMPT_LINE_PATTERN = re.compile(r"^>>> (.*)$", re.MULTILINE)
+
+def _connect():
+    """Open RESPONSE_CACHE_FILE, creating its tables if needed."""
+    conn = sqlite3.connect(RESPONSE_CACHE_FILE, timeout=30)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL,
+            size INTEGER NOT NULL,
+            response TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+        CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    """)
+    return conn
+
+@contextlib.contextmanager
+def _transaction():
+    """Open a connection (see _connect), commit or roll back on exit, and close it."""
+    with contextlib.closing(_connect()) as conn, conn:
+        yield conn
+
+def normalize_messages(messages, user_prompt):
+    """
+    Normalize messages for the cache key: trailing whitespace is dropped and
+    context blocks from earlier runs of this very prompt are removed, so
+    re-asking the same question after the first answer was recorded still
+    produces the same key.
+    """
+    prompt = " ".join(user_prompt.split())
+    normalized = []
+    for message in messages:
+        blocks = []
+        for block in message["content"].split(DELIMITER):
+            m_prompt = PROMPT_LINE_PATTERN.search(block)
+            if m_prompt and " ".join(m_prompt.group(1).split()) == prompt:
+                continue
+            blocks.append("\n".join(line.rstrip() for line in block.strip().splitlines()))
+        normalized.append({"role": message["role"], "content": DELIMITER.join(blocks)})
+    return normalized
+
+def cache_key(model, reasoning_effort, messages, user_prompt, schema):
+    """Hash the model, effort, normalized messages and response schema."""
+    payload = json.dumps([model, reasoning_effort, normalize_messages(messages, user_prompt), schema],
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _count(conn, name):
+    conn.execute("INSERT INTO stats (name, value) VALUES (?, 1) "
+                 "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+def lookup(key):
+    """Return the cached structured output for key, or None. Counts the hit or miss."""
+    now = time.time()
+    with _transaction() as conn:
+        row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > RESPONSE_CACHE_MAX_AGE:
+            _count(conn, "misses")
+            return None
+        conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        _count(conn, "hits")
+    return json.loads(row[0])
+
+def store(key, structured_output):
+    """Cache a structured output under key, then evict by age and total size."""
+    now = time.time()
+    response = json.dumps(structured_output)
+    with _transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO responses (key, created, accessed, size, response) "
+                     "VALUES (?, ?, ?, ?, ?)", (key, now, now, len(response), response))
+        evict(conn, now)
+
+def evict(conn, now=None):
+    """Drop entries older than RESPONSE_CACHE_MAX_AGE, then least recently used ones over the size cap."""
+    now = now or time.time()
+    conn.execute("DELETE FROM responses WHERE created < ?", (now - RESPONSE_CACHE_MAX_AGE,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= RESPONSE_CACHE_MAX_BYTES:
+        return
+    rows = conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+    for key, size in rows:
+        if total <= RESPONSE_CACHE_MAX_BYTES:
+            break
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        total -= size
+
+def stats():
+    """Return (hits, misses) counted since the cache file was created."""
+    with _transaction() as conn:
+        values = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+    return values.get("hits", 0), values.get("misses", 0)
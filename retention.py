@@ -0,0 +1,304 @@
+# retention.py
+
+import io
+import os
+import re
+import sys
+import json
+import fcntl
+import datetime
+import subprocess
+from config import (
+        CONTEXT_SEGMENT_PERIOD,
+        CONTEXT_COMPRESS_AFTER_DAYS,
+        CONTEXT_DIGEST_FILE,
+        CONTEXT_DIGEST_TOKENS,
+        DIGEST_MODEL,
+        DIGEST_REASONING_EFFORT,
+        DIGEST_MAX_INPUT_TOKENS,
+        DIGEST_RETRY_INTERVAL,
+        DIGEST_AUTOMATIC,
+        DIGEST_AUTO_DAYS,
+        DIGEST_MAX_PER_RUN
+)
+from context_store import (
+        rotate_blocks,
+        compress_segment,
+        list_segments,
+        segment_path,
+        segment_bytes,
+        oldest_hot_timestamp,
+        segment_block_counts,
+        TIMESTAMP_PATTERN,
+        TOPIC_TAGS_PATTERN,
+        DELIMITER_BYTES
+)
+from tokenizer import count_tokens
+
+DIGEST_LOCK_FILE = CONTEXT_DIGEST_FILE + ".lock"
+SEGMENT_PREFIX = "context-"
+PROMPT_PATTERN = re.compile(r"^>>> (.*)$", re.MULTILINE)
+
+# Characters of each answer shown to the digest model.
+DIGEST_ANSWER_CHARS = 300
+
+DIGEST_PROMPT = (
+    "Below are the exchanges between the user and you during {period}. Write a compact digest of "
+    "them for your own future reference: what the user worked on, the questions asked, the "
+    "conclusions and commands that mattered, and anything left unresolved. Use terse bullet "
+    "points and at most 200 words.\n\n{exchanges}"
+)
+
+# Parsed CONTEXT_DIGEST_FILE keyed by its (mtime, size).
+_digest_cache = {}
+
+def period_label(moment):
+    """Return the label of the CONTEXT_SEGMENT_PERIOD containing moment."""
+    if CONTEXT_SEGMENT_PERIOD == "day":
+        return moment.strftime("%Y-%m-%d")
+    if CONTEXT_SEGMENT_PERIOD == "month":
+        return moment.strftime("%Y-%m")
+    year, week, _ = moment.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def period_start(label):
+    """Return the moment the period with label starts."""
+    if CONTEXT_SEGMENT_PERIOD == "day":
+        return datetime.datetime.strptime(label, "%Y-%m-%d")
+    if CONTEXT_SEGMENT_PERIOD == "month":
+        return datetime.datetime.strptime(label, "%Y-%m")
+    return datetime.datetime.strptime(label + "-1", "%G-W%V-%u")
+
+def period_end(label):
+    """Return the moment the period with label ends."""
+    start = period_start(label)
+    if CONTEXT_SEGMENT_PERIOD == "day":
+        return start + datetime.timedelta(days=1)
+    if CONTEXT_SEGMENT_PERIOD == "month":
+        return (start + datetime.timedelta(days=32)).replace(day=1)
+    return start + datetime.timedelta(days=7)
+
+def _parse_timestamp(timestamp):
+    return datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+
+def needs_rotation(now=None):
+    """Return True if CONTEXT_FILE holds blocks from before the current period."""
+    oldest = oldest_hot_timestamp()
+    if not oldest:
+        return False
+    try:
+        return period_label(_parse_timestamp(oldest)) < period_label(now or datetime.datetime.now())
+    except ValueError:
+        return False
+
+def rotate(now=None):
+    """
+    Move blocks from earlier periods into their segments, then compress
+    segments whose period ended CONTEXT_COMPRESS_AFTER_DAYS ago.
+    Returns (rotated segments, compressed segments).
+    """
+    now = now or datetime.datetime.now()
+    current = period_label(now)
+
+    def segment_of(timestamp):
+        try:
+            label = period_label(_parse_timestamp(timestamp))
+        except ValueError:
+            return None
+        return SEGMENT_PREFIX + label if label < current else None
+
+    rotated = rotate_blocks(segment_of)
+    compressed = []
+    cutoff = now - datetime.timedelta(days=CONTEXT_COMPRESS_AFTER_DAYS)
+    for segment in list_segments():
+        if segment_path(segment).endswith(".gz"):
+            continue
+        try:
+            ended = period_end(segment[len(SEGMENT_PREFIX):])
+        except ValueError:
+            continue
+        if ended <= cutoff and compress_segment(segment):
+            compressed.append(segment)
+    return rotated, compressed
+
+def load_digests():
+    """Return the digests in CONTEXT_DIGEST_FILE as {segment: entry}."""
+    global _digest_cache
+    try:
+        stat = os.stat(CONTEXT_DIGEST_FILE)
+    except OSError:
+        return {}
+    key = (stat.st_mtime_ns, stat.st_size)
+    if _digest_cache.get("key") != key:
+        digests = {}
+        with open(CONTEXT_DIGEST_FILE, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                digests[entry["segment"]] = entry
+        _digest_cache = {"key": key, "digests": digests}
+    return _digest_cache["digests"]
+
+def pending_digests(recent_days=None, now=None):
+    """
+    Return segments with no digest, or whose digest predates blocks added to
+    them, newest first. With recent_days, only segments whose period ended
+    within that many days are returned.
+    """
+    digests = load_digests()
+    cutoff = None
+    if recent_days is not None:
+        cutoff = (now or datetime.datetime.now()) - datetime.timedelta(days=recent_days)
+    pending = []
+    for segment, blocks in sorted(segment_block_counts().items(), reverse=True):
+        if digests.get(segment, {}).get("blocks") == blocks:
+            continue
+        if cutoff is not None:
+            try:
+                if period_end(segment[len(SEGMENT_PREFIX):]) < cutoff:
+                    continue
+            except ValueError:
+                continue
+        pending.append(segment)
+    return pending
+
+def digest_input(segment):
+    """
+    Render a segment's exchanges for the digest prompt: prompt, topics and
+    the start of each answer. Answers are dropped, then the oldest
+    exchanges, until the text fits DIGEST_MAX_INPUT_TOKENS.
+    Returns (text, number of blocks).
+    """
+    from memory_manager import block_answer
+
+    exchanges = []
+    for part in segment_bytes(segment).split(DELIMITER_BYTES):
+        block = part.strip().decode("utf-8", errors="replace")
+        if not block:
+            continue
+        m_time = TIMESTAMP_PATTERN.search(block)
+        m_prompt = PROMPT_PATTERN.search(block)
+        m_tags = TOPIC_TAGS_PATTERN.search(block)
+        answer = block_answer(block) or ""
+        if len(answer) > DIGEST_ANSWER_CHARS:
+            answer = answer[:DIGEST_ANSWER_CHARS] + "..."
+        exchanges.append((
+            f"[{m_time.group(1) if m_time else '?'}] {m_prompt.group(1) if m_prompt else ''}"
+            f" (topics: {m_tags.group(1) if m_tags else 'None'})",
+            answer
+        ))
+    full = "\n\n".join(f"{head}\n{answer}" for head, answer in exchanges)
+    if count_tokens(full) <= DIGEST_MAX_INPUT_TOKENS:
+        return full, len(exchanges)
+    heads = [head for head, _ in exchanges]
+    while heads and count_tokens("\n".join(heads)) > DIGEST_MAX_INPUT_TOKENS:
+        heads = heads[len(heads) // 10 + 1:]
+    return "\n".join(heads), len(exchanges)
+
+def _write_digest(entry):
+    """Add or replace a segment's digest, rewriting CONTEXT_DIGEST_FILE atomically."""
+    digests = dict(load_digests())
+    digests[entry["segment"]] = entry
+    tmp_path = f"{CONTEXT_DIGEST_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for segment in sorted(digests):
+            f.write(json.dumps(digests[segment]) + "\n")
+    os.replace(tmp_path, CONTEXT_DIGEST_FILE)
+
+def generate_digest(segment):
+    """Summarize one segment through the normal query path with DIGEST_MODEL."""
+    from ai_client import single_query
+
+    label = segment[len(SEGMENT_PREFIX):]
+    text, blocks = digest_input(segment)
+    result = single_query(DIGEST_PROMPT.format(period=label, exchanges=text),
+                          reasoning_effort=DIGEST_REASONING_EFFORT, model=DIGEST_MODEL,
+                          stream=False, out=io.StringIO(), record=False, include_context=False)
+    digest = result["answer"].strip()
+    entry = {
+        "segment": segment,
+        "period": label,
+        "blocks": blocks,
+        "digest": digest,
+        "tokens": count_tokens(digest),
+        "model": result["model"],
+        "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    _write_digest(entry)
+    return entry
+
+def generate_digests(wait=True, limit=DIGEST_MAX_PER_RUN, recent_days=None):
+    """
+    Write digests for up to limit pending segments (see pending_digests),
+    newest first, one process at a time. With wait=False, return
+    immediately if another process is already at it.
+    Returns the new digest entries.
+    """
+    with open(DIGEST_LOCK_FILE, "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return []
+        return [generate_digest(segment) for segment in pending_digests(recent_days)[:limit]]
+
+def ensure_digest_worker(min_interval=0):
+    """
+    Start a detached process to write the digests of recent periods (see
+    DIGEST_AUTO_DAYS), if any are pending and DIGEST_AUTOMATIC is on.
+    No worker is started within min_interval seconds of the last one; the
+    lock file's mtime records when that was.
+    """
+    if not DIGEST_AUTOMATIC:
+        return
+    try:
+        last_started = os.stat(DIGEST_LOCK_FILE).st_mtime
+    except OSError:
+        last_started = 0
+    if min_interval and datetime.datetime.now().timestamp() - last_started < min_interval:
+        return
+    if not pending_digests(DIGEST_AUTO_DAYS):
+        return
+    with open(DIGEST_LOCK_FILE, "a"):
+        os.utime(DIGEST_LOCK_FILE)
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__)],
+        cwd=os.getcwd(),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+def maintain_context():
+    """
+    Rotate the context log when a new period has started and queue the
+    digests. Digests still pending from a failed run are retried at most
+    every DIGEST_RETRY_INTERVAL.
+    """
+    if needs_rotation():
+        rotate()
+        ensure_digest_worker()
+    else:
+        ensure_digest_worker(DIGEST_RETRY_INTERVAL)
+
+def digest_context(budget=CONTEXT_DIGEST_TOKENS):
+    """
+    Return the newest digests that fit in budget tokens, rendered oldest
+    first, with their token count and number.
+    """
+    selected = []
+    tokens = 0
+    for segment, entry in sorted(load_digests().items(), reverse=True):
+        if tokens + entry["tokens"] > budget:
+            break
+        selected.append(entry)
+        tokens += entry["tokens"]
+    selected.reverse()
+    text = "\n\n".join(f"[Digest of {entry['period']}: {entry['blocks']} exchanges]\n{entry['digest']}"
+                       for entry in selected)
+    return text, tokens, len(selected)
+
+if __name__ == "__main__":
+    generate_digests(wait=False, recent_days=DIGEST_AUTO_DAYS)
@@ -0,0 +1,73 @@
+# router.py
+
+import re
+from config import (
+        ROUTER_ROUTES,
+        ROUTER_LATENCY_BUDGET,
+        ROUTER_HISTORY,
+        ROUTER_MIN_SAMPLES,
+        ROUTER_COMMAND_MAX_WORDS,
+        ROUTER_DESIGN_MIN_WORDS
+)
+from metrics import recent_metrics, percentile
+
+# Prompt classes from cheapest to most expensive; a route over its latency
+# budget steps down towards the start of the list.
+ROUTE_ORDER = ["command", "general", "design"]
+
+# Clear signs of a command lookup, checked before the design words so that
+# "the git command to compare branches" stays a lookup.
+COMMAND_PATTERN = re.compile(
+    r"\b(command|flags?|options?|syntax|one-liner|regex|shortcut|keybinding|alias|man ?page)\b", re.IGNORECASE)
+# Weaker signs, only counted when no design words are present.
+HOWTO_PATTERN = re.compile(r"^\s*(how (do|can|would) i|how to|what does|what is the|which)\b", re.IGNORECASE)
+DESIGN_PATTERN = re.compile(
+    r"\b(design\w*|architect\w*|trade-?offs?|compare|comparison|strateg\w+|plan|refactor\w*|"
+    r"scal(e|ing|able|ability)|pros and cons|approach\w*|migrat\w+|review|structure)\b", re.IGNORECASE)
+
+def classify(prompt):
+    """Return "command", "general" or "design" for a prompt, using only local heuristics."""
+    words = len(prompt.split())
+    if words >= ROUTER_DESIGN_MIN_WORDS:
+        return "design"
+    if words <= ROUTER_COMMAND_MAX_WORDS and COMMAND_PATTERN.search(prompt):
+        return "command"
+    if DESIGN_PATTERN.search(prompt):
+        return "design"
+    if words <= ROUTER_COMMAND_MAX_WORDS and HOWTO_PATTERN.search(prompt):
+        return "command"
+    return "general"
+
+def observed_latency():
+    """
+    Return the median total query time in seconds per (model, effort) over
+    the last ROUTER_HISTORY queries, leaving out cache hits and routes with
+    fewer than ROUTER_MIN_SAMPLES queries.
+    """
+    samples = {}
+    for record in recent_metrics(ROUTER_HISTORY):
+        total = record.get("phases", {}).get("total")
+        if total is None or record.get("cache") == "hit":
+            continue
+        samples.setdefault((record.get("model"), record.get("reasoning_effort")), []).append(total)
+    return {key: percentile(sorted(values), 0.5) / 1000
+            for key, values in samples.items() if len(values) >= ROUTER_MIN_SAMPLES}
+
+def route(prompt):
+    """
+    Pick the model and reasoning effort for a prompt. Returns a dict with
+    the prompt's class, the route taken, its model and effort, and a label
+    such as "auto: design" (or "auto: design->general" after stepping down
+    from a route that has been slower than its budget).
+    """
+    category = classify(prompt)
+    budget = ROUTER_LATENCY_BUDGET.get(category)
+    index = ROUTE_ORDER.index(category)
+    if budget is not None:
+        latency = observed_latency()
+        while index > 0 and latency.get(ROUTER_ROUTES[ROUTE_ORDER[index]], 0) > budget:
+            index -= 1
+    name = ROUTE_ORDER[index]
+    model, effort = ROUTER_ROUTES[name]
+    label = f"auto: {category}" if name == category else f"auto: {category}->{name}"
+    return {"category": category, "route": name, "model": model, "effort": effort, "label": label}
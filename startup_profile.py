@@ -0,0 +1,66 @@
+# startup_profile.py
+
+import atexit
+import builtins
+import sys
+import time
+from contextlib import contextmanager
+
+# Nested records deeper than this are summarized by their parent.
+MAX_REPORT_DEPTH = 3
+
+_original_import = builtins.__import__
+_records = []
+_depth = 0
+_enabled = False
+_started = None
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """builtins.__import__ replacement that times first-time module loads."""
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    with span("import " + name):
+        return _original_import(name, globals, locals, fromlist, level)
+
+@contextmanager
+def span(name):
+    """Time a named startup phase (a no-op unless profiling is enabled)."""
+    global _depth
+    if not _enabled:
+        yield
+        return
+    index = len(_records)
+    _records.append(None)
+    depth = _depth
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _depth = depth
+        _records[index] = (name, depth, time.perf_counter() - start)
+
+def enable():
+    """Start recording import and initialization times; report them at exit."""
+    global _enabled, _started
+    if _enabled:
+        return
+    _enabled = True
+    _started = time.perf_counter()
+    builtins.__import__ = _timed_import
+    atexit.register(report)
+
+def report(file=None):
+    """Write the recorded timings (inclusive of nested entries) to stderr."""
+    file = file or sys.stderr
+    total = time.perf_counter() - _started if _started else 0.0
+    file.write("[Startup Profile]\n")
+    for record in _records:
+        if record is None:
+            continue
+        name, depth, elapsed = record
+        if depth > MAX_REPORT_DEPTH:
+            continue
+        file.write(f"  {elapsed * 1000:9.2f} ms  {'  ' * depth}{name}\n")
+    file.write(f"  {total * 1000:9.2f} ms  total\n")
+    file.flush()
@@ -0,0 +1,166 @@
+# stdin_reader.py
+
+import os
+import re
+import sys
+import mmap
+import stat
+from collections import deque
+from config import STDIN_MAX_TOKENS, STDIN_MATCH_PATTERN
+from tokenizer import count_tokens
+
+READ_CHUNK = 64 * 1024
+
+# Rough bytes per token, used to size the head/tail/match windows before the
+# real token count is checked.
+BYTES_PER_TOKEN = 4
+
+def _decode(data):
+    return data.decode("utf-8", errors="replace")
+
+def _budget_bytes(max_tokens, has_pattern):
+    """Split a token budget into head, tail and matched-lines byte windows."""
+    total = max_tokens * BYTES_PER_TOKEN
+    match_bytes = total // 5 if has_pattern else 0
+    head_bytes = (total - match_bytes) // 2
+    tail_bytes = total - match_bytes - head_bytes
+    return head_bytes, tail_bytes, match_bytes
+
+def _format_reduced(total_bytes, head, matches, tail):
+    """Join the kept regions with markers saying what was left out."""
+    omitted = total_bytes - len(head) - len(tail)
+    parts = [f"[input reduced: {total_bytes} bytes total, {omitted} bytes between head and tail omitted]",
+             _decode(head).rstrip("\n")]
+    if matches:
+        parts.append("[... matched lines from the omitted middle ...]")
+        parts.extend(_decode(line).rstrip("\n") for line in matches)
+    parts.append("[... end of input ...]")
+    parts.append(_decode(tail).lstrip("\n"))
+    return "\n".join(parts)
+
+def _fit(total_bytes, head, matches, tail, max_tokens):
+    """
+    Format the kept regions, shrinking each of them by a quarter until the
+    result is within max_tokens. Dense input (e.g. minified JSON) has more
+    tokens per byte than the windows were sized for.
+    """
+    while True:
+        text = _format_reduced(total_bytes, head, matches, tail)
+        if count_tokens(text) <= max_tokens or len(head) + len(tail) < 256:
+            return text
+        head = head[:len(head) * 3 // 4]
+        head = head[:head.rfind(b"\n") + 1] or head
+        tail = tail[len(tail) // 4:]
+        tail = tail[tail.find(b"\n") + 1:] or tail
+        matches = matches[:len(matches) - len(matches) // 4]
+
+def _reduce_mapped(data, max_tokens, pattern):
+    """Reduce a memory-mapped regular file without copying all of it."""
+    head_bytes, tail_bytes, match_bytes = _budget_bytes(max_tokens, pattern is not None)
+    size = len(data)
+    head_end = data.rfind(b"\n", 0, head_bytes) + 1 or head_bytes
+    tail_start = data.find(b"\n", size - tail_bytes) + 1 or size - tail_bytes
+    # A small but dense file is over budget with head and tail overlapping.
+    tail_start = max(tail_start, head_end)
+    matches = []
+    if pattern is not None:
+        used = 0
+        for match in pattern.finditer(data, head_end, tail_start):
+            line_start = data.rfind(b"\n", head_end, match.start()) + 1 or head_end
+            line_end = data.find(b"\n", match.end(), tail_start)
+            line_end = tail_start if line_end == -1 else line_end + 1
+            line = data[line_start:line_end]
+            if used + len(line) > match_bytes:
+                break
+            if not matches or matches[-1] != line:
+                matches.append(line)
+                used += len(line)
+    return _fit(size, data[:head_end], matches, data[tail_start:], max_tokens)
+
+def _scan(pending, data, pattern, matches, used, limit):
+    """
+    Append the complete lines of pending + data matching pattern to matches
+    while they fit in limit bytes. Returns the trailing partial line and the
+    bytes used. A partial line longer than limit could never be kept, so it
+    is dropped and returned as None until its end has been read.
+    """
+    if pending is None:
+        cut = data.find(b"\n")
+        if cut == -1:
+            return None, used
+        pending, data = b"", data[cut + 1:]
+    lines = (pending + data).split(b"\n")
+    pending = lines.pop()
+    for line in lines:
+        if used + len(line) <= limit and pattern.search(line):
+            matches.append(line)
+            used += len(line) + 1
+    return (pending if len(pending) <= limit else None), used
+
+def _reduce_stream(fd, max_tokens, pattern):
+    """
+    Read a pipe in chunks, keeping only the head, a rolling tail and the
+    matched lines in between, so memory stays bounded by the budget.
+    """
+    head_bytes, tail_bytes, match_bytes = _budget_bytes(max_tokens, pattern is not None)
+    head = bytearray()
+    tail = deque()
+    tail_size = 0
+    matches = []
+    match_used = 0
+    total = 0
+    pending = b""
+    while True:
+        data = os.read(fd, READ_CHUNK)
+        if not data:
+            break
+        total += len(data)
+        if len(head) < head_bytes:
+            take = head_bytes - len(head)
+            head.extend(data[:take])
+            data = data[take:]
+            if not data:
+                continue
+        tail.append(data)
+        tail_size += len(data)
+        while tail_size - len(tail[0]) >= tail_bytes:
+            evicted = tail.popleft()
+            tail_size -= len(evicted)
+            if pattern is not None:
+                pending, match_used = _scan(pending, evicted, pattern, matches, match_used, match_bytes)
+    head = bytes(head)
+    tail = b"".join(tail)
+    if len(tail) > tail_bytes:
+        if pattern is not None:
+            _scan(pending, tail[:-tail_bytes] + b"\n", pattern, matches, match_used, match_bytes)
+        tail = tail[-tail_bytes:]
+    if total == len(head) + len(tail):
+        text = _decode(head + tail)
+        if count_tokens(text) <= max_tokens:
+            return text
+    # Cut the head and tail on line boundaries where there is one.
+    head = head[:head.rfind(b"\n") + 1] or head
+    tail = tail[tail.find(b"\n") + 1:] or tail
+    return _fit(total, head, matches, tail, max_tokens)
+
+def read_stdin(max_tokens=STDIN_MAX_TOKENS, match=None):
+    """
+    Read piped input for the prompt. Input within max_tokens is returned
+    as is. Larger input is reduced to its head, its tail and the lines
+    matching match (or STDIN_MATCH_PATTERN) in between. Regular files are
+    memory-mapped and pipes are read in chunks, so input of any size never
+    has to fit in memory.
+    """
+    pattern_text = match or STDIN_MATCH_PATTERN
+    pattern = re.compile(pattern_text.encode("utf-8")) if pattern_text else None
+    fd = sys.stdin.fileno()
+    info = os.fstat(fd)
+
+    if stat.S_ISREG(info.st_mode) and info.st_size > 0:
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as data:
+            if info.st_size <= max_tokens * BYTES_PER_TOKEN:
+                text = _decode(data[:])
+                if count_tokens(text) <= max_tokens:
+                    return text
+            return _reduce_mapped(data, max_tokens, pattern)
+    return _reduce_stream(fd, max_tokens, pattern)
@@ -0,0 +1,84 @@
+# stream_parser.py
+
+import json
+import re
+
+ANSWER_KEY_PATTERN = re.compile(r'"answer"\s*:\s*"')
+SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+class AnswerStreamParser:
+    """
+    Incrementally extract the "answer" string from a streamed RESPONSE_SCHEMA
+    JSON document. Each call to feed() returns the newly decoded answer text,
+    so it can be written to the terminal as soon as it arrives.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self.state = "seek"      # seek -> answer -> done
+        self.position = 0
+        self.pending_surrogate = ""
+
+    def feed(self, chunk):
+        """Add a chunk of raw JSON and return any newly decoded answer text."""
+        self.raw += chunk
+        if self.state == "seek":
+            match = ANSWER_KEY_PATTERN.search(self.raw)
+            if not match:
+                return ""
+            self.state = "answer"
+            self.position = match.end()
+        if self.state != "answer":
+            return ""
+
+        out = []
+        raw = self.raw
+        i = self.position
+        while i < len(raw):
+            char = raw[i]
+            if char == '"':
+                self.state = "done"
+                i += 1
+                break
+            if char != '\\':
+                out.append(char)
+                i += 1
+                continue
+            # Escape sequence: wait for the rest of it if it is split across chunks.
+            if i + 1 >= len(raw):
+                break
+            code = raw[i + 1]
+            if code == 'u':
+                if i + 6 > len(raw):
+                    break
+                decoded = self._decode_unicode(raw[i + 2:i + 6])
+                if decoded:
+                    out.append(decoded)
+                i += 6
+            else:
+                out.append(SIMPLE_ESCAPES.get(code, code))
+                i += 2
+        self.position = i
+        return "".join(out)
+
+    def _decode_unicode(self, hex_digits):
+        """Decode a \\uXXXX escape, pairing UTF-16 surrogates across calls."""
+        try:
+            code_point = int(hex_digits, 16)
+        except ValueError:
+            return ""
+        if 0xD800 <= code_point <= 0xDBFF:
+            self.pending_surrogate = chr(code_point)
+            return ""
+        if 0xDC00 <= code_point <= 0xDFFF and self.pending_surrogate:
+            pair = self.pending_surrogate + chr(code_point)
+            self.pending_surrogate = ""
+            return pair.encode("utf-16", "surrogatepass").decode("utf-16")
+        return chr(code_point)
+
+    def result(self):
+        """Parse the complete document, falling back to the raw text as the answer."""
+        try:
+            return json.loads(self.raw)
+        except json.JSONDecodeError:
+            return {"answer": self.raw, "topics": [], "reasoning_tokens": 0}
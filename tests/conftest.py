@@ -0,0 +1,70 @@
+# conftest.py
+
+import os
+import sys
+import shutil
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+def make_block(timestamp, prompt, answer, topics="None", model="gpt-test", effort="medium"):
+    """Render a context block the way memory_manager.add_to_context writes it."""
+    return f"[{timestamp}]\n>>> {prompt}\n[{model} - {effort}] {answer}\nTopic Tags: {topics}"
+
+def write_context(blocks):
+    """Write blocks to a context.txt that predates the index, as an existing user's log."""
+    from config import CONTEXT_FILE, DELIMITER
+    with open(CONTEXT_FILE, "w", encoding="utf-8") as f:
+        f.write("".join(block + DELIMITER for block in blocks))
+
+def _forget_open_state():
+    """Drop connections and caches that belong to the previous scratch directory."""
+    import context_store
+    import retention
+    import permanent_store
+    import memory_manager
+    import blob_store
+
+    connection = getattr(context_store._local, "connection", None)
+    if connection is not None:
+        connection.close()
+        context_store._local.connection = None
+    context_store._inflated.clear()
+    retention._digest_cache = {}
+    permanent_store._cache.clear()
+    memory_manager._permanent_context_cache.clear()
+    blob_store._cache.clear()
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run the test in a scratch directory, where all the data files are created."""
+    shutil.copy(os.path.join(REPO_DIR, "system_message.txt"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    _forget_open_state()
+    yield tmp_path
+    _forget_open_state()
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """
+    Start mock OpenAI servers with the given fault-injection settings (see
+    mock_server.MockSettings) and return (server, base URL). They are shut
+    down after the test.
+    """
+    pytest.importorskip("openai")
+    from mock_server import start_mock_server
+
+    servers = []
+
+    def start(**settings):
+        server, base_url = start_mock_server(**settings)
+        servers.append(server)
+        monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        return server, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,61 @@
+# test_batch.py
+
+import json
+import time
+import pytest
+import request_executor
+from batch import run_batch, read_batch_file
+
+PROMPTS = ["how do I untar an archive", "list docker containers", "resize a partition"]
+
+@pytest.fixture
+def batch_file(workdir):
+    path = workdir / "prompts.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for number, prompt in enumerate(PROMPTS):
+            f.write(json.dumps({"id": f"q{number}", "prompt": prompt, "model": "mock", "effort": "low"}) + "\n")
+        f.write("\n")
+    return str(path)
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        return {result["id"]: result for result in map(json.loads, f)}
+
+def test_records_get_ids_and_defaults(workdir):
+    path = workdir / "prompts.jsonl"
+    path.write_text('{"prompt": "a"}\n\n{"id": 7, "prompt": "b", "reasoning_effort": "high"}\n')
+    records = read_batch_file(str(path))
+    assert [(record["id"], record["reasoning_effort"]) for record in records] == [(1, "medium"), (7, "high")]
+    path.write_text('{"id": 1}\n')
+    with pytest.raises(ValueError):
+        read_batch_file(str(path))
+
+def test_rate_limited_records_are_retried_after_retry_after(batch_file, mock_api, monkeypatch):
+    monkeypatch.setattr(request_executor, "REQUEST_BACKOFF", 0.01)
+    server, _ = mock_api(fail_first=2, fail_status=429, retry_after=1)
+    started = time.monotonic()
+    output_path, count, failed = run_batch(batch_file, requests_per_minute=0, cache=False)
+    assert time.monotonic() - started >= 1.0
+    assert (count, failed) == (3, 0)
+    assert server.settings.requests == 5
+    results = read_results(output_path)
+    assert set(results) == {"q0", "q1", "q2"}
+    assert all("tar" in result["answer"] and result["reasoning_effort"] == "low" for result in results.values())
+
+def test_too_long_retry_after_fails_the_record(batch_file, mock_api, monkeypatch):
+    monkeypatch.setattr(request_executor, "REQUEST_MAX_RETRY_AFTER", 5.0)
+    server, _ = mock_api(fail_first=1, fail_status=429, retry_after=60)
+    started = time.monotonic()
+    output_path, count, failed = run_batch(batch_file, requests_per_minute=0, cache=False)
+    assert time.monotonic() - started < 5.0
+    assert (count, failed) == (3, 1)
+    assert server.settings.requests == 3
+    assert sum("error" in result for result in read_results(output_path).values()) == 1
+
+def test_cached_records_are_not_sent_again(batch_file, mock_api):
+    server, _ = mock_api()
+    run_batch(batch_file, requests_per_minute=0)
+    output_path, _, failed = run_batch(batch_file, requests_per_minute=0)
+    assert failed == 0
+    assert server.settings.requests == 3
+    assert all(result.get("cached") for result in read_results(output_path).values())
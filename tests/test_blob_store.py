@@ -0,0 +1,53 @@
+# test_blob_store.py
+
+import os
+import pytest
+import blob_store
+from tokenizer import count_tokens
+from blob_store import reference, expand, referenced_tokens, put, blob_path
+
+SHORT = "total 0"
+LONG = "".join(f"-rw-r--r-- 1 user user {n} Jan  1 10:00 file{n}.txt\n" for n in range(40))
+
+@pytest.fixture
+def blobs(workdir, monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_MIN_TOKENS", 50)
+    assert count_tokens(SHORT) < 50 <= count_tokens(LONG)
+
+def test_short_text_is_kept_inline(blobs):
+    assert reference(SHORT) == SHORT
+    assert not os.path.exists(blob_store.BLOB_DIR)
+
+def test_long_text_is_stored_once_and_referenced(blobs):
+    ref = reference(LONG)
+    match = blob_store.REF_PATTERN.fullmatch(ref)
+    assert match and int(match.group(2)) == count_tokens(LONG)
+    assert reference(LONG) == ref
+    assert put(LONG) == match.group(1)
+    assert os.listdir(blob_store.BLOB_DIR) == [match.group(1) + ".txt"]
+
+def test_expand_includes_each_blob_once_per_request(blobs):
+    ref = reference(LONG)
+    sent = set()
+    first = expand(f"why does this fail?\n\n{ref}", sent)
+    assert LONG in first and "[[blob:" not in first
+    assert len(sent) == 1
+    again = expand(f"and now?\n\n{ref}", sent)
+    assert LONG not in again and "same as shown above" in again
+    # A new request starts with an empty set.
+    assert LONG in expand(ref, set())
+    assert expand(SHORT, sent) == SHORT
+
+def test_missing_blob_is_reported(blobs):
+    ref = reference(LONG)
+    blob_store._cache.clear()
+    os.remove(blob_path(blob_store.REF_PATTERN.fullmatch(ref).group(1)))
+    assert "no longer available" in expand(ref, set())
+
+def test_referenced_tokens_counts_distinct_blobs(blobs):
+    ref = reference(LONG)
+    other = reference(LONG + "exit status 1\n")
+    tokens = count_tokens(LONG)
+    assert referenced_tokens(SHORT) == 0
+    assert referenced_tokens(f"{ref} and {ref}") == tokens
+    assert referenced_tokens(f"{ref} and {other}") == tokens + count_tokens(LONG + "exit status 1\n")
@@ -0,0 +1,21 @@
+# test_command_substitution.py
+
+from command_substitution import find_substitutions
+
+def commands(text):
+    return [command for _, _, command in find_substitutions(text)]
+
+def test_spans_cover_each_substitution():
+    text = "a $(date) b $(whoami)"
+    assert [text[start:end] for start, end, _ in find_substitutions(text)] == ["$(date)", "$(whoami)"]
+    assert commands(text) == ["date", "whoami"]
+
+def test_nested_substitution_stays_in_its_parent():
+    assert commands("x $(echo $(pwd) (sub)) y") == ["echo $(pwd) (sub)"]
+
+def test_quoted_and_escaped_parentheses_are_not_counted():
+    assert commands("$(echo ')') $(echo \")\\\"\") $(echo \\))") == ["echo ')'", 'echo ")\\""', "echo \\)"]
+
+def test_unterminated_substitution_is_ignored():
+    assert commands("$(ls) then $(echo 'open") == ["ls"]
+    assert commands("no substitutions here (really)") == []
@@ -0,0 +1,80 @@
+# test_context_store.py
+
+import sqlite3
+import pytest
+import memory_manager
+import context_store
+from conftest import make_block, write_context
+from config import CONTEXT_FILE, CONTEXT_INDEX_FILE
+from context_store import append_block, read_blocks, read_block_texts, score_blocks, get_connection
+
+BLOCKS = [
+    make_block("2026-01-01 10:00:00", "how do I untar an archive", "tar -xf archive.tar", "linux, tar"),
+    make_block("2026-01-02 10:00:00", "list docker containers", "docker ps -a", "docker"),
+    make_block("2026-01-03 10:00:00", "resize a partition", "use parted resizepart", "linux, disks"),
+]
+
+def texts():
+    return [text for _, text in read_blocks()]
+
+def test_legacy_log_is_migrated_in_order(workdir):
+    write_context(BLOCKS)
+    assert texts() == BLOCKS
+    assert [timestamp for timestamp, _ in read_blocks(since="2026-01-02 00:00:00")] == [
+        "2026-01-02 10:00:00", "2026-01-03 10:00:00"]
+    rows = get_connection().execute("SELECT offset, length FROM blocks ORDER BY id").fetchall()
+    with open(CONTEXT_FILE, "rb") as f:
+        data = f.read()
+    assert [data[offset:offset + length].decode() for offset, length in rows] == BLOCKS
+
+def test_appended_blocks_are_indexed_without_a_rescan(workdir):
+    write_context(BLOCKS[:2])
+    assert len(texts()) == 2
+    append_block(BLOCKS[2])
+    assert texts() == BLOCKS
+    # A block appended by another process is picked up on the next read.
+    with open(CONTEXT_FILE, "a", encoding="utf-8") as f:
+        f.write(BLOCKS[0].replace("2026-01-01", "2026-01-04") + context_store.DELIMITER)
+    assert len(texts()) == 4
+
+def test_truncated_or_replaced_log_is_reindexed(workdir):
+    write_context(BLOCKS)
+    assert len(texts()) == 3
+    write_context(BLOCKS[1:2])
+    assert texts() == BLOCKS[1:2]
+    assert set(score_blocks("untar archive")) == set()
+
+def test_outdated_schema_is_rebuilt(workdir):
+    write_context(BLOCKS)
+    assert len(texts()) == 3
+    conn = sqlite3.connect(CONTEXT_INDEX_FILE)
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+    context_store._local.connection.close()
+    context_store._local.connection = None
+    assert texts() == BLOCKS
+
+def test_bm25_scores_matching_blocks_and_weights_topic_tags(workdir):
+    write_context(BLOCKS + [make_block("2026-01-04 10:00:00", "what is tar", "an archiver", "archives")])
+    ids = {text: block_id for block_id, text in read_block_texts(range(1, 5)).items()}
+    scores = score_blocks("tar")
+    assert set(scores) == {ids[BLOCKS[0]], ids[texts()[3]]}
+    # The first block also has "tar" in its topic tags.
+    assert scores[ids[BLOCKS[0]]][0] > scores[ids[texts()[3]]][0]
+    assert score_blocks("how is the what") == {}
+
+def test_prune_context_skips_blocks_over_budget_and_keeps_order(workdir, monkeypatch):
+    huge = make_block("2026-01-02 12:00:00", "docker compose logs", "docker " * 3000, "docker")
+    write_context([BLOCKS[0], huge, BLOCKS[1], BLOCKS[2]])
+    monkeypatch.setattr(memory_manager, "MAX_CONTEXT_TOKENS", 500)
+    result = memory_manager.prune_context("docker containers")
+    assert len(result) == 5
+    context, count, topic_tags, oldest, tokens = result
+    # The most relevant block does not fit; the smaller ones still do.
+    assert "docker compose logs" not in context
+    assert count == 3
+    assert context.index("untar") < context.index("docker ps") < context.index("parted")
+    assert topic_tags == "containers, docker"
+    assert oldest == "2026-01-01 10:00:00"
+    assert 0 < tokens <= 500
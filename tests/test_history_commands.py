@@ -0,0 +1,82 @@
+# test_history_commands.py
+
+import io
+import datetime
+import pytest
+import context_store
+import cli_interface
+from conftest import make_block, write_context
+from context_store import list_segments, compress_segment, iter_blocks_reversed, segment_path
+from memory_manager import tail_context, repeat_response, grep_context
+from retention import rotate
+
+def timestamp(weeks_ago, hour=10):
+    moment = datetime.datetime.now() - datetime.timedelta(weeks=weeks_ago)
+    return moment.replace(hour=hour, minute=0, second=0).strftime("%Y-%m-%d %H:%M:%S")
+
+@pytest.fixture
+def history(workdir, monkeypatch):
+    """
+    Exchanges from three weeks ago (compressed segment), two weeks ago
+    (plain segment) and this week (context.txt), read back in small chunks.
+    """
+    monkeypatch.setattr(context_store, "REVERSE_READ_CHUNK", 64)
+    blocks = [
+        make_block(timestamp(3), "how do I untar an archive", "tar -xf archive.tar", "linux, tar"),
+        make_block(timestamp(3, 11), "list docker containers", "docker ps -a", "docker"),
+        make_block(timestamp(2), "untar into a directory", "tar -xf archive.tar -C dir", "linux, tar"),
+        make_block(timestamp(2, 11), "list docker containers again", "docker ps -a", "docker"),
+        make_block(timestamp(0), "show disk usage", "df -h", "linux, disks"),
+        make_block(timestamp(0), "show disk usage per directory", "du -sh *", "linux, disks"),
+    ]
+    write_context(blocks)
+    rotated, _ = rotate()
+    assert len(rotated) == 2
+    assert compress_segment(list_segments()[0])
+    assert segment_path(list_segments()[0]).endswith(".gz")
+    return blocks
+
+def test_blocks_are_read_newest_first_across_segments(history):
+    assert list(iter_blocks_reversed()) == history[::-1]
+
+def test_tail_limits_and_order(history):
+    assert tail_context(2) == history[-2:]
+    assert tail_context(3) == history[-3:]
+    assert tail_context(100) == history
+
+def test_repeat_counts_unique_answers(history):
+    assert repeat_response() == "du -sh *"
+    assert repeat_response("2") == "df -h"
+    # The two "docker ps -a" answers count once.
+    assert repeat_response("3") == "docker ps -a"
+    assert repeat_response("4") == "tar -xf archive.tar -C dir"
+    assert repeat_response("7") is None
+
+def test_repeat_and_grep_match_terms_and_topic_tags(history):
+    assert repeat_response("docker") == "docker ps -a"
+    assert repeat_response("tar") == "tar -xf archive.tar -C dir"
+    assert repeat_response("kubernetes") is None
+    assert grep_context("tar") == [history[0], history[2]]
+    assert grep_context("linux disks") == history[4:]
+    assert grep_context("docker untar") == []
+
+def test_tail_command_prints_the_last_blocks(history, monkeypatch, capsys):
+    monkeypatch.setattr("sys.argv", ["gpt", "tail", "-n", "1"])
+    monkeypatch.setattr("sys.stdin", io.StringIO())
+    cli_interface.main()
+    assert capsys.readouterr().out.strip() == history[-1]
+
+@pytest.mark.parametrize("argv, command", [
+    (["how", "do", "I", "use", "grep"], "query"),
+    (["how", "do", "I", "rotate", "logs"], "query"),
+    (["repeat", "the", "last", "command", "in", "bash"], "query"),
+    (["repeat", "2"], "repeat"),
+    (["tail", "-n", "3"], "tail"),
+    (["grep", "docker", "compose"], "grep"),
+    (["--high", "grep", "docker"], "grep"),
+    (["--match", "grep", "find", "errors"], "query"),
+])
+def test_only_the_first_word_names_a_subcommand(argv, command, monkeypatch):
+    monkeypatch.setattr("sys.argv", ["gpt"] + argv)
+    monkeypatch.setattr("sys.stdin", io.StringIO())
+    assert cli_interface.parse_args().command == command
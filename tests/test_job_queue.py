@@ -0,0 +1,45 @@
+# test_job_queue.py
+
+import sqlite3
+import pytest
+import job_queue
+from job_queue import submit_job, list_jobs, get_job, record_finished_jobs, _transaction
+
+@pytest.fixture
+def jobs(workdir, monkeypatch):
+    """Queue jobs without starting a worker process."""
+    monkeypatch.setattr(job_queue, "ensure_worker", lambda: None)
+
+def finish(job_id, answer):
+    with _transaction() as conn:
+        conn.execute("UPDATE jobs SET status = 'done', answer = ?, topics = '[]' WHERE id = ?", (answer, job_id))
+
+def test_jobs_are_listed_newest_first(jobs):
+    first = submit_job("first prompt")
+    second = submit_job("second prompt", reasoning_effort="high", model="gpt-test")
+    assert [row["id"] for row in list_jobs()] == [second, first]
+    job = get_job(second)
+    assert (job["status"], job["model"], job["reasoning_effort"]) == ("queued", "gpt-test", "high")
+    assert get_job(999) is None
+
+def test_finished_jobs_are_recorded_in_submission_order(jobs, monkeypatch):
+    import memory_manager
+    recorded = []
+    monkeypatch.setattr(memory_manager, "add_to_context",
+                        lambda prompt, answer, *args, **kwargs: recorded.append(prompt))
+    first = submit_job("first")
+    second = submit_job("second")
+    finish(second, "two")
+    record_finished_jobs()
+    # The second job waits for the first to finish.
+    assert recorded == []
+    finish(first, "one")
+    record_finished_jobs()
+    record_finished_jobs()
+    assert recorded == ["first", "second"]
+
+def test_transaction_closes_its_connection(jobs):
+    with _transaction() as conn:
+        conn.execute("SELECT 1")
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
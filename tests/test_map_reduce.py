@@ -0,0 +1,70 @@
+# test_map_reduce.py
+
+import re
+import threading
+import pytest
+import ai_client
+from tokenizer import count_tokens
+from context_store import read_blocks
+from map_reduce import iter_chunks, iter_path_lines, run_map_reduce
+
+LINES = [f"2026-01-01 10:00:{n % 60:02d} worker-{n % 7} handled request {n}\n" for n in range(300)]
+
+def test_chunks_keep_every_line_in_order_within_budget():
+    chunks = list(iter_chunks(LINES, 200))
+    assert len(chunks) > 1
+    assert "".join(chunks) == "".join(LINES)
+    assert all(count_tokens(chunk) <= 200 for chunk in chunks)
+    # Lines are not split when they fit.
+    assert all(chunk.endswith("\n") for chunk in chunks)
+
+def test_a_line_over_the_budget_is_split():
+    line = "x" * 5000 + "\n"
+    chunks = list(iter_chunks(["short\n", line, "after\n"], 100))
+    assert "".join(chunks) == "short\n" + line + "after\n"
+    assert len(chunks) > 2
+    assert all(count_tokens(chunk) <= 100 for chunk in chunks)
+
+def test_directories_are_read_in_order_without_hidden_or_binary_files(workdir):
+    root = workdir / "logs"
+    (root / "b").mkdir(parents=True)
+    (root / ".git").mkdir()
+    (root / "a.log").write_text("first\n")
+    (root / "b" / "c.log").write_text("second\n")
+    (root / ".hidden").write_text("hidden\n")
+    (root / ".git" / "HEAD").write_text("ref\n")
+    (root / "image.bin").write_bytes(b"\x89PNG\0\0")
+    assert list(iter_path_lines(str(root))) == ["==> a.log <==\n", "first\n", "==> b/c.log <==\n", "second\n"]
+
+@pytest.fixture
+def queries(workdir, monkeypatch):
+    """Answer each map prompt with its part number and record every prompt."""
+    prompts = []
+    lock = threading.Lock()
+
+    def single_query(prompt, **options):
+        with lock:
+            prompts.append(prompt)
+        part = re.match(r"You are reading part (\d+)", prompt)
+        answer = f"found in part {part.group(1)}" if part else "combined answer"
+        return {"answer": answer, "topics": ["logs"], "model": "gpt-test"}
+
+    monkeypatch.setattr(ai_client, "single_query", single_query)
+    return prompts
+
+def test_partial_answers_are_reduced_in_part_order(queries, capsys):
+    result = run_map_reduce("which workers failed", LINES, "app.log", chunk_tokens=500, max_workers=3)
+    parts = len(list(iter_chunks(LINES, 500)))
+    assert result["answer"] == "combined answer"
+    assert len(queries) == parts + 1
+    final = queries[-1]
+    # Each answer is labelled with its own part, whatever order they completed in.
+    assert all(f"--- Part {part} ---\nfound in part {part}" in final for part in range(1, parts + 1))
+    # Only the final exchange is recorded.
+    assert [text for _, text in read_blocks()][-1].count(f"[map-reduce over app.log: {parts} parts]") == 1
+    assert len(read_blocks()) == 1
+
+def test_small_input_is_sent_in_one_request(queries, capsys):
+    run_map_reduce("summarize", LINES[:3], "app.log", chunk_tokens=500)
+    assert len(queries) == 1
+    assert queries[0] == "summarize\n\n" + "".join(LINES[:3])
@@ -0,0 +1,82 @@
+# test_permanent_store.py
+
+import json
+import pytest
+import permanent_store
+from config import PERMANENT_MEMORY_FILE, PERMANENT_MEMORY_LOG
+
+def ids():
+    return [mem["id"] for mem in permanent_store.load()]
+
+def reload():
+    """Read the files again, as another process would."""
+    permanent_store._cache.clear()
+    return permanent_store.load()
+
+def log_lines():
+    with open(PERMANENT_MEMORY_LOG, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+def test_ids_stay_stable_across_add_and_forget(workdir):
+    first = permanent_store.add({"name": "Ada"})
+    second = permanent_store.add({"editor": "vim"})
+    assert (first["id"], second["id"]) == (1, 2)
+    assert permanent_store.forget(1)
+    assert not permanent_store.forget(1)
+    third = permanent_store.add({"shell": "zsh"})
+    assert third["id"] == 3
+    assert ids() == [2, 3]
+    assert [mem["id"] for mem in reload()] == [2, 3]
+
+def test_log_is_replayed_over_the_snapshot(workdir):
+    with open(PERMANENT_MEMORY_FILE, "w", encoding="utf-8") as f:
+        json.dump({"next_id": 3, "memories": [{"id": 1, "name": "Ada"}, {"id": 2, "editor": "vim"}]}, f)
+    with open(PERMANENT_MEMORY_LOG, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "forget", "id": 1}) + "\n")
+        f.write(json.dumps({"op": "add", "entry": {"id": 3, "shell": "zsh"}}) + "\n")
+    assert [mem["id"] for mem in reload()] == [2, 3]
+    assert permanent_store.add({"os": "linux"})["id"] == 4
+
+def test_legacy_list_snapshot_is_read(workdir):
+    with open(PERMANENT_MEMORY_FILE, "w", encoding="utf-8") as f:
+        json.dump([{"id": 1, "name": "Ada"}, {"id": 5, "editor": "vim"}], f)
+    assert ids() == [1, 5]
+    assert permanent_store.add({"shell": "zsh"})["id"] == 6
+
+def test_torn_last_line_is_dropped(workdir):
+    permanent_store.add({"name": "Ada"})
+    with open(PERMANENT_MEMORY_LOG, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "entry": {"id": 2, "na')
+    assert [mem["id"] for mem in reload()] == [1]
+    # The next operation starts on a fresh line, so both remain readable.
+    assert permanent_store.add({"editor": "vim"})["id"] == 2
+    assert [mem["id"] for mem in reload()] == [1, 2]
+    assert json.loads(log_lines()[-1])["entry"]["editor"] == "vim"
+
+def test_compaction_folds_the_log_and_keeps_numbering(workdir, monkeypatch):
+    monkeypatch.setattr(permanent_store, "PERMANENT_MEMORY_COMPACT_OPS", 3)
+    permanent_store.add({"name": "Ada"})
+    permanent_store.add({"editor": "vim"})
+    permanent_store.forget(2)
+    assert log_lines() == []
+    with open(PERMANENT_MEMORY_FILE, encoding="utf-8") as f:
+        snapshot = json.load(f)
+    assert snapshot["next_id"] == 3
+    assert [mem["id"] for mem in snapshot["memories"]] == [1]
+    # The forgotten id is not handed out again.
+    assert permanent_store.add({"shell": "zsh"})["id"] == 3
+    assert [mem["id"] for mem in reload()] == [1, 3]
+
+def test_unreadable_snapshot_is_kept_and_blocks_new_ids(workdir):
+    with open(PERMANENT_MEMORY_FILE, "w", encoding="utf-8") as f:
+        f.write('{"next_id": 3, "memories": [{"id": 1, "name": "Ada"}, {"id": 2,')
+    with open(PERMANENT_MEMORY_LOG, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "add", "entry": {"id": 3, "shell": "zsh"}}) + "\n")
+    assert [mem["id"] for mem in reload()] == [3]
+    with pytest.raises(ValueError):
+        permanent_store.add({"editor": "vim"})
+    with pytest.raises(ValueError):
+        permanent_store.replace_all([])
+    permanent_store.compact()
+    with open(PERMANENT_MEMORY_FILE, encoding="utf-8") as f:
+        assert f.read().endswith('{"id": 2,')
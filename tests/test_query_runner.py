@@ -0,0 +1,35 @@
+# test_query_runner.py
+
+import time
+import asyncio
+import threading
+import pytest
+from query_runner import DaemonPool, run_in_thread, _pool
+
+def test_run_in_thread_reuses_a_bounded_set_of_threads():
+    async def main():
+        first = await run_in_thread(threading.get_ident)
+        again = await run_in_thread(threading.get_ident)
+        many = await asyncio.gather(*[run_in_thread(lambda: (time.sleep(0.05), threading.get_ident())[1])
+                                      for _ in range(3 * _pool.max_workers)])
+        return first, again, many
+
+    first, again, many = asyncio.run(main())
+    assert first == again
+    assert len(set(many)) <= _pool.max_workers
+    assert _pool.workers <= _pool.max_workers
+
+def test_run_in_thread_raises_the_function_error():
+    async def main():
+        await run_in_thread(int, "not a number")
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+
+def test_pool_threads_are_daemons():
+    pool = DaemonPool(2)
+    started = threading.Event()
+    pool.submit(started.set)
+    assert started.wait(5)
+    daemons = [thread.daemon for thread in threading.enumerate() if thread.name != "MainThread"]
+    assert all(daemons)
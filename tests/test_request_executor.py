@@ -0,0 +1,88 @@
+# test_request_executor.py
+
+import os
+import sys
+import time
+import subprocess
+import pytest
+import request_executor
+from conftest import REPO_DIR
+from request_executor import execute, backoff_delay
+
+MESSAGES = [{"role": "user", "content": "How do I untar?"}]
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+class FakeError(Exception):
+    def __init__(self, headers):
+        self.response = FakeResponse(headers)
+
+@pytest.fixture
+def client(mock_api):
+    """Return a function starting a mock server and an OpenAI client for it."""
+    from openai import OpenAI
+
+    def start(**settings):
+        server, base_url = mock_api(**settings)
+        return server, OpenAI(api_key="test", base_url=base_url)
+
+    return start
+
+def test_backoff_waits_the_full_retry_after(monkeypatch):
+    monkeypatch.setattr(request_executor, "REQUEST_MAX_BACKOFF", 30.0)
+    assert backoff_delay(0, FakeError({"retry-after": "60"})) == 60.0
+    assert backoff_delay(0, FakeError({"retry-after-ms": "1500"})) >= 1.5
+    assert backoff_delay(10) == 30.0
+
+def test_backoff_gives_up_on_a_retry_after_over_the_limit(monkeypatch):
+    monkeypatch.setattr(request_executor, "REQUEST_MAX_RETRY_AFTER", 120.0)
+    assert backoff_delay(0, FakeError({"retry-after": "600"})) is None
+
+def test_retries_honor_retry_after(client, monkeypatch):
+    monkeypatch.setattr(request_executor, "REQUEST_BACKOFF", 0.01)
+    server, openai_client = client(fail_first=2, fail_status=429, retry_after=1)
+    started = time.monotonic()
+    response, model = execute(openai_client, {"model": "mock", "messages": MESSAGES})
+    assert time.monotonic() - started >= 2.0
+    assert server.settings.requests == 3
+    assert model == "mock"
+    assert "tar" in response.choices[0].message.content
+
+def test_too_long_retry_after_fails_without_retrying(client, monkeypatch):
+    import openai
+    monkeypatch.setattr(request_executor, "REQUEST_MAX_RETRY_AFTER", 5.0)
+    server, openai_client = client(fail_first=1, fail_status=429, retry_after=60)
+    with pytest.raises(openai.RateLimitError):
+        execute(openai_client, {"model": "mock", "messages": MESSAGES})
+    assert server.settings.requests == 1
+
+def test_stalled_primary_loses_to_hedge(client, monkeypatch):
+    monkeypatch.setattr(request_executor, "HEDGE_DEFAULT_DELAY", 0.2)
+    server, openai_client = client(stall_first=1, stall=30.0)
+    started = time.monotonic()
+    response, model = execute(openai_client, {"model": "mock", "messages": MESSAGES, "stream": True},
+                              hedge=True, hedge_model="mock-hedge")
+    assert time.monotonic() - started < 10.0
+    assert model == "mock-hedge"
+    content = "".join(chunk.choices[0].delta.content or "" for chunk in response if chunk.choices)
+    response.close()
+    assert "tar" in content
+    assert server.settings.requests == 2
+
+HEDGED_QUERY = """
+import request_executor
+from openai import OpenAI
+request_executor.HEDGE_DEFAULT_DELAY = 0.2
+response, model = request_executor.execute(
+    OpenAI(), {"model": "mock", "messages": [{"role": "user", "content": "hi"}], "stream": True}, hedge=True)
+print(model)
+"""
+
+def test_losing_hedge_does_not_delay_exit(mock_api, workdir):
+    mock_api(stall_first=1, stall=30.0)
+    started = time.monotonic()
+    subprocess.run([sys.executable, "-c", HEDGED_QUERY], cwd=workdir, check=True, timeout=25,
+                   env=dict(os.environ, PYTHONPATH=REPO_DIR), capture_output=True)
+    assert time.monotonic() - started < 10.0
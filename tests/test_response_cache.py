@@ -0,0 +1,65 @@
+# test_response_cache.py
+
+import json
+import types
+import pytest
+import response_cache
+from config import DELIMITER
+from response_cache import cache_key, lookup, store, stats
+
+DAY = 24 * 60 * 60
+
+@pytest.fixture
+def clock(workdir, monkeypatch):
+    """A settable clock for the cache's timestamps."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+def answer(text):
+    return {"answer": text, "topics": ["test"]}
+
+def test_hits_and_misses_are_counted(clock):
+    assert lookup("a") is None
+    store("a", answer("tar -xf"))
+    assert lookup("a") == answer("tar -xf")
+    assert stats() == (1, 1)
+
+def test_entries_expire_after_max_age(clock, monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_MAX_AGE", 2 * DAY)
+    store("old", answer("old"))
+    clock[0] += DAY
+    store("new", answer("new"))
+    clock[0] += DAY + 1
+    # Reading does not extend an entry's life.
+    assert lookup("old") is None
+    assert lookup("new") == answer("new")
+    # Expired entries are deleted on the next store.
+    store("newer", answer("newer"))
+    with response_cache._transaction() as conn:
+        keys = {key for key, in conn.execute("SELECT key FROM responses")}
+    assert keys == {"new", "newer"}
+
+def test_least_recently_used_entries_are_evicted_over_the_size_cap(clock, monkeypatch):
+    size = len(json.dumps(answer("x" * 100)))
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_MAX_BYTES", 3 * size)
+    for key in "abc":
+        store(key, answer(key * 100))
+        clock[0] += 1
+    assert lookup("a") is not None
+    clock[0] += 1
+    store("d", answer("d" * 100))
+    assert lookup("b") is None
+    assert [lookup(key) is not None for key in "acd"] == [True, True, True]
+
+def test_key_ignores_whitespace_and_earlier_answers_to_the_same_prompt():
+    schema = {"type": "object"}
+    system = {"role": "system", "content": "You are helpful."}
+    earlier = "[2026-01-01 10:00:00]\n>>> how do I   untar\n[gpt-5 - medium] tar -xf\nTopic Tags: tar"
+    other = "[2026-01-01 11:00:00]\n>>> list files\n[gpt-5 - medium] ls\nTopic Tags: files"
+    before = [system, {"role": "user", "content": other + DELIMITER + "how do I untar"}]
+    after = [system, {"role": "user", "content": other + DELIMITER + earlier + DELIMITER + "how do I untar  "}]
+    key = cache_key("gpt-5", "medium", before, "how do I untar", schema)
+    assert cache_key("gpt-5", "medium", after, "how do I untar", schema) == key
+    assert cache_key("gpt-5", "high", before, "how do I untar", schema) != key
+    assert cache_key("gpt-5-mini", "medium", before, "how do I untar", schema) != key
@@ -0,0 +1,87 @@
+# test_retention.py
+
+import io
+import types
+import datetime
+import pytest
+import retention
+import memory_manager
+from conftest import make_block, write_context
+from context_store import list_segments
+from retention import pending_digests, generate_digests, load_digests, digest_context
+
+WEEKS = 10
+
+@pytest.fixture
+def history(workdir, monkeypatch):
+    """
+    A context.txt holding one exchange per week for WEEKS weeks, as left by
+    a version without rotation. Detached digest workers are recorded instead
+    of started.
+    """
+    now = datetime.datetime.now()
+    write_context([make_block((now - datetime.timedelta(weeks=weeks)).strftime("%Y-%m-%d %H:%M:%S"),
+                              f"question {weeks} weeks ago", f"answer {weeks}")
+                   for weeks in range(WEEKS, 0, -1)])
+    workers = []
+    monkeypatch.setattr(retention, "subprocess",
+                        types.SimpleNamespace(Popen=lambda *args, **kwargs: workers.append(args),
+                                              DEVNULL=retention.subprocess.DEVNULL))
+    return workers
+
+@pytest.fixture
+def digest_api(mock_api):
+    import ai_client
+    server, _ = mock_api()
+    ai_client.client = None
+    yield server
+    ai_client.client = None
+
+def record_query():
+    memory_manager.add_to_context("question now", "answer now", ["now"], "medium")
+
+def test_first_rotation_only_digests_recent_periods(history, digest_api):
+    record_query()
+    segments = list_segments()
+    assert len(segments) >= WEEKS
+    recent = pending_digests(retention.DIGEST_AUTO_DAYS)
+    assert 0 < len(recent) <= 3
+    assert len(history) == 1
+
+    # What the detached worker does: recent periods only, no backfill.
+    written = generate_digests(wait=False, recent_days=retention.DIGEST_AUTO_DAYS)
+    assert [entry["segment"] for entry in written] == recent
+    assert digest_api.settings.requests == len(recent)
+    assert len(pending_digests()) == len(segments) - len(recent)
+
+def test_backfill_is_capped_per_run_and_newest_first(history, digest_api, monkeypatch):
+    monkeypatch.setattr(retention, "DIGEST_AUTOMATIC", False)
+    record_query()
+    assert history == []
+    pending = pending_digests()
+    written = generate_digests(limit=4)
+    assert [entry["segment"] for entry in written] == pending[:4]
+    assert digest_api.settings.requests == 4
+    assert pending_digests() == pending[4:]
+    assert set(load_digests()) == set(pending[:4])
+    text, tokens, count = digest_context()
+    assert count == 4 and tokens > 0
+    assert "tar" in text  # the mock server's answer
+
+def test_digests_of_old_periods_are_not_retried_automatically(history, monkeypatch):
+    record_query()
+    monkeypatch.setattr(retention, "pending_digests",
+                        lambda recent_days=None, now=None: [] if recent_days else ["context-old"])
+    history.clear()
+    retention.ensure_digest_worker()
+    assert history == []
+
+def test_rotate_command_reports_remaining_digests(history, digest_api, monkeypatch, capsys):
+    import cli_interface
+    monkeypatch.setattr(retention, "DIGEST_AUTOMATIC", False)
+    monkeypatch.setattr("sys.argv", ["gpt", "rotate", "--max-digests", "2"])
+    monkeypatch.setattr("sys.stdin", io.StringIO())
+    cli_interface.main()
+    out = capsys.readouterr().out
+    assert out.count("Wrote digest of") == 2
+    assert "older periods have no digest yet" in out
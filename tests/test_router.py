@@ -0,0 +1,85 @@
+# test_router.py
+
+import json
+import pytest
+import cli_interface
+import permanent_store
+from config import MODEL, METRICS_FILE
+from memory_manager import REQUIRED_PERMANENT_MEMORIES
+from router import classify, route
+from ai_client import completion_options
+
+class Terminal:
+    """A stdin with nothing piped in."""
+    def isatty(self):
+        return True
+
+def record_latency(model, effort, seconds, count=5, cache=None):
+    with open(METRICS_FILE, "a", encoding="utf-8") as f:
+        for _ in range(count):
+            f.write(json.dumps({"model": model, "reasoning_effort": effort, "cache": cache,
+                                "phases": {"total": seconds * 1000}}) + "\n")
+
+@pytest.mark.parametrize("prompt, category", [
+    ("tar flags to extract into a directory", "command"),
+    ("the git command to compare branches", "command"),
+    ("how do I list open ports", "command"),
+    ("what are the trade-offs of sqlite versus postgres for this app", "design"),
+    ("how would I migrate a monolith to services", "design"),
+    ("why is the sky blue", "general"),
+    ("explain " * 130, "design"),
+])
+def test_classify(prompt, category):
+    assert classify(prompt) == category
+
+@pytest.mark.parametrize("prompt, samples, expected", [
+    # No history: every class takes its own route.
+    ("tar flags to extract", [], ("command", "gpt-5-mini", "low", "auto: command")),
+    ("why is the sky blue", [], ("general", MODEL, "medium", "auto: general")),
+    ("compare two caching strategies", [], ("design", MODEL, "high", "auto: design")),
+    # A general route slower than its budget steps down to the command route.
+    ("why is the sky blue", [(MODEL, "medium", 60.0, 5, None)],
+     ("command", "gpt-5-mini", "low", "auto: general->command")),
+    # Too few samples, or only cache hits, are not counted.
+    ("why is the sky blue", [(MODEL, "medium", 60.0, 4, None)], ("general", MODEL, "medium", "auto: general")),
+    ("why is the sky blue", [(MODEL, "medium", 60.0, 5, "hit")], ("general", MODEL, "medium", "auto: general")),
+    # Design has no budget, however slow it has been.
+    ("compare two caching strategies", [(MODEL, "high", 600.0, 5, None)],
+     ("design", MODEL, "high", "auto: design")),
+])
+def test_route(workdir, prompt, samples, expected):
+    for sample in samples:
+        record_latency(*sample)
+    chosen = route(prompt)
+    assert (chosen["route"], chosen["model"], chosen["effort"], chosen["label"]) == expected
+
+@pytest.mark.parametrize("flags, model, effort", [
+    (["--auto"], MODEL, "high"),
+    (["--auto", "--low"], MODEL, "low"),
+    (["--auto", "--model", "gpt-4o"], "gpt-4o", "high"),
+    (["--low"], MODEL, "low"),
+    ([], MODEL, "medium"),
+])
+def test_explicit_choices_win_over_auto(workdir, flags, model, effort, monkeypatch):
+    queries = []
+    monkeypatch.setattr(cli_interface, "run_query",
+                        lambda prompt, **options: queries.append(options))
+    monkeypatch.setattr("sys.argv", ["gpt"] + flags + ["compare", "two", "caching", "strategies"])
+    monkeypatch.setattr("sys.stdin", Terminal())
+    for key in REQUIRED_PERMANENT_MEMORIES:
+        permanent_store.add({key: "test"})
+    cli_interface.main()
+    assert (queries[0]["model"], queries[0]["reasoning_effort"]) == (model, effort)
+    assert (queries[0]["route"] is not None) == ("--auto" in flags)
+
+@pytest.mark.parametrize("model, sent", [
+    ("gpt-5", True),
+    ("gpt-5-mini", True),
+    ("o3-mini", True),
+    ("gpt-4o", False),
+    ("gpt-4.1-mini", False),
+])
+def test_reasoning_effort_only_goes_to_reasoning_models(model, sent):
+    options = completion_options(model, [{"role": "user", "content": "hi"}], "high")
+    assert ("reasoning_effort" in options) == sent
+    assert "reasoning_effort" not in completion_options(model, [], None)
@@ -0,0 +1,86 @@
+# test_stdin_reader.py
+
+import os
+import re
+import threading
+import stdin_reader
+from stdin_reader import _reduce_mapped, _reduce_stream, _scan
+from tokenizer import count_tokens
+
+def reduce_pipe(data, max_tokens, pattern=None):
+    """Run _reduce_stream over data written to a pipe."""
+    read_fd, write_fd = os.pipe()
+
+    def write():
+        with os.fdopen(write_fd, "wb") as f:
+            f.write(data)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        return _reduce_stream(read_fd, max_tokens, pattern)
+    finally:
+        writer.join()
+        os.close(read_fd)
+
+def omitted_bytes(text):
+    return int(re.search(r"(-?\d+) bytes between head and tail omitted", text).group(1))
+
+def test_small_pipe_is_returned_as_is():
+    assert reduce_pipe(b"one\ntwo\n", 100) == "one\ntwo\n"
+
+def test_large_pipe_keeps_head_tail_and_matches():
+    lines = [f"line {number}" for number in range(20_000)]
+    lines[10_000] = "ERROR disk full"
+    text = reduce_pipe("\n".join(lines).encode() + b"\n", 500, re.compile(b"ERROR"))
+    assert text.startswith("[input reduced:")
+    assert "line 0\n" in text
+    assert "line 19999" in text
+    assert "ERROR disk full" in text
+    assert "line 10001" not in text
+    assert count_tokens(text) <= 500
+
+def test_scan_drops_a_line_longer_than_the_limit():
+    pattern = re.compile(b"x")
+    matches = []
+    pending, used = _scan(b"", b"x" * 100, pattern, matches, 0, 50)
+    assert pending is None
+    # The rest of the over-long line is dropped too; the next line is scanned.
+    pending, used = _scan(pending, b"xxx\nx1\nx2", pattern, matches, used, 50)
+    assert matches == [b"x1"]
+    assert pending == b"x2"
+
+def test_pipe_without_newlines_keeps_no_partial_line(monkeypatch):
+    scanned = []
+    real_scan = stdin_reader._scan
+
+    def scan(pending, data, *args):
+        scanned.append(len(pending or b""))
+        return real_scan(pending, data, *args)
+
+    monkeypatch.setattr(stdin_reader, "_scan", scan)
+    data = b"a" * (2 * 1024 * 1024)
+    text = reduce_pipe(data, 1000, re.compile(b"b"))
+    assert omitted_bytes(text) > 0
+    assert max(scanned) <= 1000 * stdin_reader.BYTES_PER_TOKEN
+    scanned.clear()
+    reduce_pipe(data, 1000)
+    assert scanned == []
+
+def test_small_dense_file_does_not_overlap_head_and_tail(monkeypatch):
+    # 1128 bytes without line breaks: less than head plus tail for 300
+    # tokens, but over budget.
+    data = bytes(range(33, 127)) * 12
+    assert count_tokens(data.decode()) > 300
+    kept = []
+    real_fit = stdin_reader._fit
+
+    def fit(total_bytes, head, matches, tail, max_tokens):
+        kept.append(len(head) + len(tail))
+        return real_fit(total_bytes, head, matches, tail, max_tokens)
+
+    monkeypatch.setattr(stdin_reader, "_fit", fit)
+    text = _reduce_mapped(data, 300, None)
+    assert kept == [len(data)]
+    assert omitted_bytes(text) > 0
+    assert count_tokens(text) <= 300
@@ -0,0 +1,33 @@
+# test_stream_parser.py
+
+import json
+from stream_parser import AnswerStreamParser
+
+DOCUMENT = {
+    "answer": 'Run `echo "hi"`\n\tthen C:\\temp, caf\u00e9 \U0001F600 /done',
+    "topics": ["shell"],
+    "reasoning_tokens": 0
+}
+
+def feed_in_pieces(raw, size):
+    parser = AnswerStreamParser()
+    text = "".join(parser.feed(raw[start:start + size]) for start in range(0, len(raw), size))
+    return parser, text
+
+def test_answer_is_decoded_however_the_stream_is_split():
+    raw = json.dumps(DOCUMENT)  # ensure_ascii: \u escapes and a surrogate pair
+    for size in (1, 2, 3, 5, 7, len(raw)):
+        parser, text = feed_in_pieces(raw, size)
+        assert text == DOCUMENT["answer"], size
+        assert parser.result() == DOCUMENT
+
+def test_answer_after_other_keys_and_nothing_after_it():
+    raw = '{"topics": ["a"], "answer" : "one\\ntwo", "reasoning_tokens": 3}'
+    parser, text = feed_in_pieces(raw, 4)
+    assert text == "one\ntwo"
+    assert parser.feed("ignored") == ""
+
+def test_result_falls_back_to_raw_text():
+    parser = AnswerStreamParser()
+    assert parser.feed("not json") == ""
+    assert parser.result() == {"answer": "not json", "topics": [], "reasoning_tokens": 0}
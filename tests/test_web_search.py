@@ -0,0 +1,49 @@
+# test_web_search.py
+
+import io
+import json
+import pytest
+import web_search
+from web_search import format_results, run_tool_calls
+
+@pytest.fixture
+def fake_backend(workdir, monkeypatch):
+    """Search with mock_server.fake_search and a fresh cache in the scratch directory."""
+    monkeypatch.setattr(web_search, "SEARCH_BACKEND", "mock_server.fake_search")
+    monkeypatch.setattr(web_search, "_backend", None)
+
+def tool_call(call_id, query):
+    return {"id": call_id, "function": {"name": "web_search", "arguments": json.dumps({"query": query})}}
+
+def test_tool_calls_run_in_order_and_are_cached(fake_backend, monkeypatch):
+    messages = run_tool_calls([tool_call("a", "untar files"), tool_call("b", "gzip levels")])
+    assert [message["tool_call_id"] for message in messages] == ["a", "b"]
+    assert "Result 1 for untar files" in messages[0]["content"]
+    assert "Result 1 for gzip levels" in messages[1]["content"]
+    # A normalized repeat of the query is answered from the cache.
+    monkeypatch.setattr(web_search, "_backend", lambda query, k: pytest.fail("not cached"))
+    assert run_tool_calls([tool_call("c", "Untar  files?")])[0]["content"] == messages[0]["content"]
+
+def test_failed_tool_call_is_reported_to_the_model(fake_backend):
+    message = run_tool_calls([{"id": "x", "function": {"name": "other", "arguments": "{}"}}])[0]
+    assert message["content"].startswith("Search failed:")
+
+def test_results_are_cut_to_the_token_budget():
+    results = [{"title": "t", "url": "u", "snippet": "word " * 200}] * 3
+    assert format_results("q", results, max_tokens=50).endswith(" ...")
+    assert format_results("q", []) == "No results for 'q'."
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_search_tool_loop_with_fake_backend(fake_backend, mock_api, stream):
+    import ai_client
+    server, _ = mock_api(tool_calls=2)
+    ai_client.client = None
+    try:
+        out = io.StringIO()
+        result = ai_client.single_query("How do I untar?", stream=stream, out=out, record=False,
+                                        include_context=False, search=True)
+    finally:
+        ai_client.client = None
+    assert "[web search: How do I untar? 0; How do I untar? 1]" in out.getvalue()
+    assert result["answer"].endswith("(Based on 2 search results.)")
+    assert server.settings.requests == 2
@@ -0,0 +1,64 @@
+# tokenizer.py
+
+import math
+import re
+from config import TOKENIZER, TOKENIZER_ENCODING
+
+# Pieces used by the approximation: letter runs, digit runs, punctuation runs
+# and whitespace runs that contain a line break or indentation.
+APPROX_PATTERN = re.compile(r"[^\W\d_]+|\d+|[^\w\s]+|_+|\n\s*|[ \t]{2,}")
+
+_encoding = None
+_backend = None
+
+def _load_bpe():
+    """
+    Return the tiktoken encoding, or None when tiktoken is not installed or
+    its vocabulary cannot be loaded (it is downloaded on first use).
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+def get_backend():
+    """Return "bpe" or "approx" according to TOKENIZER and what is installed."""
+    global _backend
+    if _backend is None:
+        if TOKENIZER in ("auto", "bpe") and _load_bpe():
+            _backend = "bpe"
+        else:
+            _backend = "approx"
+    return _backend
+
+def approximate_tokens(text):
+    """
+    Estimate BPE token count without a vocabulary. Calibrated against
+    o200k_base on prose, code, JSON and command output: common words are one
+    token, long words split about every 6 letters, digits group by 3, and
+    punctuation runs split about every 2 characters.
+    """
+    count = 0
+    for piece in APPROX_PATTERN.findall(text):
+        first = piece[0]
+        if first.isalpha():
+            count += math.ceil(len(piece) / 6)
+        elif first.isdigit():
+            count += math.ceil(len(piece) / 3)
+        elif first.isspace():
+            count += 1
+        else:
+            count += math.ceil(len(piece) / 2)
+    return count
+
+def count_tokens(text):
+    """Count the tokens in text with the configured backend."""
+    if not text:
+        return 0
+    if get_backend() == "bpe":
+        return len(_load_bpe().encode(text, disallowed_special=()))
+    return approximate_tokens(text)
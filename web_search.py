@@ -0,0 +1,136 @@
+# web_search.py
+
+import json
+import time
+import sqlite3
+import contextlib
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+        SEARCH_BACKEND,
+        SEARCH_RESULTS,
+        SEARCH_MAX_TOKENS,
+        SEARCH_MAX_WORKERS,
+        SEARCH_CACHE_FILE,
+        SEARCH_CACHE_TTL
+)
+from tokenizer import count_tokens
+
+# Function-calling definition offered to the model with --search.
+SEARCH_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "web_search",
+        "description": ("Search the web for current or specific information you do not know. "
+                        "Returns result titles, URLs and snippets."),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "The search query."}
+            },
+            "required": ["query"],
+            "additionalProperties": False
+        },
+        "strict": True
+    }
+}
+
+_backend = None
+
+def get_backend():
+    """Return the search function named by SEARCH_BACKEND ("module.function")."""
+    global _backend
+    if _backend is None:
+        module_name, _, function_name = SEARCH_BACKEND.rpartition(".")
+        _backend = getattr(importlib.import_module(module_name), function_name)
+    return _backend
+
+def normalize_query(query):
+    """Lowercase, collapse whitespace and drop trailing punctuation, for the cache key."""
+    return " ".join(query.lower().split()).rstrip("?!.")
+
+def _connect():
+    """Open SEARCH_CACHE_FILE, creating its table if needed."""
+    conn = sqlite3.connect(SEARCH_CACHE_FILE, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS searches (
+            key TEXT PRIMARY KEY,
+            created REAL NOT NULL,
+            results TEXT NOT NULL
+        )
+    """)
+    return conn
+
+@contextlib.contextmanager
+def _transaction():
+    """Open a connection (see _connect), commit or roll back on exit, and close it."""
+    with contextlib.closing(_connect()) as conn, conn:
+        yield conn
+
+def search(query):
+    """
+    Return the results for query, from the cache when they are younger than
+    SEARCH_CACHE_TTL, otherwise from the backend (and then cached).
+    """
+    key = json.dumps([SEARCH_BACKEND, SEARCH_RESULTS, normalize_query(query)])
+    now = time.time()
+    with _transaction() as conn:
+        row = conn.execute("SELECT results, created FROM searches WHERE key = ?", (key,)).fetchone()
+    if row is not None and now - row[1] < SEARCH_CACHE_TTL:
+        return json.loads(row[0])
+    results = get_backend()(query, SEARCH_RESULTS)
+    with _transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO searches (key, created, results) VALUES (?, ?, ?)",
+                     (key, now, json.dumps(results)))
+        conn.execute("DELETE FROM searches WHERE created < ?", (now - SEARCH_CACHE_TTL,))
+    return results
+
+def format_results(query, results, max_tokens=SEARCH_MAX_TOKENS):
+    """
+    Render results for the model, best first, stopping before max_tokens.
+    A first result that is too long on its own is cut short.
+    """
+    if not results:
+        return f"No results for '{query}'."
+    lines = []
+    tokens = 0
+    for number, result in enumerate(results, 1):
+        entry = f"[{number}] {result.get('title', '')} ({result.get('url', '')})\n{result.get('snippet', '')}"
+        entry_tokens = count_tokens(entry)
+        if tokens + entry_tokens > max_tokens:
+            if not lines:
+                lines.append(entry[:len(entry) * max_tokens // entry_tokens] + " ...")
+            break
+        lines.append(entry)
+        tokens += entry_tokens
+    return "\n\n".join(lines)
+
+def run_tool_call(tool_call):
+    """Run one tool call ({"id", "function": {"name", "arguments"}}) and return its tool message."""
+    function = tool_call["function"]
+    try:
+        if function["name"] != "web_search":
+            raise ValueError(f"Unknown tool {function['name']}.")
+        query = json.loads(function["arguments"] or "{}")["query"]
+        content = format_results(query, search(query))
+    except Exception as e:
+        # The model sees the failure and can answer without the search.
+        content = f"Search failed: {e}"
+    return {"role": "tool", "tool_call_id": tool_call["id"], "content": content}
+
+def run_tool_calls(tool_calls):
+    """Run the tool calls of one model turn concurrently, returning their messages in order."""
+    if not tool_calls:
+        return []
+    with ThreadPoolExecutor(max_workers=min(SEARCH_MAX_WORKERS, len(tool_calls))) as pool:
+        return list(pool.map(run_tool_call, tool_calls))
+
+def tool_call_queries(tool_calls):
+    """Return the search queries of tool calls, for progress output."""
+    queries = []
+    for tool_call in tool_calls:
+        try:
+            queries.append(json.loads(tool_call["function"]["arguments"] or "{}")["query"])
+        except (ValueError, KeyError, TypeError):
+            queries.append(tool_call["function"]["name"])
+    return queries